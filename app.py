@@ -1,50 +1,54 @@
 # app.py
 import streamlit as st
-import pandas as pd
 from utils import (
-    SALES_PATH, load_sales_fixed, styled_title, inject_background,
-    kpi_row, stacked_bar_with_cumulative, simple_line_growth,
+    SALES_PATH, GRAINS, INGEST_MODE, shared_frame, streamed, refresh_data, styled_title, inject_background, studio_selector, for_studio,
+    sales_window, kpi_row, stacked_bar_with_cumulative, simple_line_growth,
     weekly_packs_vs_clients, arpu_line, share_area, pie_split,
-    warn_if_missing_cols
+    warn_if_missing_cols, ChartBatch, chart_backend_selector, start_trace, perf_panel, prewarm
 )
 
 st.set_page_config(page_title="FlexLab Dashboard", layout="wide")
+start_trace("Ventes")  # temps par étape de ce rerun, cf. perf_panel() en fin de page
 
 # Branding (background + logo if present)
 inject_background()         # uses assets/bg.jpg if available
 styled_title(logo_path="assets/logo.png", title="FlexLab Dashboard",
              subtitle="Ventes, croissance et traction client — <b>Not an AI startup</b>")
 
+backend = chart_backend_selector()
+
 # Info + refresh
 colA, colB = st.columns([3,1])
 with colA:
     st.info(f"📄 Fichier ventes chargé automatiquement : <code>{SALES_PATH}</code>", icon="ℹ️")
 with colB:
     if st.button("🔁 Rafraîchir les données"):
-        st.cache_data.clear()
-
-@st.cache_data(show_spinner=False)
-def _load_sales():
-    return load_sales_fixed()
+        # seul ce dataset est revérifié ; les autres pages/sessions gardent leurs caches
+        st.toast("Nouvelle version chargée." if refresh_data("sales") else "Fichier ventes inchangé.")
 
 # Load data
 try:
-    df = _load_sales()
+    # mode stream : seul le cube agrégé est en mémoire (pas de lignes, donc pas de sélecteur de studio)
+    df = streamed("sales") if INGEST_MODE == "stream" else shared_frame("sales")
 except Exception as e:
     st.error(f"Erreur chargement ventes : {e}")
     st.stop()
+if INGEST_MODE != "stream":
+    df = for_studio(df, studio_selector(df))  # sous-ensemble mémorisé : agrégats et figures en cache par studio
 
 # Date filters
-c1, c2 = st.columns(2)
+c1, c2, c3 = st.columns([2, 2, 1])
 date_min = c1.date_input("Date de début", value=None)
 date_max = c2.date_input("Date de fin", value=None)
-if date_min:
-    df = df[df["Date"] >= pd.to_datetime(date_min)]
-if date_max:
-    df = df[df["Date"] <= pd.to_datetime(date_max)]
+grain = c3.selectbox("Granularité", ["auto", "D", "W", "M"],
+                     format_func=lambda g: "Auto" if g == "auto" else GRAINS[g][1].capitalize(),
+                     help="Auto : la plus fine qui reste lisible sur la période. Les séries trop longues sont agrégées plus grossièrement.")
+# agrégats jour/semaine × Groupe calculés une fois par version de données, puis découpés à la fenêtre
+cube = sales_window(df, date_min or None, date_max or None)
+unit_d, unit_w = GRAINS[cube.grain(grain, finest="D")][1], GRAINS[cube.grain(grain, finest="W")][1]
 
 # ---------- KPI CARDS ----------
-kpis = kpi_row(df)  # returns dict
+kpis = kpi_row(cube)  # returns dict
 c1, c2, c3, c4, c5, c6 = st.columns(6)
 c1.metric("CA total (€)", kpis["ca_total_fmt"])
 c2.metric("Séances totales", kpis["qty_total_fmt"])
@@ -54,31 +58,33 @@ c5.metric("Taux Découverte → Pack", kpis["conv_discovery_to_pack_fmt"], help=
 c6.metric("ARPU (€ / client)", kpis["arpu_fmt"])
 
 # ---------- CHARTS (Sales) ----------
-st.subheader("Ventes quotidiennes par service (stacked) + CA cumulatif")
-fig1 = stacked_bar_with_cumulative(df, title="Quantités quotidiennes + CA cumulatif (été grisé)")
-st.pyplot(fig1, use_container_width=True)
+# emplacements réservés dans l'ordre de la page, remplis par charts.run() au fil des rendus parallèles
+charts = ChartBatch(backend)
+st.subheader(f"Ventes par service et par {unit_d} (stacked) + CA cumulatif")
+charts.add(stacked_bar_with_cumulative, cube, title=f"Quantités par {unit_d} + CA cumulatif (été grisé)", grain=grain)
 
-st.subheader("CA hebdomadaire (variation semaine / semaine)")
-fig2 = simple_line_growth(df, title="CA hebdomadaire et croissance (%)")
-st.pyplot(fig2, use_container_width=True)
+st.subheader(f"CA par {unit_w} (variation d'une période à l'autre)")
+charts.add(simple_line_growth, cube, title=f"CA par {unit_w} et croissance (%)", grain=grain)
 
-st.subheader("Packs vendus vs Clients uniques (hebdomadaire)")
-fig3 = weekly_packs_vs_clients(df, title="Packs vs Clients uniques — et % conversion hebdo")
-st.pyplot(fig3, use_container_width=True)
+st.subheader(f"Packs vendus vs Clients uniques (par {unit_w})")
+charts.add(weekly_packs_vs_clients, cube, title=f"Packs vs Clients uniques — et % conversion par {unit_w}", grain=grain)
 
-st.subheader("ARPU (CA / client) — hebdomadaire & cumul")
-fig4 = arpu_line(df, title="ARPU hebdomadaire (et ligne de tendance)")
-st.pyplot(fig4, use_container_width=True)
+st.subheader(f"ARPU (CA / client) — par {unit_w}")
+charts.add(arpu_line, cube, title=f"ARPU par {unit_w} (et ligne de tendance)", grain=grain)
 
 colA, colB = st.columns([2,1])
 with colA:
     st.subheader("Part des revenus par type (aire empilée)")
-    fig5 = share_area(df, title="Répartition du CA dans le temps")
-    st.pyplot(fig5, use_container_width=True)
+    charts.add(share_area, cube, title="Répartition du CA dans le temps", grain=grain)
 with colB:
     st.subheader("Répartition cumulée du CA")
-    fig6 = pie_split(df.groupby("Groupe")["Montant total"].sum(), "CA total par type")
-    st.pyplot(fig6, use_container_width=True)
+    charts.add(pie_split, cube.groupe_totals("rev"), "CA total par type")
+
+charts.run()
 
 # Warn if missing columns for deeper metrics
-warn_if_missing_cols(df)
+if INGEST_MODE != "stream":
+    warn_if_missing_cols(df)
+
+prewarm()  # page servie : les caches des autres pages chauffent pendant la lecture
+perf_panel()
@@ -0,0 +1,141 @@
+# bench/generate.py
+"""Classeurs Mindbody synthétiques (ventes + présences) pour les benchmarks.
+
+    python bench/generate.py --rows 100k [--clients 5000] [--years 3] [--aliases fr|en] [--out bench/data]
+
+Ventes : une ligne par achat, mix de services couvrant les 4 Groupes de utils.SERVICE_RULES, clients
+récurrents (loi de Zipf), 1er achat d'un client le plus souvent une Découverte, saisonnalité semaine/été.
+Présences : une ligne par (jour, créneau), avec une feuille « Résumé » parasite comme les vrais exports.
+"""
+import argparse, os, sys
+
+import numpy as np
+import pandas as pd
+
+# Nom du service → (Groupe attendu, prix unitaire, poids dans le mix)
+SERVICES = {
+    "Brigad Découverte - 50'": ("Découverte", 20.0, 0.18),
+    "Pack 10 séances": ("Packs", 250.0, 0.12),
+    "Pack 5 séances": ("Packs", 135.0, 0.08),
+    "Recharge 5": ("Packs", 130.0, 0.05),
+    "Abonnement 4 x 50'": ("Abonnement 4×50’", 110.0, 0.17),
+    "Abonnement 4x50 - Duo": ("Abonnement 4×50’", 190.0, 0.03),
+    "Séance unitaire": ("Unitaire (autres)", 30.0, 0.27),
+    "Cours privé": ("Unitaire (autres)", 60.0, 0.10),
+}
+
+# en-têtes : noms Mindbody FR (ceux de data/*.xlsx) ou variantes EN reconnues par SALES_ALIASES / ATT_ALIASES
+HEADERS = {
+    "fr": {"Date": "Date d'achat", "Nom": "Nom", "Quantité": "Quantité", "Montant total": "Montant total",
+           "Client": "Client", "Date du service": "Date du service", "Heure": "Heure du service",
+           "Sessions": "Nombre total de sessions", "Uniques": "Clients uniques",
+           "sales_sheet": "Ventes par service", "att_sheet": "Analyse sur la présence"},
+    "en": {"Date": "Sale Date", "Nom": "Service Name", "Quantité": "Quantity", "Montant total": "Amount",
+           "Client": "Client Name", "Date du service": "Service Date", "Heure": "Start Time",
+           "Sessions": "Total Sessions", "Uniques": "Unique Clients",
+           "sales_sheet": "Sales by Service", "att_sheet": "Attendance Analysis"},
+}
+
+def parse_size(s):
+    s = str(s).lower().replace("_", "")
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1], 1)
+    return int(float(s.rstrip("km")) * mult)
+
+def _days(rng, n, start, years):
+    # plus d'achats en semaine, creux en août (studio fermé)
+    span = int(365.25 * years)
+    day = pd.Timestamp(start) + pd.to_timedelta(np.arange(span), unit="D")
+    w = np.where(day.weekday < 5, 1.0, 0.6) * np.where(day.month == 8, 0.25, 1.0)
+    return day[rng.choice(span, size=n, p=w / w.sum())]
+
+def make_sales(rows, clients=None, years=3, start="2022-01-01", seed=0, aliases="fr"):
+    rng = np.random.default_rng(seed)
+    clients = clients or max(50, rows // 20)
+    names = np.array(list(SERVICES))
+    price = np.array([v[1] for v in SERVICES.values()])
+    weight = np.array([v[2] for v in SERVICES.values()])
+    svc = rng.choice(len(names), size=rows, p=weight / weight.sum())
+    client = (rng.zipf(1.3, size=rows) - 1) % clients
+    day = _days(rng, rows, start, years)
+    # 1er achat d'un client : Découverte dans 70 % des cas
+    order = np.lexsort((day.values, client))
+    first = np.ones(rows, dtype=bool)
+    first[1:] = client[order][1:] != client[order][:-1]
+    first_rows = order[first]
+    svc[first_rows[rng.random(len(first_rows)) < 0.7]] = 0
+    qty = np.where(rng.random(rows) < 0.05, 2, 1)
+    amount = price[svc] * qty * rng.choice([1.0, 1.0, 1.0, 0.9, 0.8], size=rows)
+    h = HEADERS[aliases]
+    df = pd.DataFrame({
+        h["Nom"]: names[svc],
+        "Numéro d'identification du client": 100_000_000 + client,
+        h["Client"]: np.char.add("Client ", client.astype(str)),
+        "Catégorie": "Flex",
+        h["Date"]: day,
+        "Date d'expiration": day + pd.Timedelta(days=30),
+        h["Montant total"]: amount.round(2),
+        "Équivalent en espèces": amount.round(2),
+        "Valeur hors-espèces": 0.0,
+        h["Quantité"]: qty,
+    })
+    return df.sort_values(h["Date"], kind="stable").reset_index(drop=True)
+
+def make_attendance(rows, years=3, start="2022-01-01", seed=0, aliases="fr"):
+    rng = np.random.default_rng(seed + 1)
+    slots = pd.date_range("07:00", "21:00", freq="30min").time
+    day = _days(rng, rows, start, years)
+    slot = rng.integers(0, len(slots), size=rows)
+    peak = np.isin(slot, [1, 2, 3, 22, 23, 24])  # 7h30-8h30 et 18h-19h
+    sessions = rng.poisson(np.where(peak, 8, 3)) + 1
+    uniques = np.minimum(sessions, rng.poisson(np.where(peak, 6, 2)) + 1)
+    h = HEADERS[aliases]
+    return pd.DataFrame({h["Date du service"]: day, h["Heure"]: np.array(slots, dtype=object)[slot],
+                         "Séances réglées": uniques, h["Uniques"]: uniques, "Visites des invités": 0,
+                         "Nombre total de visites": sessions, h["Sessions"]: sessions})
+
+def write_workbook(path, sheets):
+    """Écrit {feuille: DataFrame} en streaming (xlsxwriter si installé, sinon openpyxl write-only)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    try:
+        import xlsxwriter  # noqa: F401
+        with pd.ExcelWriter(path, engine="xlsxwriter", engine_kwargs={"options": {"constant_memory": True}}) as w:
+            for name, df in sheets.items():
+                df.to_excel(w, sheet_name=name, index=False)
+        return path
+    except ImportError:
+        pass
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    for name, df in sheets.items():
+        ws = wb.create_sheet(name)
+        ws.append(list(df.columns))
+        for row in zip(*(df[c].tolist() for c in df.columns)):  # Timestamp hérite de datetime
+            ws.append(row)
+    wb.save(path)
+    return path
+
+def generate(rows, out="bench/data", clients=None, years=3, aliases="fr", seed=0):
+    """Écrit (ou réutilise) sales_<n>.xlsx et attendance_<n>.xlsx ; renvoie leurs chemins."""
+    tag = f"{rows}-{clients or 'auto'}c-{years:g}y-{aliases}-{seed}"
+    sales = os.path.join(out, f"sales_{tag}.xlsx")
+    att = os.path.join(out, f"attendance_{tag}.xlsx")
+    h = HEADERS[aliases]
+    if not os.path.exists(sales):
+        df = make_sales(rows, clients, years, seed=seed, aliases=aliases)
+        write_workbook(sales, {h["sales_sheet"]: df, "Résumé": df.head(100)})
+    if not os.path.exists(att):
+        df = make_attendance(max(1, rows // 10), years, seed=seed, aliases=aliases)
+        write_workbook(att, {h["att_sheet"]: df, "Résumé": df.head(100)})
+    return sales, att
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rows", default="10k", help="lignes de ventes (10k, 100k, 1m…) ; présences = rows / 10")
+    p.add_argument("--clients", type=int, default=None)
+    p.add_argument("--years", type=float, default=3)
+    p.add_argument("--aliases", choices=list(HEADERS), default="fr")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default="bench/data")
+    a = p.parse_args()
+    for path in generate(parse_size(a.rows), a.out, a.clients, a.years, a.aliases, a.seed):
+        print(path, file=sys.stdout)
@@ -0,0 +1,52 @@
+# bench/ingest.py
+"""Compare l'ingestion Excel historique (toutes les feuilles via pd.read_excel(sheet_name=None))
+à l'ingestion projetée de utils (_build_sales / _build_attendance).
+
+    python bench/ingest.py data/sales.xlsx [data/attendance.xlsx ...]
+
+Chaque variante tourne dans un sous-processus neuf : temps mur + pic RSS (ru_maxrss).
+"""
+import json, os, resource, subprocess, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def _legacy(path, kind):
+    # reproduit le parsing des loaders d'origine : toutes les feuilles, puis une seule gardée
+    import pandas as pd
+    import utils
+    keys = utils.SALES_SHEET_KEYS if kind == "sales" else utils.ATT_SHEET_KEYS
+    xls = pd.read_excel(path, sheet_name=None)
+    return xls[utils._pick_sheet(list(xls.keys()), keys)].copy()
+
+def _projected(path, kind):
+    import utils
+    return (utils._build_sales if kind == "sales" else utils._build_attendance)(path)
+
+def _child(variant, path, kind):
+    import pandas  # noqa: F401  (import hors chrono)
+    import utils   # noqa: F401
+    fn = _legacy if variant == "legacy" else _projected
+    t = time.perf_counter()
+    df = fn(path, kind)
+    dt = time.perf_counter() - t
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"variant": variant, "seconds": round(dt, 3), "peak_rss_mb": round(rss_mb, 1),
+                      "rows": len(df), "cols": df.shape[1]}))
+
+def run(path, kind=None):
+    kind = kind or ("attendance" if "att" in os.path.basename(path).lower() else "sales")
+    out = {"file": path, "kind": kind, "size_mb": round(os.path.getsize(path) / 2**20, 2)}
+    for variant in ("legacy", "projected"):
+        res = subprocess.run([sys.executable, __file__, "--child", variant, path, kind],
+                             capture_output=True, text=True, check=True)
+        out[variant] = json.loads(res.stdout.strip().splitlines()[-1])
+    out["speedup"] = round(out["legacy"]["seconds"] / max(out["projected"]["seconds"], 1e-9), 2)
+    return out
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        _child(*sys.argv[2:5])
+    else:
+        for p in sys.argv[1:] or ["data/sales.xlsx", "data/attendance.xlsx"]:
+            print(json.dumps(run(p), ensure_ascii=False))
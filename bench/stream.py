@@ -0,0 +1,77 @@
+# bench/stream.py
+"""Pic mémoire et temps : loaders actuels (DataFrame complet puis agrégats) vs ingestion en streaming.
+
+    python bench/stream.py data/sales.xlsx [data/attendance.xlsx ...]
+    python bench/stream.py --sizes 100k,1m [--chunk 50000]    # classeurs générés par bench/generate.py
+
+Chaque variante tourne dans un sous-processus neuf : temps mur + pic RSS (ru_maxrss), RSS de base
+(après imports) et lignes lues. Le pic du mode streaming doit rester ~constant quand le nombre de lignes croît.
+"""
+import argparse, json, os, resource, subprocess, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def _frame(path, kind, chunk):
+    # chemin des pages en mode "frame" : lignes normalisées, puis cube / index des créneaux
+    import utils
+    if path.lower().endswith(".csv"):  # les loaders ne lisent que l'Excel : CSV lu d'un seul morceau
+        df = next((utils._sales_chunks if kind == "sales" else utils._att_chunks)([path], 1 << 40))
+    else:
+        df = (utils._build_sales if kind == "sales" else utils._build_attendance)(path)
+    return len(df), (utils.SalesCube if kind == "sales" else utils.SlotIndex).from_frame(df)
+
+def _stream(path, kind, chunk):
+    import utils
+    rows = [0]
+    def counted(chunks):
+        for c in chunks:
+            rows[0] += len(c)
+            yield c
+    if kind == "sales":
+        out = utils.SalesCube.from_chunks(counted(utils._sales_chunks([path], chunk)))
+    else:
+        out = utils.SlotIndex.from_chunks(counted(utils._att_chunks([path], chunk)))
+    return rows[0], out
+
+def _child(variant, path, kind, chunk):
+    import pandas  # noqa: F401  (import hors chrono)
+    import utils   # noqa: F401
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    fn = _frame if variant == "frame" else _stream
+    t = time.perf_counter()
+    rows, _ = fn(path, kind, int(chunk))
+    dt = time.perf_counter() - t
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"variant": variant, "seconds": round(dt, 3), "peak_rss_mb": round(rss_mb, 1),
+                      "base_rss_mb": round(base, 1), "rows": rows}))
+
+def run(path, kind=None, chunk=50_000):
+    kind = kind or ("attendance" if "att" in os.path.basename(path).lower() else "sales")
+    out = {"file": path, "kind": kind, "size_mb": round(os.path.getsize(path) / 2**20, 2)}
+    for variant in ("frame", "stream"):
+        res = subprocess.run([sys.executable, __file__, "--child", variant, path, kind, str(chunk)],
+                             capture_output=True, text=True, check=True)
+        out[variant] = json.loads(res.stdout.strip().splitlines()[-1])
+    f, s = out["frame"], out["stream"]
+    out["rss_saved_mb"] = round(f["peak_rss_mb"] - s["peak_rss_mb"], 1)
+    return out
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        _child(*sys.argv[2:6])
+        sys.exit()
+    p = argparse.ArgumentParser(description="Benchmark mémoire de l'ingestion en streaming.")
+    p.add_argument("files", nargs="*")
+    p.add_argument("--sizes", default=None, help="tailles générées, ex. 100k,1m (bench/generate.py)")
+    p.add_argument("--chunk", type=int, default=50_000, help="lignes par morceau")
+    p.add_argument("--data", default=os.path.join(ROOT, "bench", "data"))
+    a = p.parse_args()
+    files = list(a.files)
+    if a.sizes:
+        from generate import generate, parse_size
+        for size in a.sizes.split(","):
+            files += generate(parse_size(size.strip()), a.data)
+    for path in files or ["data/sales.xlsx", "data/attendance.xlsx"]:
+        print(json.dumps(run(path, chunk=a.chunk), ensure_ascii=False))
@@ -0,0 +1,142 @@
+# bench/suite.py
+"""Benchmarks du pipeline sur classeurs synthétiques (bench/generate.py), résultats en JSON.
+
+    python bench/suite.py [--sizes 10k,100k,1m] [--repeat 3] [--out bench/results]
+    python bench/suite.py --compare bench/results/avant.json bench/results/apres.json
+
+Chaque taille tourne dans un sous-processus neuf (caches vides, mémoire isolée). Mesuré : loaders
+(parsing à froid, cache Arrow, store incrémental), construction du cube, kpi_row, chaque graphe
+jusqu'au PNG, funnel_conversion / churn_block. Chaque mesure repart de mémos vides ; on garde la
+médiane de --repeat passes.
+"""
+import argparse, json, os, platform, resource, shutil, statistics, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SALES_CHARTS = ["stacked_bar_with_cumulative", "simple_line_growth", "weekly_packs_vs_clients", "arpu_line", "share_area"]
+ATT_CHARTS = ["heatmap_attendance", "top_slots", "weekly_unique_clients", "weekly_unique_clients_bar"]
+
+def _reset(utils):
+    # chaque passe mesure un calcul complet : ni mémo d'agrégats, ni ledger MRR, ni cache de figures
+    utils._MEMO.clear(); utils._LEDGER.clear(); utils._FIGS.clear()
+
+def _cases(utils):
+    """(nom, préparation, mesure) ; préparation() hors chrono, son résultat est passé à mesure()."""
+    def fresh_sales():
+        _reset(utils)
+        return utils.load_sales_fixed()
+    def fresh_cube():
+        return utils.sales_cube(fresh_sales())
+    def fresh_att():
+        _reset(utils)
+        return utils.load_attendance_fixed()
+    def cold_cache():
+        shutil.rmtree(utils.CACHE_DIR, ignore_errors=True)
+        shutil.rmtree(utils.STORE_DIR, ignore_errors=True)
+        _reset(utils)
+    png = utils._fig_to_png
+    cases = [
+        ("load_attendance_fixed:cold", cold_cache, lambda _: utils.load_attendance_fixed()),
+        ("load_sales_fixed:cold", cold_cache, lambda _: utils.load_sales_fixed()),
+        ("load_sales_fixed:arrow_cache", lambda: _reset(utils), lambda _: utils.load_sales_fixed()),
+        ("load_sales_store:cold", cold_cache, lambda _: utils.load_sales_store()),
+        ("load_sales_store:unchanged", lambda: _reset(utils), lambda _: utils.load_sales_store()),
+        ("sales_cube", fresh_sales, utils.sales_cube),
+        ("kpi_row", fresh_cube, utils.kpi_row),
+    ]
+    cases += [(f"chart:{n}", fresh_cube, lambda c, n=n: png(getattr(utils, n)(c, n))) for n in SALES_CHARTS]
+    cases += [
+        ("chart:pie_split", fresh_cube, lambda c: png(utils.pie_split(c.groupe_totals("rev"), "pie"))),
+        ("funnel_conversion", fresh_sales, lambda d: png(utils.funnel_conversion(d)[0])),
+        ("churn_block", fresh_sales, utils.churn_block),
+        ("cohort_heatmap", fresh_sales, lambda d: png(utils.cohort_heatmap(d))),
+        ("mrr_bridge_chart", fresh_sales, lambda d: png(utils.mrr_bridge_chart(d))),
+    ]
+    cases += [(f"chart:{n}", fresh_att, lambda a, n=n: png(getattr(utils, n)(a))) for n in ATT_CHARTS]
+    return cases
+
+def _child(sales, att, repeat):
+    import utils
+    tmp = tempfile.mkdtemp(prefix="flexlab-bench-")
+    utils.SALES_PATH, utils.ATT_PATH = sales, att
+    utils.CACHE_DIR = os.path.join(tmp, "cache"); utils.STORE_DIR = os.path.join(tmp, "store")
+    utils.FIG_CACHE_DIR = None
+    out = []
+    try:
+        for name, setup, run in _cases(utils):
+            times = []
+            for _ in range(repeat):
+                arg = setup()
+                t = time.perf_counter()
+                run(arg)
+                times.append(time.perf_counter() - t)
+            out.append({"bench": name, "median_s": round(statistics.median(times), 4),
+                        "min_s": round(min(times), 4), "repeat": repeat})
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"results": out, "peak_rss_mb": round(rss, 1)}))
+
+def _revision():
+    try:
+        return subprocess.run(["git", "-C", ROOT, "describe", "--always", "--dirty"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes, repeat, data_dir):
+    import numpy, pandas, matplotlib
+    from generate import generate, parse_size
+    report = {"revision": _revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(), "pandas": pandas.__version__, "numpy": numpy.__version__,
+              "matplotlib": matplotlib.__version__, "machine": platform.machine(), "cpus": os.cpu_count(),
+              "sizes": []}
+    for size in sizes:
+        rows = parse_size(size)
+        t = time.perf_counter()
+        sales, att = generate(rows, data_dir)
+        gen_s = time.perf_counter() - t
+        res = subprocess.run([sys.executable, __file__, "--child", sales, att, str(repeat)],
+                             capture_output=True, text=True, check=True)
+        child = json.loads(res.stdout.strip().splitlines()[-1])
+        report["sizes"].append(dict(size=size, rows=rows, sales_mb=round(os.path.getsize(sales) / 2**20, 2),
+                                    generate_s=round(gen_s, 2), **child))
+        for r in child["results"]:
+            print(f"{size:>6}  {r['bench']:<44} {r['median_s']:9.4f} s", file=sys.stderr)
+    return report
+
+def compare(old_path, new_path, threshold=1.2):
+    """Ratio nouveau / ancien par (taille, bench) ; ⚠ au-delà de `threshold`."""
+    def index(path):
+        with open(path, encoding="utf-8") as f:
+            rep = json.load(f)
+        return rep, {(s["size"], r["bench"]): r["median_s"] for s in rep["sizes"] for r in s["results"]}
+    (old, a), (new, b) = index(old_path), index(new_path)
+    print(f"{old.get('revision')} → {new.get('revision')}")
+    for key in sorted(a.keys() & b.keys()):
+        ratio = b[key] / a[key] if a[key] else float("inf")
+        flag = "⚠" if ratio > threshold else ""
+        print(f"{key[0]:>6}  {key[1]:<44} {a[key]:9.4f} → {b[key]:9.4f} s  ×{ratio:5.2f} {flag}")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        _child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        sys.exit()
+    p = argparse.ArgumentParser(description="Benchmarks FlexLab (JSON).")
+    p.add_argument("--sizes", default="10k,100k", help="tailles de ventes, ex. 10k,100k,1m")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--data", default=os.path.join(ROOT, "bench", "data"), help="classeurs générés (réutilisés)")
+    p.add_argument("--out", default=os.path.join(ROOT, "bench", "results"))
+    p.add_argument("--compare", nargs=2, metavar=("AVANT", "APRES"))
+    a = p.parse_args()
+    if a.compare:
+        compare(*a.compare)
+        sys.exit()
+    report = run([s.strip() for s in a.sizes.split(",") if s.strip()], a.repeat, a.data)
+    os.makedirs(a.out, exist_ok=True)
+    path = os.path.join(a.out, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['revision'] or 'local'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(path)
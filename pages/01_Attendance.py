@@ -1,11 +1,14 @@
 # pages/01_Attendance.py
 import streamlit as st
 from utils import (
-    ATT_PATH, load_attendance_fixed, styled_title, inject_background,
-    heatmap_attendance, top_slots, weekly_unique_clients, occupancy_gauge
+    ATT_PATH, INGEST_MODE, shared_frame, streamed, refresh_data, styled_title, inject_background, studio_selector, for_studio,
+    attendance_window, JOURS_FR, heatmap_attendance, top_slots, weekly_unique_clients, occupancy_gauge,
+    weekly_unique_clients_bar, ChartBatch, chart_backend_selector,
+    start_trace, perf_panel, prewarm
 )
 
 st.set_page_config(page_title="FlexLab — Attendance", layout="wide")
+start_trace("Présences")  # temps par étape de ce rerun, cf. perf_panel() en fin de page
 inject_background()
 styled_title(logo_path="assets/logo.png", title="Présences & Créneaux",
              subtitle="Optimisez vos slots et votre staffing")
@@ -15,17 +18,16 @@ with colA:
     st.info(f"📄 Fichier présence chargé automatiquement : <code>{ATT_PATH}</code>", icon="ℹ️")
 with colB:
     if st.button("🔁 Rafraîchir les données"):
-        st.cache_data.clear()
-
-@st.cache_data(show_spinner=False)
-def _load_att():
-    return load_attendance_fixed()
+        # seul ce dataset est revérifié ; les autres pages/sessions gardent leurs caches
+        st.toast("Nouvelle version chargée." if refresh_data("attendance") else "Fichier présences inchangé.")
 
 try:
-    att = _load_att()
+    att = streamed("attendance") if INGEST_MODE == "stream" else shared_frame("attendance")
 except Exception as e:
     st.error(f"Erreur chargement présence : {e}")
     st.stop()
+if INGEST_MODE != "stream":
+    att = for_studio(att, studio_selector(att))
 
 # Sidebar controls for capacity (optional)
 with st.sidebar:
@@ -33,25 +35,37 @@ with st.sidebar:
     capacity = st.number_input("Capacité théorique/jour (sessions max)", min_value=0, value=0,
                                help="Si >0, un indicateur d'occupation sera affiché.")
 
+backend = chart_backend_selector()
+
+# Filtres : simples masques sur l'index des créneaux (calculé une fois par version des présences)
+c1, c2, c3 = st.columns([1, 1, 2])
+date_min = c1.date_input("Date de début", value=None)
+date_max = c2.date_input("Date de fin", value=None)
+jours = c3.multiselect("Jours", JOURS_FR, default=JOURS_FR)
+idx = attendance_window(att, date_min or None, date_max or None, [JOURS_FR.index(j) for j in jours])
+if (date_min or date_max or len(jours) < len(JOURS_FR)) and not idx.dated:
+    st.caption("Fichier sans dates de service : les filtres ne s'appliquent pas.")
+
+charts = ChartBatch(backend)  # emplacements réservés ici, remplis par charts.run() au fil des rendus parallèles
 st.subheader("Heatmap — Jour × Heure (nombre de sessions)")
-fig_hm = heatmap_attendance(att, metric="Nombre total de sessions")
-st.pyplot(fig_hm, use_container_width=True)
+charts.add(heatmap_attendance, idx, metric="Nombre total de sessions")
 
 col1, col2 = st.columns(2)
 with col1:
     st.subheader("Top 5 créneaux — Sessions")
-    fig_top = top_slots(att, metric="Nombre total de sessions", topn=5)
-    st.pyplot(fig_top, use_container_width=True)
+    charts.add(top_slots, idx, metric="Nombre total de sessions", topn=5)
 
 with col2:
     st.subheader("Clients uniques / semaine (bar)")
-    from utils import weekly_unique_clients_bar
-    fig_wc = weekly_unique_clients_bar(att, title="Clients uniques par semaine (bar)")
-    st.pyplot(fig_wc, use_container_width=True)
+    charts.add(weekly_unique_clients_bar, idx, title="Clients uniques par semaine (bar)")
 
 
 # Optional occupancy indicator
 if capacity and capacity > 0:
     st.subheader("Taux d’occupation (approx.)")
-    fig_occ = occupancy_gauge(att, capacity=capacity)
-    st.pyplot(fig_occ, use_container_width=False)
+    charts.add(occupancy_gauge, idx, capacity=capacity, full_width=False)
+
+charts.run()
+
+prewarm()  # page servie : les caches des autres pages chauffent pendant la lecture
+perf_panel()
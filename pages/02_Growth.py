@@ -1,34 +1,98 @@
 # pages/02_Growth.py
 import streamlit as st
 from utils import (
-    SALES_PATH, load_sales_fixed, styled_title, inject_background,
-    funnel_conversion, churn_block, cohort_note
+    SALES_PATH, INGEST_MODE, shared_frame, streamed, styled_title, inject_background, studio_selector, for_studio, sales_cube,
+    funnel_conversion, churn_block, cohort_heatmap, mrr_bridge, mrr_bridge_chart, subscription_periods, show_chart,
+    client_facts, pack_utilisation, inactive_clients, INACTIVE_DAYS,
+    start_trace, perf_panel, prewarm
 )
 
 st.set_page_config(page_title="FlexLab — Growth & Retention", layout="wide")
+start_trace("Growth")  # temps par étape de ce rerun, cf. perf_panel() en fin de page
 inject_background()
 styled_title(logo_path="assets/logo.png", title="Growth & Retention",
              subtitle="Conversion, churn, rétention")
 
 st.info(f"📄 Fichier ventes : <code>{SALES_PATH}</code>", icon="ℹ️")
 
-@st.cache_data(show_spinner=False)
-def _load_sales():
-    return load_sales_fixed()
-
+stream = INGEST_MODE == "stream"
 try:
-    df = _load_sales()
+    df = streamed("sales") if stream else shared_frame("sales")
 except Exception as e:
     st.error(f"Erreur chargement ventes : {e}")
     st.stop()
+if not stream:
+    studio = studio_selector(df)
+    df = for_studio(df, studio)
 
 st.subheader("Funnel — Découverte → Pack → Abonnement")
-fig_f, notes = funnel_conversion(df)
-st.pyplot(fig_f, use_container_width=False)
+ordered = st.toggle("Ordre chronologique", value=False,
+                    help="Ne compte un Pack/Abonnement que s'il est acheté le jour de la 1re Découverte ou après.")
+notes = show_chart(funnel_conversion, df, ordered=ordered, full_width=False)
 st.caption(notes)
 
 st.subheader("Churn & rétention (approx.)")
-st.markdown(churn_block(df), unsafe_allow_html=True)
+st.markdown(churn_block(df, ordered=ordered), unsafe_allow_html=True)
+
+journey = sales_cube(df).journey
+if journey is not None:
+    st.subheader("Parcours — passage d'un type d'achat au suivant")
+    st.dataframe(journey.transitions().reset_index(), hide_index=True, use_container_width=False)
+
+if stream:
+    st.info("Mode streaming (FLEXLAB_INGEST=stream) : seuls les agrégats sont en mémoire. "
+            "Cohortes, fiches clients et MRR demandent les lignes de ventes.", icon="ℹ️")
+    prewarm()
+    perf_panel()
+    st.stop()
+
+st.subheader("Cohortes — rétention à +7 / +30 / +60 jours")
+sources = {"Ventes": df}
+try:
+    att = shared_frame("attendance")
+    if {"Client", "Date"} <= set(att.columns):
+        sources["Présences"] = for_studio(att, studio)
+except Exception:
+    pass  # fichier présence absent ou illisible : cohortes sur les ventes seulement
+c1, c2, c3 = st.columns(3)
+source = c1.radio("Source", list(sources), horizontal=True)
+grain = c2.radio("Acquisition", ["W", "M"], format_func={"W": "Semaine", "M": "Mois"}.get, horizontal=True)
+metric = c3.radio("Mesure", ["ret", "rev"], format_func={"ret": "Rétention", "rev": "CA / client"}.get,
+                  horizontal=True, disabled=source != "Ventes")
+show_chart(cohort_heatmap, sources[source], grain=grain, metric=metric if source == "Ventes" else "ret", full_width=False)
+st.caption("Cohorte = période du 1er achat (ou 1re visite) daté. Rétention : part des clients revenus entre J+1 et J+h ; "
+           "CA / client : montant cumulé de J0 à J+h. Cases vides : horizon pas encore écoulé pour toute la cohorte.")
+
+st.subheader("Clients — utilisation des packs & inactifs")
+facts = client_facts(df, sources.get("Présences"))  # table par client, calculée une fois par version des données
+packs = pack_utilisation(facts)
+if packs is None:
+    st.info("Présences sans colonne Client : utilisation des packs indisponible (export par visite requis).", icon="ℹ️")
+else:
+    st.dataframe(packs, hide_index=True, use_container_width=True)
+    st.caption("Séances de pack achetées ≈ quantité × nombre lu dans le nom du service ; utilisation = suivies / achetées.")
+days = st.slider("Inactif depuis (jours)", 7, 180, INACTIVE_DAYS, step=7)
+idle = inactive_clients(facts, days)
+st.caption(f"{len(idle)} client(s) sans achat ni visite depuis plus de {days} jours (réf. : dernière date des données).")
+st.dataframe(idle, hide_index=True, use_container_width=True)
+
+st.subheader("MRR — Abonnement 4×50’")
+bridge = mrr_bridge(df)
+if bridge.empty:
+    st.info("Pas d'abonnement daté avec colonne Client : MRR indisponible.", icon="ℹ️")
+else:
+    last = bridge.iloc[-1]
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("MRR (dernier mois, €)", f"{last['MRR fin']:,.0f}".replace(",", " "),
+              delta=f"{last['MRR fin'] - last['MRR début']:+,.0f}".replace(",", " "))
+    m2.metric("Abonnés actifs", int(last["Abonnés"]))
+    m3.metric("Nouveaux abonnés", int(last["Nouveaux abonnés"]))
+    m4.metric("Abonnés perdus", int(last["Abonnés perdus"]))
+    show_chart(mrr_bridge_chart, df)
+    with st.expander("Bridge MRR mensuel"):
+        st.dataframe(bridge.round(0), use_container_width=True)
+    with st.expander("Périodes d'abonnement par client"):
+        st.dataframe(subscription_periods(df), hide_index=True, use_container_width=True)
 
-st.subheader("Cohortes (note)")
-st.info(cohort_note(), icon="ℹ️")
+prewarm()  # page servie : les caches des autres pages chauffent pendant la lecture
+perf_panel()
@@ -0,0 +1,50 @@
+# pages/03_Explorer.py
+import streamlit as st
+from utils import (
+    INGEST_MODE, SQL_QUERIES, SQL_MAX_ROWS, sql_engine, sql_presets, sql_query, sql_tables, styled_title,
+    inject_background,
+    start_trace, perf_panel, prewarm
+)
+
+st.set_page_config(page_title="FlexLab — Explorer", layout="wide")
+start_trace("Explorer")  # temps par étape de ce rerun, cf. perf_panel() en fin de page
+inject_background()
+styled_title(logo_path="assets/logo.png", title="Explorer",
+             subtitle="Requêtes SQL ad hoc sur les ventes et les présences")
+
+if INGEST_MODE == "stream":
+    st.info("Mode streaming (FLEXLAB_INGEST=stream) : les lignes ne sont pas en mémoire, pas de tables SQL.", icon="ℹ️")
+    prewarm()
+    perf_panel()
+    st.stop()
+
+presets = sql_presets()  # requêtes dont les colonnes manquent (ex. présences sans Date) : masquées
+name = st.selectbox("Requête", [n for n, missing in presets.items() if not missing])
+hidden = {n: missing for n, missing in presets.items() if missing}
+if hidden:
+    st.caption("Indisponible avec ces données : "
+               + " ; ".join(f"{n} (colonnes absentes : {', '.join(m)})" for n, m in hidden.items()))
+sql = st.text_area("SQL", SQL_QUERIES.get(name, ""), height=260, key=f"sql-{name}",
+                   help="Tables ventes et presences (colonnes Jour / Semaine / Mois en AAAA-MM-JJ). "
+                        "Paramètres $date_min et $date_max : dates ci-dessous, NULL si vides. Lecture seule.")
+c1, c2 = st.columns(2)
+date_min = c1.date_input("Date de début ($date_min)", value=None)
+date_max = c2.date_input("Date de fin ($date_max)", value=None)
+
+try:
+    # même texte + mêmes paramètres + mêmes versions de données → résultat servi depuis le cache
+    res = sql_query(sql, {"date_min": date_min, "date_max": date_max})
+except Exception as e:
+    st.error(f"Requête impossible : {e}")
+else:
+    st.caption(f"{len(res)} ligne(s) — moteur {sql_engine()}"
+               + (f", {SQL_MAX_ROWS} premières affichées" if len(res) > SQL_MAX_ROWS else ""))
+    st.dataframe(res.head(SQL_MAX_ROWS), hide_index=True, use_container_width=True)
+    st.download_button("⬇️ Exporter (CSV)", res.to_csv(index=False).encode("utf-8"),
+                       file_name="flexlab_requete.csv", mime="text/csv")
+
+with st.expander("Tables disponibles"):
+    st.dataframe(sql_tables(), hide_index=True, use_container_width=True)
+
+prewarm()  # page servie : les caches des autres pages chauffent pendant la lecture
+perf_panel()
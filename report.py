@@ -0,0 +1,148 @@
+# report.py
+"""Export hors Streamlit de tous les graphiques (pitch deck) : un PNG par graphe + un PDF multipage.
+
+    python report.py [--out exports] [--workers N] [--studio NOM] [--start 2025-01-01] [--end 2025-06-30]
+                     [--grain auto|D|W|M] [--capacity 12]
+
+Les données passent par les loaders habituels ; les agrégats (cube ventes, parcours client, cohortes, MRR)
+sont calculés une fois dans le processus principal puis partagés avec le pool de rendu (backend Agg).
+--start / --end s'appliquent à toutes les pages : cube ventes, lignes (funnel, cohortes, MRR) et présences ;
+la période figure dans le titre de chaque page du PDF.
+"""
+import argparse, io, json, os, sys, time
+
+import pandas as pd
+import utils
+from utils import (
+    load_sales_store, load_attendance_store, for_studio, sales_window, attendance_window,
+    cohort_retention, mrr_bridge, _fig_to_png, _mpl,
+)
+
+# (fichier, titre, fonction de utils, source, args, kwargs) — source : clé du contexte partagé
+def _jobs(grain, capacity, has_att):
+    jobs = [
+        ("01_ventes_quotidiennes", "Quantités + CA cumulatif", "stacked_bar_with_cumulative", "cube",
+         ("Quantités + CA cumulatif (été grisé)",), {"grain": grain}),
+        ("02_ca_croissance", "CA et croissance", "simple_line_growth", "cube", ("CA et croissance (%)",), {"grain": grain}),
+        ("03_packs_clients", "Packs vs clients uniques", "weekly_packs_vs_clients", "cube",
+         ("Packs vs Clients uniques — et % conversion",), {"grain": grain}),
+        ("04_arpu", "ARPU", "arpu_line", "cube", ("ARPU (CA / client)",), {"grain": grain}),
+        ("05_part_ca", "Répartition du CA", "share_area", "cube", ("Répartition du CA dans le temps",), {"grain": grain}),
+        ("06_ca_par_type", "CA total par type", "pie_split", "rev", ("CA total par type",), {}),
+        ("07_funnel", "Funnel clients", "funnel_conversion", "df", (), {}),
+        ("08_cohortes", "Cohortes — rétention", "cohort_heatmap", "df", (), {"grain": "M"}),
+        ("09_mrr", "MRR abonnements", "mrr_bridge_chart", "df", (), {}),
+    ]
+    if has_att:
+        jobs += [
+            ("10_heatmap_presences", "Heatmap présences", "heatmap_attendance", "att", (), {}),
+            ("11_top_creneaux", "Top créneaux", "top_slots", "att", (), {}),
+            ("12_clients_hebdo", "Clients uniques par semaine", "weekly_unique_clients", "att", (), {}),
+            ("13_clients_hebdo_bar", "Clients uniques par semaine (barres)", "weekly_unique_clients_bar", "att", (), {}),
+        ]
+        if capacity > 0:
+            jobs.append(("14_occupation", "Occupation moyenne", "occupancy_gauge", "att", (), {"capacity": capacity}))
+    return jobs
+
+_CTX = {}
+
+def _init(ctx):
+    _CTX.update(ctx)
+
+def _render(job):
+    name, _, fn_name, source, args, kwargs = job
+    t = time.perf_counter()
+    out = getattr(utils, fn_name)(_CTX[source], *args, **kwargs)
+    png = _fig_to_png(out[0] if isinstance(out, tuple) else out)
+    return name, png, time.perf_counter() - t
+
+def _dated(df, start=None, end=None):
+    # lignes de ventes de la fenêtre (jours inclus, comme SalesCube.slice) ; ventes non datées exclues
+    if (start is None and end is None) or "Date" not in df.columns:
+        return df
+    day = df["Date"].dt.normalize()
+    keep = day.notna()
+    if start is not None:
+        keep &= day >= pd.Timestamp(start)
+    if end is not None:
+        keep &= day <= pd.Timestamp(end)
+    return df[keep]
+
+def _context(args):
+    df = for_studio(load_sales_store(), args.studio)
+    cube = sales_window(df, args.start, args.end)
+    rows = _dated(df, args.start, args.end)
+    # passe d'agrégation unique, héritée par les processus de rendu
+    _ = cube.weekly, cube.journey
+    cohort_retention(rows, "M"); mrr_bridge(rows)
+    ctx = {"cube": cube, "df": rows, "rev": cube.groupe_totals("rev")}
+    try:
+        ctx["att"] = attendance_window(for_studio(load_attendance_store(), args.studio), args.start, args.end)
+    except Exception as e:
+        print(f"Présences ignorées : {e}", file=sys.stderr)
+    return ctx
+
+def _write_pdf(path, pages):
+    _, plt, _, _ = _mpl()
+    from matplotlib.backends.backend_pdf import PdfPages
+    with PdfPages(path) as pdf, plt.style.context("default"):  # pages blanches, hors style cyberpunk des graphes
+        for title, png in pages:
+            fig = plt.figure(figsize=(11.69, 8.27))  # A4 paysage
+            ax = fig.add_axes([0.03, 0.03, 0.94, 0.88])
+            ax.imshow(plt.imread(io.BytesIO(png), format="png")); ax.axis("off")
+            fig.suptitle(title, fontsize=14)
+            pdf.savefig(fig)
+            plt.close(fig)
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Export PDF/PNG des graphiques FlexLab.")
+    p.add_argument("--out", default="exports")
+    p.add_argument("--workers", type=int, default=None, help="processus de rendu (défaut : nombre de CPU)")
+    p.add_argument("--studio", default=None)
+    p.add_argument("--start", default=None)
+    p.add_argument("--end", default=None)
+    p.add_argument("--grain", default="auto", choices=["auto", "D", "W", "M"])
+    p.add_argument("--capacity", type=int, default=0,
+                   help="capacité théorique par jour, en sessions (jauge d'occupation)")
+    args = p.parse_args(argv)
+
+    t0 = time.perf_counter()
+    ctx = _context(args)
+    t_data = time.perf_counter() - t0
+    jobs = _jobs(args.grain, args.capacity, "att" in ctx)
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(jobs)))
+
+    t1 = time.perf_counter()
+    if workers > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"  # fork : contexte non copié
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method),
+                                 initializer=_init, initargs=(ctx,)) as pool:
+            results = list(pool.map(_render, jobs))
+    else:
+        _init(ctx)
+        results = [_render(j) for j in jobs]
+    t_render = time.perf_counter() - t1
+
+    os.makedirs(args.out, exist_ok=True)
+    period = f" — {args.start or 'début'} → {args.end or 'fin'}" if args.start or args.end else ""
+    titles = {j[0]: j[1] + period for j in jobs}
+    for name, png, _ in results:
+        with open(os.path.join(args.out, name + ".png"), "wb") as f:
+            f.write(png)
+    _write_pdf(os.path.join(args.out, "flexlab_report.pdf"), [(titles[n], png) for n, png, _ in results])
+
+    timings = {n: round(dt, 3) for n, _, dt in results}
+    with open(os.path.join(args.out, "timings.json"), "w", encoding="utf-8") as f:
+        json.dump({"data_s": round(t_data, 3), "render_wall_s": round(t_render, 3), "workers": workers,
+                   "figures": timings}, f, indent=2, ensure_ascii=False)
+    width = max(len(n) for n in timings)
+    for n, dt in timings.items():
+        print(f"{n:<{width}}  {dt:6.2f} s")
+    print(f"{'données':<{width}}  {t_data:6.2f} s")
+    print(f"{'rendu (mur)':<{width}}  {t_render:6.2f} s  ({workers} processus)")
+    print(f"→ {args.out}/flexlab_report.pdf + {len(results)} PNG")
+
+if __name__ == "__main__":
+    main()
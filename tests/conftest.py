@@ -0,0 +1,35 @@
+# tests/conftest.py
+"""Données synthétiques (bench/generate.py) normalisées par les loaders, caches de utils vidés à chaque test.
+
+    python -m pytest -q
+"""
+import os, sys
+from collections import OrderedDict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bench")]
+
+import pytest
+import utils
+from generate import make_sales, make_attendance
+
+@pytest.fixture(autouse=True)
+def _fresh_caches(monkeypatch, tmp_path):
+    # ni les mémos d'un test à l'autre, ni les caches / store de data/
+    monkeypatch.setattr(utils, "_MEMO", OrderedDict())
+    monkeypatch.setattr(utils, "_LEDGER", OrderedDict())
+    monkeypatch.setattr(utils, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(utils, "STORE_DIR", str(tmp_path / "store"))
+    monkeypatch.setattr(utils, "FIG_CACHE_DIR", None)
+
+@pytest.fixture
+def sales():
+    df = utils._classify_sales(utils._sales_dtypes(utils._normalize_sales(make_sales(4000, clients=300, years=2))))
+    df.attrs["version"] = "test-sales"
+    return df
+
+@pytest.fixture
+def attendance():
+    df = utils._normalize_attendance(make_attendance(3000, years=2))
+    df.attrs["version"] = "test-attendance"
+    return df
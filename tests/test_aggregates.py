@@ -0,0 +1,57 @@
+# tests/test_aggregates.py
+"""Agrégats : erreur HyperLogLog bornée, identité du bridge MRR, streaming (from_chunks) ≡ from_frame."""
+import numpy as np
+import pandas as pd
+import pytest
+import utils
+
+def _chunks(df, size):
+    return (df.iloc[i:i + size] for i in range(0, len(df), size))
+
+def test_hll_error_bound():
+    rng = np.random.default_rng(0)
+    n = 40_000
+    day = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365, 5 * n), unit="D")
+    client = np.concatenate([np.arange(n), rng.integers(0, n, 4 * n)])
+    idx = utils.ClientIndex.from_pairs(day.values.astype("datetime64[ns]"), client)
+    for lo, hi in [(None, None), ("2025-03-01", "2025-06-30")]:
+        exact = idx.count(lo, hi)
+        assert abs(idx.count(lo, hi, approx=True) - exact) / exact < 0.05  # ≈ 3 erreurs types (1.6 %)
+
+def test_mrr_bridge_identity(sales):
+    b = utils.mrr_bridge(sales)
+    assert len(b) > 3
+    flow = b["MRR début"] + b["Nouveau"] + b["Réactivation"] + b["Expansion"] - b["Contraction"] - b["Churn"]
+    np.testing.assert_allclose(flow, b["MRR fin"])
+    np.testing.assert_allclose(b["MRR début"].iloc[1:], b["MRR fin"].iloc[:-1])
+    assert b["MRR début"].iloc[0] == 0
+
+def test_mrr_bridge_resumes_from_ledger(sales):
+    utils.mrr_bridge(sales)
+    later = sales.copy()
+    last = later["Date"].max()
+    later.loc[later["Date"] > last - pd.Timedelta(days=20), "Montant total"] *= 2
+    later.attrs["version"] = "test-sales-2"
+    resumed = utils.mrr_bridge(later)
+    utils._LEDGER.clear()
+    utils._MEMO.clear()
+    pd.testing.assert_frame_equal(resumed, utils.mrr_bridge(later))
+
+def test_sales_cube_from_chunks_matches_from_frame(sales):
+    sales = sales.copy()
+    sales.loc[sales.index[:25], "Date"] = pd.NaT  # ventes non datées comprises
+    a = utils.SalesCube.from_frame(sales)
+    b = utils.SalesCube.from_chunks(_chunks(sales, 333))
+    pd.testing.assert_frame_equal(a.daily, b.daily, check_dtype=False)
+    assert len(a._visits) == len(b._visits)
+    assert a.unique_clients() == b.unique_clients()
+    assert (a.period_clients("W") == b.period_clients("W")).all()
+    assert a.journey.funnel() == b.journey.funnel()
+
+def test_slot_index_from_chunks_matches_from_frame(attendance):
+    a = utils.SlotIndex.from_frame(attendance)
+    b = utils.SlotIndex.from_chunks(_chunks(attendance, 250))
+    m = "Nombre total de sessions"
+    pd.testing.assert_frame_equal(a.day_slot(m), b.day_slot(m))
+    pd.testing.assert_series_equal(a.slot_totals("Clients uniques"), b.slot_totals("Clients uniques"))
+    pd.testing.assert_series_equal(a.weekly("Clients uniques"), b.weekly("Clients uniques"))
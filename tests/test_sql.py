@@ -0,0 +1,89 @@
+# tests/test_sql.py
+"""Verrouillage de l'Explorer : aucune écriture, aucun accès fichier, sur sqlite comme sur DuckDB.
+Le filtre de mots-clés est désactivé dans les tests « moteur » : c'est la connexion qui doit refuser."""
+import re
+from collections import OrderedDict
+
+import pytest
+import utils
+
+@pytest.fixture(params=["sqlite", "duckdb"])
+def engine(request, monkeypatch, sales, attendance):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb")
+    frames = {"sales": sales, "attendance": attendance}
+    monkeypatch.setattr(utils, "SQL_ENGINE", request.param)
+    monkeypatch.setattr(utils, "_SQL", {})
+    monkeypatch.setattr(utils, "_SQL_CACHE", OrderedDict())
+    monkeypatch.setattr(utils, "shared_frame", lambda kind: frames[kind])
+    assert utils.sql_engine() == request.param
+    yield frames
+    utils._SQL["con"].close()
+
+@pytest.fixture
+def no_filter(monkeypatch):
+    monkeypatch.setattr(utils, "_SQL_WRITES", re.compile(r"(?!)"))
+
+def _rows(table="ventes"):
+    return int(utils.sql_query(f"SELECT COUNT(*) AS n FROM {table}")["n"].iloc[0])
+
+@pytest.mark.parametrize("sql", [
+    "ATTACH DATABASE '{db}' AS x",
+    "PRAGMA query_only = OFF",
+    "INSERT INTO ventes (Nom) VALUES ('x')",
+    "CREATE TABLE t AS SELECT * FROM ventes",
+    "WITH t AS (SELECT 1) INSERT INTO ventes (Nom) SELECT 'x' FROM t",
+    "WITH t AS (SELECT 1) DELETE FROM ventes",
+    "SELECT 1; DROP TABLE ventes",
+])
+def test_writes_rejected(engine, sql, tmp_path):
+    n = _rows()
+    with pytest.raises(ValueError):
+        utils.sql_query(sql.format(db=tmp_path / "x.db"))
+    assert _rows() == n
+    assert not (tmp_path / "x.db").exists()
+
+@pytest.mark.parametrize("sql", [
+    "WITH t AS (SELECT 1) INSERT INTO ventes (Nom) SELECT 'x' FROM t",
+    "WITH t AS (SELECT 1) DELETE FROM ventes",
+    "WITH t AS (SELECT 1) UPDATE ventes SET \"Montant total\" = 0",
+])
+def test_engine_blocks_writes_without_filter(engine, no_filter, sql):
+    n, total = _rows(), float(utils.sql_query('SELECT SUM("Montant total") AS s FROM ventes')["s"].iloc[0])
+    try:
+        utils.sql_query(sql)
+    except Exception:
+        pass  # sqlite : refusé par l'authorizer ; DuckDB : refusé ou annulé par le ROLLBACK
+    utils._SQL_CACHE.clear()
+    assert _rows() == n
+    assert float(utils.sql_query('SELECT SUM("Montant total") AS s FROM ventes')["s"].iloc[0]) == pytest.approx(total)
+
+@pytest.mark.parametrize("fn", ["read_csv", "read_csv_auto", "read_text", "read_parquet"])
+def test_no_file_access(engine, no_filter, tmp_path, fn):
+    path = tmp_path / "secret.csv"
+    path.write_text("secret\n42\n")
+    with pytest.raises(Exception):
+        utils.sql_query(f"SELECT * FROM {fn}('{path}')")
+
+def test_sqlite_pragma_read_denied(engine, no_filter):
+    if utils.sql_engine() != "sqlite":
+        pytest.skip("authorizer propre à sqlite")
+    with pytest.raises(Exception, match="not authorized"):
+        utils.sql_query("SELECT * FROM pragma_table_info('ventes')")
+
+def test_semicolon_inside_literal_and_comment(engine):
+    out = utils.sql_query("SELECT 'a;b' AS x, '$nope' AS y -- fin ; commentaire")
+    assert out.to_dict("records") == [{"x": "a;b", "y": "$nope"}]
+
+def test_presets_run_on_dated_data(engine):
+    presets = utils.sql_presets()
+    assert not any(presets.values())
+    for sql in utils.SQL_QUERIES.values():
+        assert len(utils.sql_query(sql, {"date_min": None, "date_max": None})) > 0
+
+def test_presets_hidden_without_attendance_dates(engine):
+    att = engine["attendance"].drop(columns=["Date"])
+    att.attrs["version"] = "test-attendance-undated"
+    engine["attendance"] = att
+    missing = utils.sql_presets()["Créneaux en hausse (4 dernières semaines vs 4 précédentes)"]
+    assert "presences.Semaine" in missing
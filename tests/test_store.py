@@ -0,0 +1,60 @@
+# tests/test_store.py
+"""Store incrémental : un export fait foi sur sa fenêtre (corrections, suppressions), l'historique antérieur
+reste, un ré-export identique n'écrit rien, un autre fichier source repart de zéro."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import utils
+
+def _normalize(df):
+    df["Date"] = pd.to_datetime(df["Date"])
+    return df
+
+def _raw(days=120, start="2025-01-01"):
+    day = pd.date_range(start, periods=days, freq="D").repeat(2)
+    return pd.DataFrame({"Date": day.strftime("%Y-%m-%d"), "Client": [f"C{i % 37}" for i in range(len(day))],
+                         "Montant total": np.arange(len(day), dtype=float) + 10.0})
+
+def _sync(path, df):
+    df.to_csv(path, index=False)
+    return utils._sync_store("sales", str(path), pd.read_csv, _normalize)
+
+def _manifest():
+    return utils._store_manifest(os.path.join(utils.STORE_DIR, "sales"))
+
+def test_store_follows_each_export(tmp_path):
+    path = tmp_path / "sales.csv"
+    base = _raw()
+    assert len(_sync(path, base)) == len(base)
+
+    fix = base.copy()
+    fix.loc[len(fix) - 6, "Montant total"] += 1000  # correction dans la fenêtre
+    hist = _sync(path, fix)
+    assert len(hist) == len(fix)
+    assert hist["Montant total"].sum() == pytest.approx(fix["Montant total"].sum())
+    assert (_manifest()["written"], _manifest()["removed"]) == (1, 1)
+
+    dele = fix.drop(index=len(fix) - 3)  # suppression dans la fenêtre
+    hist = _sync(path, dele)
+    assert len(hist) == len(dele)
+    assert hist["Montant total"].sum() == pytest.approx(dele["Montant total"].sum())
+
+    recent = dele[pd.to_datetime(dele["Date"]) >= pd.to_datetime(dele["Date"]).max() - pd.Timedelta(days=5)]
+    hist = _sync(path, recent)  # export partiel : l'historique antérieur à son 1er jour reste
+    assert len(hist) == len(dele)
+    assert hist["Montant total"].sum() == pytest.approx(dele["Montant total"].sum())
+
+    more = pd.concat([dele, pd.DataFrame({"Date": ["2025-05-15"], "Client": ["C1"], "Montant total": [5.0]})],
+                     ignore_index=True)
+    _sync(path, more)
+    hist = _sync(path, more.iloc[::-1])  # mêmes lignes, autre ordre : rien à écrire
+    assert (_manifest()["written"], _manifest()["removed"]) == (0, 0)
+    assert len(hist) == len(more)
+
+def test_other_source_resets_store(tmp_path):
+    _sync(tmp_path / "a.csv", _raw())
+    hist = _sync(tmp_path / "b.csv", _raw(days=10, start="2024-06-01"))
+    assert len(hist) == 20
+    assert hist["Date"].min() == pd.Timestamp("2024-06-01")
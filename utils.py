@@ -1,21 +1,55 @@
 # utils.py
-import os, base64
+import os, re, sys, base64, hashlib, json, shutil, threading, time
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+from functools import cached_property, wraps
 import pandas as pd
 import numpy as np
 
 # ---------- CONSTANTS ----------
 PRIMARY = "#0f6fff"
-SALES_PATH = os.path.join("data", "sales.xlsx")
-ATT_PATH   = os.path.join("data", "attendance.xlsx")
+GROUP_COLORS = {"Découverte":"#6aa6ff","Packs":PRIMARY,"Abonnement 4×50’":"#0b4bcc","Unitaire (autres)":"#99bbff"}
+CHART_BACKEND = os.environ.get("FLEXLAB_CHART_BACKEND", "matplotlib")  # ou "vega-lite" (rendu navigateur)
+# fichier, dossier (un sous-dossier par studio) ou motif glob de classeurs Mindbody
+SALES_PATH = os.environ.get("FLEXLAB_SALES_PATH", os.path.join("data", "sales.xlsx"))
+ATT_PATH   = os.environ.get("FLEXLAB_ATT_PATH", os.path.join("data", "attendance.xlsx"))
+CACHE_DIR  = os.path.join("data", ".cache")
+STORE_DIR  = os.path.join("data", ".store")
+CACHE_SCHEMA = 6  # à incrémenter dès que la normalisation des loaders ou le format du store change
+STORE_LOOKBACK_DAYS = 31  # lignes antérieures au watermark encore comparées par empreinte (saisies tardives)
+
+# Granularités des séries temporelles : code → (fréquence pandas, libellé, durée approx. en jours).
+# "auto" choisit la plus fine qui tient sous MAX_PERIODS éléments par série.
+GRAINS = {"D": ("D", "jour", 1), "W": ("W-MON", "semaine", 7), "M": ("ME", "mois", 30.44)}
+MAX_PERIODS = 120
+
+# Règles de classement des services, évaluées dans l'ordre : 1re règle dont un motif
+# apparaît dans le nom (en minuscules) l'emporte, sinon SERVICE_DEFAULT.
+SERVICE_RULES = [
+    ("Découverte", ("découverte",)),
+    ("Packs", ("pack", "recharge")),
+    ("Abonnement 4×50’", ("4 x 50", "4x50")),
+]
+SERVICE_DEFAULT = "Unitaire (autres)"
 
 # ---------- LAZY MATPLOTLIB to avoid deploy issues ----------
+_MPL = []
+_MPL_LOCK = threading.Lock()
+
 def _mpl():
-    import matplotlib
-    matplotlib.use("Agg")  # headless backend for Streamlit Cloud
-    import matplotlib.pyplot as plt
-    from matplotlib.colors import LinearSegmentedColormap
-    import mplcyberpunk
-    return matplotlib, plt, LinearSegmentedColormap, mplcyberpunk
+    # import + style cyberpunk une seule fois par process (les graphes ne rechargent plus le style)
+    if _MPL:
+        return _MPL[0]
+    with _MPL_LOCK:
+        if not _MPL:
+            import matplotlib
+            matplotlib.use("Agg")  # headless backend for Streamlit Cloud
+            import matplotlib.pyplot as plt
+            from matplotlib.colors import LinearSegmentedColormap
+            import mplcyberpunk
+            plt.style.use("cyberpunk")
+            _MPL.append((matplotlib, plt, LinearSegmentedColormap, mplcyberpunk))
+    return _MPL[0]
 
 # ---------- BRANDING ----------
 def styled_title(logo_path=None, title="FlexLab Dashboard", subtitle=""):
@@ -32,6 +66,31 @@ def styled_title(logo_path=None, title="FlexLab Dashboard", subtitle=""):
     <p style='color:#9bb7ff;margin-top:0'>{subtitle}</p>
     """, unsafe_allow_html=True)
 
+def chart_backend_selector():
+    """Choix du rendu des graphiques dans la sidebar (mémorisé dans la session, défaut CHART_BACKEND)."""
+    import streamlit as st
+    options = ["matplotlib", "vega-lite"]
+    current = st.session_state.get("chart_backend", CHART_BACKEND)
+    with st.sidebar:
+        choice = st.radio("🖼️ Rendu des graphiques", options,
+                          index=options.index(current) if current in options else 0,
+                          help="vega-lite : graphiques interactifs rendus dans le navigateur (seuls les agrégats sont envoyés).")
+    st.session_state["chart_backend"] = choice
+    return choice
+
+def studio_selector(df):
+    """Choix du studio dans la sidebar (None = tous) ; rien n'est affiché s'il n'y a qu'un studio."""
+    import streamlit as st
+    names = studios(df)
+    if len(names) < 2:
+        return None
+    options = ["Tous les studios"] + names
+    current = st.session_state.get("studio")
+    with st.sidebar:
+        choice = st.selectbox("🏢 Studio", options, index=options.index(current) if current in options else 0)
+    st.session_state["studio"] = choice
+    return None if choice == options[0] else choice
+
 def inject_background(image_path="assets/bg.jpg"):
     import streamlit as st
     if not os.path.exists(image_path):
@@ -55,7 +114,194 @@ def inject_background(image_path="assets/bg.jpg"):
     """
     st.markdown(css, unsafe_allow_html=True)
 
+# ---------- TRACING ----------
+# Temps mur, lignes traitées et variation du RSS par étape (loaders, normalisation, agrégats, graphes, PNG),
+# par rerun ; le pic RSS du process (ru_maxrss) n'est noté qu'au niveau du rerun.
+# Un rerun est tracé entre start_trace() et end_trace() (perf_panel() l'appelle) ; hors rerun, @traced ne coûte
+# qu'un test. FLEXLAB_TRACE_MEMORY=1 active tracemalloc (pic alloué par étape, rendu nettement plus lent).
+TRACE_FILE = os.environ.get("FLEXLAB_TRACE_FILE")  # JSONL, une ligne par rerun (None → pas d'export)
+TRACE_MEMORY = os.environ.get("FLEXLAB_TRACE_MEMORY") == "1"
+TRACE_HISTORY = 50
+_TRACE = threading.local()
+_TRACES = deque(maxlen=TRACE_HISTORY)
+_TRACES_LOCK = threading.Lock()
+# compteurs des caches maison (_cached_frame, _memo, render_png / ChartBatch, sql_query), propres à chaque rerun
+_CACHE_FIELDS = {"arrow": ("hits", "misses"), "memo": ("hits", "misses"),
+                 "figures": ("hits", "disk_hits", "misses"), "sql": ("hits", "misses")}
+
+def _count(cache, field, n=1):
+    # compté dans le rerun tracé par ce thread : ni les autres sessions ni le thread de préchauffage n'y entrent
+    run = getattr(_TRACE, "run", None)
+    if run is not None:
+        run["caches"][cache][field] += n
+
+def _rss_mb():
+    # pic RSS de tout le process (ru_maxrss) : niveau rerun seulement, il ne redescend jamais
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (2**20 if sys.platform == "darwin" else 2**10), 1)  # octets sur macOS, Kio ailleurs
+
+def _rss_now_mb():
+    # RSS courant (Linux : /proc/self/statm, en pages) ; None ailleurs
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _rows(args, out):
+    for x in (out,) + args[:1]:
+        if isinstance(x, (pd.DataFrame, pd.Series)):
+            return len(x)
+        if isinstance(x, SalesCube):
+            return len(x.daily)
+    return None
+
+class _Stage:
+    def __init__(self, run, name):
+        self.run, self.name = run, name
+        self.rec = {"stage": name, "depth": len(run["_stack"]), "parent": run["_stack"][-1].name if run["_stack"] else None}
+        self.child_s, self.peak = 0.0, 0
+
+    def __enter__(self):
+        stack = self.run["_stack"]
+        if TRACE_MEMORY:
+            import tracemalloc
+            if stack:  # le pic du parent est conservé avant remise à zéro pour l'enfant
+                stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self.mem0 = tracemalloc.get_traced_memory()[0]
+        self.run["stages"].append(self.rec)
+        stack.append(self)
+        self.rss0 = _rss_now_mb()
+        self.t0 = time.perf_counter()
+        self.rec["start_ms"] = round((self.t0 - self.run["_t0"]) * 1000, 2)
+        return self
+
+    def __exit__(self, exc_type, *_):
+        dt = time.perf_counter() - self.t0
+        stack = self.run["_stack"]
+        stack.pop()
+        self.rec.update(wall_ms=round(dt * 1000, 2), self_ms=round((dt - self.child_s) * 1000, 2))
+        rss = _rss_now_mb()
+        if rss is not None and self.rss0 is not None:  # variation du RSS pendant l'étape (enfants compris)
+            self.rec["rss_delta_mb"] = round(rss - self.rss0, 1)
+        if exc_type is not None:
+            self.rec["error"] = exc_type.__name__
+        if TRACE_MEMORY:
+            import tracemalloc
+            peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            self.rec["peak_mb"] = round((peak - self.mem0) / 2**20, 2)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+        if stack:
+            stack[-1].child_s += dt
+        return False
+
+def span(name):
+    """Étape nommée dans le rerun courant (bloc `with`) ; sans rerun tracé, ne fait rien."""
+    run = getattr(_TRACE, "run", None)
+    return _Stage(run, name) if run is not None else nullcontext()
+
+def traced(fn):
+    """Trace chaque appel de `fn` comme une étape du rerun courant (nom = __qualname__)."""
+    name = fn.__qualname__
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        run = getattr(_TRACE, "run", None)
+        if run is None:
+            return fn(*args, **kwargs)
+        with _Stage(run, name) as stage:
+            out = fn(*args, **kwargs)
+            stage.rec["rows"] = _rows(args, out)
+        return out
+    return wrapper
+
+def start_trace(label):
+    """Ouvre la trace du rerun (début de page) ; une trace restée ouverte (st.stop()…) est close d'abord."""
+    if getattr(_TRACE, "run", None) is not None:
+        end_trace()
+    if TRACE_MEMORY:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    _TRACE.run = {"run": f"{time.strftime('%Y%m%dT%H%M%S')}-{threading.get_ident() % 10000:04d}", "label": label,
+                  "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "stages": [], "_stack": [],
+                  "_t0": time.perf_counter(), "caches": {c: dict.fromkeys(f, 0) for c, f in _CACHE_FIELDS.items()}}
+    return _TRACE.run
+
+def end_trace():
+    """Clôt la trace du rerun courant : durée totale, mémoire, export JSONL (hits/misses déjà comptés)."""
+    run = getattr(_TRACE, "run", None)
+    if run is None:
+        return None
+    _TRACE.run = None
+    run["total_ms"] = round((time.perf_counter() - run.pop("_t0")) * 1000, 2)
+    run["rss_max_mb"] = _rss_mb()
+    del run["_stack"]
+    with _TRACES_LOCK:
+        _TRACES.append(run)
+        if TRACE_FILE:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(TRACE_FILE)), exist_ok=True)
+                with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(run, ensure_ascii=False) + "\n")
+            except OSError:
+                pass  # export facultatif
+    return run
+
+def traces():
+    """Reruns tracés récents (du plus ancien au plus récent)."""
+    with _TRACES_LOCK:
+        return list(_TRACES)
+
+def trace_frame(run):
+    """Étapes d'un rerun en DataFrame (ordre de démarrage, nom indenté selon la profondeur)."""
+    df = pd.DataFrame(run["stages"])
+    if df.empty:
+        return df
+    df.insert(0, "étape", ["· " * d + s for d, s in zip(df["depth"], df["stage"])])
+    if "rows" in df:
+        df["rows"] = df["rows"].astype("Int64")
+    return df.drop(columns=["stage", "depth", "parent"])
+
+def perf_panel():
+    """Clôt la trace du rerun et, si « ⏱️ Performance » est coché dans la sidebar, affiche le détail :
+    étapes (temps, lignes, mémoire), taux de hit des caches, export JSONL des reruns récents."""
+    import streamlit as st
+    run = end_trace()
+    with st.sidebar:
+        if not st.toggle("⏱️ Performance", key="perf_panel", help="Temps par étape du dernier rerun."):
+            return run
+        if run is None:
+            st.caption("Aucun rerun tracé.")
+            return run
+        st.caption(f"{run['label']} — {run['total_ms'] / 1000:.2f} s, {len(run['stages'])} étapes, RSS max {run['rss_max_mb']:.0f} Mo")
+        top = trace_frame(run)
+        if not top.empty:
+            st.dataframe(top, hide_index=True, use_container_width=True)
+            by = pd.DataFrame(run["stages"]).groupby("stage")["self_ms"].agg(["sum", "count"]).nlargest(8, "sum")
+            st.caption("Temps propre cumulé (ms) par fonction")
+            st.dataframe(by.rename(columns={"sum": "ms", "count": "appels"}), use_container_width=True)
+        rates = {}
+        for cache, s in run["caches"].items():
+            n = sum(s.values())
+            rates[cache] = f"{(n - s['misses']) / n:.0%} ({n})" if n else "—"
+        st.caption("Hits des caches pendant ce rerun : " + ", ".join(f"{c} {r}" for c, r in rates.items()))
+        loaded = {k: dataset_status(k) for k in _DATASET_LOADERS}
+        st.caption("Datasets : " + ", ".join(
+            f"{k} {d['version']} (chargé {d['loaded_at']}" + (f", ✗ {d['error']})" if d["error"] else ")")
+            for k, d in loaded.items() if d))
+        if _PREWARM.get("steps"):
+            done = f"fini en {_PREWARM['total_s']:.2f} s" if "total_s" in _PREWARM else "en cours"
+            st.caption(f"Préchauffage ({done}) : " + ", ".join(
+                f"{k} {v:.2f} s" if isinstance(v, float) else f"{k} ✗ {v}" for k, v in _PREWARM["steps"].items()))
+        st.download_button("Exporter les traces (JSONL)", "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in traces()),
+                           file_name="flexlab_traces.jsonl", mime="application/json")
+    return run
+
 # ---------- HELPERS ----------
+@traced
 def _ensure_renamed(df, candidates, target, must_exist=True):
     if target in df.columns:
         return
@@ -78,6 +324,16 @@ def _hex_to_rgba(h, alpha=1.0):
     h = h.lstrip("#")
     return tuple(int(h[i:i+2], 16)/255.0 for i in (0,2,4)) + (alpha,)
 
+@traced
+def _glow(*axes):
+    _, _, _, mplcyberpunk = _mpl()
+    for ax in axes:
+        mplcyberpunk.add_glow_effects(ax)
+
+@traced
+def _layout(fig):
+    fig.tight_layout()
+
 def shade_closed_period(ax, start="2025-08-02", end="2025-08-24", label="Studio fermé (été)"):
     import pandas as pd
     try:
@@ -90,110 +346,2304 @@ def shade_closed_period(ax, start="2025-08-02", end="2025-08-24", label="Studio
     except Exception:
         pass
 
+# ---------- ANNOTATIONS ----------
+# Étiquettes de valeurs : on ne crée de Text que là où il est lisible (taille en pixels), et jamais
+# plus de MAX_LABELS par série → le temps de rendu reste borné quelle que soit la plage de dates.
+MAX_LABELS = 200
+_CHAR_W = 0.6  # largeur moyenne d'un caractère, en fraction de la taille de police
+
+def _px(ax, x, y):
+    return ax.transData.transform(np.column_stack([x, y]))
+
+def cell_labels(ax, texts, fontsize=7, **kw):
+    """Annote une image (imshow) case par case ; rien si les cases sont trop petites pour le texte.
+    `texts` : tableau 2D de chaînes ("" = pas d'étiquette)."""
+    texts = np.asarray(texts, dtype=object)
+    if not texts.size:
+        return []
+    ii, jj = np.nonzero(texts != "")
+    if not len(ii):
+        return []
+    bbox = ax.get_window_extent()
+    cell_w, cell_h = bbox.width / texts.shape[1], bbox.height / texts.shape[0]
+    scale = ax.figure.dpi / 72
+    widest = max(len(t) for t in texts[ii, jj])
+    if cell_w < widest * fontsize * _CHAR_W * scale or cell_h < fontsize * scale:
+        return []
+    return [ax.text(j, i, texts[i, j], ha="center", va="center", fontsize=fontsize, **kw)
+            for i, j in zip(ii[:MAX_LABELS * 4], jj[:MAX_LABELS * 4])]
+
+def bar_labels(ax, bars, labels, fontsize=7, label_type="center", padding=0, **kw):
+    """ax.bar_label limité aux barres assez grandes pour leur étiquette ("" = pas d'étiquette)."""
+    from matplotlib.container import BarContainer
+    labels = np.asarray(labels, dtype=object)
+    patches = bars.patches
+    if not len(patches):
+        return []
+    geo = np.array([(p.get_x(), p.get_y(), p.get_width(), p.get_height()) for p in patches], dtype=float)
+    ax.autoscale_view()
+    p0, p1 = _px(ax, geo[:, 0], geo[:, 1]), _px(ax, geo[:, 0] + geo[:, 2], geo[:, 1] + geo[:, 3])
+    w_px, h_px = np.abs(p1[:, 0] - p0[:, 0]), np.abs(p1[:, 1] - p0[:, 1])
+    scale = ax.figure.dpi / 72
+    text_w = np.array([len(str(t)) for t in labels]) * fontsize * _CHAR_W * scale
+    text_h = fontsize * scale
+    horizontal = getattr(bars, "orientation", "vertical") == "horizontal"
+    keep = np.array([bool(t) for t in labels])
+    if label_type == "center":
+        keep &= (w_px >= text_w) & (h_px >= text_h)
+    else:  # au bout de la barre : seule l'épaisseur compte
+        keep &= (h_px >= text_h) if horizontal else (w_px >= text_w)
+    idx = np.flatnonzero(keep)
+    if len(idx) > MAX_LABELS:
+        idx = idx[::int(np.ceil(len(idx) / MAX_LABELS))]
+    if not len(idx):
+        return []
+    sub = BarContainer([patches[i] for i in idx], datavalues=geo[idx, 2 if horizontal else 3],
+                       orientation="horizontal" if horizontal else "vertical")
+    return ax.bar_label(sub, labels=list(labels[idx]), label_type=label_type, padding=padding, fontsize=fontsize, **kw)
+
+def point_labels(ax, x, y, labels, fontsize=8, **kw):
+    """Étiquettes de points d'une courbe, éclaircies (1 sur k) pour ne pas se chevaucher."""
+    labels = np.asarray(labels, dtype=object)
+    n = len(labels)
+    if not n:
+        return []
+    ax.autoscale_view()
+    xs = _px(ax, ax.convert_xunits(np.asarray(x)), np.zeros(n))[:, 0] if n > 1 else np.zeros(1)
+    step = 1
+    if n > 1:
+        gap = np.median(np.abs(np.diff(xs))) or 1.0
+        widest = max(len(str(t)) for t in labels) * fontsize * _CHAR_W * ax.figure.dpi / 72
+        step = max(int(np.ceil(widest / gap)), int(np.ceil(n / MAX_LABELS)), 1)
+    return [ax.text(xi, yi, t, fontsize=fontsize, **kw) for xi, yi, t in zip(x[::step], y[::step], labels[::step])]
+
+# ---------- COLUMNAR CACHE ----------
+def _schema_tag():
+    # le cache dépend aussi des règles de classement (Groupe est stocké déjà calculé)
+    rules = json.dumps([SERVICE_RULES, SERVICE_DEFAULT], ensure_ascii=False)
+    return f"{CACHE_SCHEMA}-{hashlib.sha1(rules.encode()).hexdigest()[:8]}"
+
+def _file_fingerprint(path, known=None):
+    """Identité d'un fichier source : chemin, taille, mtime et SHA-1 du contenu.
+    Si taille et mtime correspondent à `known`, on réutilise son hash sans relire le fichier."""
+    st_ = os.stat(path)
+    fp = {"path": os.path.abspath(path), "size": st_.st_size, "mtime_ns": st_.st_mtime_ns}
+    if known and all(known.get(k) == fp[k] for k in ("path", "size", "mtime_ns")):
+        fp["sha1"] = known.get("sha1")
+        return fp
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    fp["sha1"] = h.hexdigest()
+    return fp
+
+def _cache_paths(path, kind):
+    key = hashlib.sha1(f"{kind}|{os.path.abspath(path)}".encode()).hexdigest()[:16]
+    base = os.path.join(CACHE_DIR, f"{kind}-{key}")
+    return base + ".arrow", base + ".json"
+
+def _cached_frame(path, kind, build):
+    """Renvoie `build(path)` via un cache Arrow IPC sur disque (relu en memory-map).
+    Le cache est valide tant que le fichier source (taille/mtime/hash) et _schema_tag() n'ont pas changé.
+    Sans pyarrow, ou si le cache est illisible/non inscriptible, on retombe sur `build(path)`."""
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+    except ImportError:
+        return _stamp(build(path), kind, _file_fingerprint(path))
+
+    arrow_path, meta_path = _cache_paths(path, kind)
+    meta = None
+    if os.path.exists(meta_path) and os.path.exists(arrow_path):
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+    if meta and meta.get("schema") != _schema_tag():
+        meta = None
+    fp = _file_fingerprint(path, known=meta)
+
+    if meta and meta.get("sha1") == fp["sha1"]:
+        try:
+            with pa.memory_map(arrow_path) as source:
+                df = pa.ipc.open_file(source).read_all().to_pandas()
+            if meta.get("mtime_ns") != fp["mtime_ns"]:
+                # même contenu, fichier simplement recopié/touché → on rafraîchit la clé
+                _write_cache_meta(meta_path, fp)
+            _count("arrow", "hits")
+            return _stamp(df, kind, fp)
+        except Exception:
+            pass  # cache corrompu → reconstruction
+
+    _count("arrow", "misses")
+    df = build(path)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp = arrow_path + ".tmp"
+        feather.write_feather(table, tmp, compression="uncompressed")  # non compressé → memory-map zéro copie
+        os.replace(tmp, arrow_path)
+        _write_cache_meta(meta_path, fp)
+    except Exception:
+        pass  # FS en lecture seule, types mixtes non convertibles en Arrow… le cache reste optionnel
+    return _stamp(df, kind, fp)
+
+def _stamp(df, kind, fp):
+    # version du dataset (contenu source + schéma) : clé des agrégats/figures dérivés
+    df.attrs["version"] = f"{kind}-{fp['sha1'][:12]}-{_schema_tag()}"
+    return df
+
+def _write_cache_meta(meta_path, fp):
+    tmp = meta_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dict(fp, schema=_schema_tag()), f)
+    os.replace(tmp, meta_path)
+
+# ---------- EXCEL INGESTION ----------
+# Alias acceptés par colonne cible (ordre = priorité), partagés par la projection et _ensure_renamed
+SALES_ALIASES = {
+    "Date": ["Date d'achat","Date de vente","Date","Sale Date","Date commande"],
+    "Nom": ["Nom","Service","Service Name","Nom du service"],
+    "Quantité": ["Quantité","Qty","Quantity","Nombre"],
+    "Montant total": ["Montant total","Montant","Total","Amount","CA"],
+}
+ATT_ALIASES = {
+    # élargit la liste d’alias possibles
+    "Date": ["Date du service","Date","Service Date","Date de séance","Class Date",
+             "Appointment Date","Schedule Date","Jour"],
+    "Heure du service": ["Heure du service","Heure","Time","Créneau","Slot","Start Time"],
+    "Nombre total de sessions": ["Nombre total de sessions","Total Sessions","Sessions","Nombre de sessions","Total des sessions"],
+    "Clients uniques": ["Clients uniques","Unique Clients","Clients","Unique"],
+    "Client": ["Client","Client ID","ID client","Nom du client","Customer","Customer ID"],
+}
+SALES_SHEET_KEYS = ("service", "vente")
+ATT_SHEET_KEYS = ("présence", "presence", "attendance")
+
+def _excel_engine():
+    # python-calamine (lecteur Rust) si installé, sinon openpyxl en lecture seule
+    try:
+        import python_calamine  # noqa: F401
+        return "calamine"
+    except ImportError:
+        return "openpyxl"
+
+def _pick_sheet(names, keys):
+    for k in names:
+        lk = k.lower()
+        if any(key in lk for key in keys):
+            return k
+    return names[0]
+
+def _project_columns(header, aliases, fuzzy=None):
+    """Colonnes source à lire : pour chaque cible, la cible elle-même sinon le 1er alias présent.
+    `fuzzy` = {cible: (sous-chaînes,)} pour les colonnes reconnues par leur nom partiel (ex. Client)."""
+    keep = []
+    for target, candidates in aliases.items():
+        for c in [target] + list(candidates):
+            if c in header:
+                keep.append(c); break
+    for target, needles in (fuzzy or {}).items():
+        if target in header:
+            keep.append(target); continue
+        for c in header:
+            if any(n in c.lower() for n in needles):
+                keep.append(c); break
+    return sorted(set(keep), key=header.index)  # ordre de la feuille
+
+@traced
+def _read_sheet(path, sheet_keys, aliases, fuzzy=None, text_cols=()):
+    """Lit uniquement la feuille choisie et uniquement les colonnes mappées.
+    Les noms de feuilles et la ligne d'en-tête sont inspectés avant tout parsing de données."""
+    engine = _excel_engine()
+    if engine == "calamine":
+        from python_calamine import CalamineWorkbook
+        sheet = _pick_sheet(CalamineWorkbook.from_path(path).sheet_names, sheet_keys)
+        header = [str(c) for c in pd.read_excel(path, sheet_name=sheet, nrows=0, engine=engine).columns]
+        usecols = _project_columns(header, aliases, fuzzy)
+        dtype = {c: str for c in usecols if c in text_cols}
+        return pd.read_excel(path, sheet_name=sheet, usecols=usecols, dtype=dtype, engine=engine)
+
+    from operator import itemgetter
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[_pick_sheet(wb.sheetnames, sheet_keys)]
+        rows = ws.iter_rows(values_only=True)
+        raw_header = next(rows, ())
+        header = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(raw_header)]
+        usecols = _project_columns(header, aliases, fuzzy)
+        if not usecols:
+            return pd.DataFrame()
+        idx = [header.index(c) for c in usecols]
+        get = itemgetter(*idx) if len(idx) > 1 else (lambda r, i=idx[0]: (r[i],))
+        width = max(idx) + 1
+        # lignes courtes (cellules vides en fin de ligne) complétées ; lignes entièrement vides ignorées
+        data = [get(r if len(r) >= width else r + (None,) * (width - len(r))) for r in rows if any(v is not None for v in r)]
+    finally:
+        wb.close()
+    df = pd.DataFrame.from_records(data, columns=usecols)
+    for c in usecols:
+        if c in text_cols:
+            df[c] = df[c].astype(object).where(df[c].isna(), df[c].astype(str))
+    return df
+
 # ---------- LOADERS ----------
+@traced
 def load_sales_fixed():
+    if _is_multi(SALES_PATH):
+        return _load_sources(SALES_PATH, "sales", _sales_dtypes)
     if not os.path.exists(SALES_PATH):
         raise FileNotFoundError("Missing file: data/sales.xlsx")
-    xls = pd.read_excel(SALES_PATH, sheet_name=None)
-    sheet = None
-    for k in xls.keys():
-        lk = k.lower()
-        if "service" in lk or "vente" in lk:
-            sheet = k; break
-    if sheet is None:
-        sheet = list(xls.keys())[0]
-    df = xls[sheet].copy()
+    return _cached_frame(SALES_PATH, "sales", _build_sales)
+
+def _build_sales(path):
+    return _classify_sales(_normalize_sales(_read_sales_sheet(path)))
 
-    _ensure_renamed(df, ["Date d'achat","Date de vente","Date","Sale Date","Date commande"], "Date")
+def _read_sales_sheet(path):
+    return _read_sheet(path, SALES_SHEET_KEYS, SALES_ALIASES, fuzzy={"Client": ("client", "customer")},
+                       text_cols=SALES_ALIASES["Nom"] + ["Nom"])
+
+@traced
+def _normalize_sales(df):
+    _ensure_renamed(df, SALES_ALIASES["Date"], "Date")
     if "Date" in df.columns:
         df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    _ensure_renamed(df, ["Nom","Service","Service Name","Nom du service"], "Nom")
-    _ensure_renamed(df, ["Quantité","Qty","Quantity","Nombre"], "Quantité")
-    _ensure_renamed(df, ["Montant total","Montant","Total","Amount","CA"], "Montant total")
+    _ensure_renamed(df, SALES_ALIASES["Nom"], "Nom")
+    _ensure_renamed(df, SALES_ALIASES["Quantité"], "Quantité")
+    _ensure_renamed(df, SALES_ALIASES["Montant total"], "Montant total")
+    for c in ("Quantité", "Montant total"):
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df["Quantité"] = _downcast(df["Quantité"])  # Montant total reste en float64 (sommes en euros)
     if "Client" not in df.columns:
         # try some typical client fields
         for c in df.columns:
             if "client" in c.lower() or "customer" in c.lower():
                 df.rename(columns={c: "Client"}, inplace=True)
                 break
-    df["Nom"] = df["Nom"].astype(str)
-
-    def group_service(n):
-        x = str(n).lower()
-        if "découverte" in x: return "Découverte"
-        if "pack" in x or "recharge" in x: return "Packs"
-        if "4 x 50" in x or "4x50" in x: return "Abonnement 4×50’"
-        return "Unitaire (autres)"
-    df["Groupe"] = df["Nom"].apply(group_service)
+    df["Nom"] = df["Nom"].astype(str).astype("category")
+    if "Client" in df.columns and df["Client"].dtype == object:
+        df["Client"] = df["Client"].astype("category")  # codes entiers + dictionnaire des noms
+    return df
+
+def _downcast(s):
+    # compteurs (quantités, sessions) : float32, exact jusqu'à 2**24 et garde les cellules vides (NaN).
+    # Type fixe quel que soit le contenu : les partitions du store doivent toutes avoir le même schéma.
+    return s.astype("float32") if pd.api.types.is_numeric_dtype(s) else s
+
+@traced
+def _classify_sales(df):
+    df["Groupe"] = classify_services(df["Nom"])
+    return df
+
+def group_service(n, rules=None):
+    x = str(n).lower()
+    for groupe, motifs in (SERVICE_RULES if rules is None else rules):
+        if any(m in x for m in motifs):
+            return groupe
+    return SERVICE_DEFAULT
+
+def service_groups(rules=None):
+    rules = SERVICE_RULES if rules is None else rules
+    return sorted({g for g, _ in rules} | {SERVICE_DEFAULT})
+
+def classify_services(noms, rules=None):
+    """Version vectorisée de group_service : les règles ne sont évaluées que sur les noms distincts
+    (catégories), puis projetées sur toutes les lignes via les codes. Renvoie un Categorical."""
+    rules = SERVICE_RULES if rules is None else rules
+    noms = noms if isinstance(noms.dtype, pd.CategoricalDtype) else noms.astype("category")
+    lower = noms.cat.categories.astype(str).str.lower()
+    groups = service_groups(rules)
+    per_cat = np.full(len(lower), groups.index(SERVICE_DEFAULT), dtype=np.int16)
+    todo = np.ones(len(lower), dtype=bool)
+    for groupe, motifs in rules:
+        hit = todo & np.logical_or.reduce([lower.str.contains(m, regex=False) for m in motifs])
+        per_cat[hit] = groups.index(groupe)
+        todo &= ~hit
+    codes = noms.cat.codes.to_numpy()
+    out = np.where(codes >= 0, per_cat[codes] if len(per_cat) else -1, -1)
+    return pd.Categorical.from_codes(out, categories=groups)
+
+def _sales_dtypes(df):
+    # après concaténation de partitions, les catégories peuvent différer : on réharmonise
+    if "Nom" in df.columns:
+        df["Nom"] = df["Nom"].astype(str).astype("category")
+    if "Groupe" in df.columns:
+        df["Groupe"] = pd.Categorical(df["Groupe"].astype(str), categories=service_groups())
+    if "Client" in df.columns and not pd.api.types.is_numeric_dtype(df["Client"]):
+        df["Client"] = df["Client"].astype(object).astype("category")
     return df
 
+@traced
 def load_attendance_fixed():
+    if _is_multi(ATT_PATH):
+        return _load_sources(ATT_PATH, "attendance", _attendance_dtypes)
     if not os.path.exists(ATT_PATH):
         raise FileNotFoundError("Missing file: data/attendance.xlsx")
-    xls = pd.read_excel(ATT_PATH, sheet_name=None)
-    sheet = None
-    for k in xls.keys():
-        lk = k.lower()
-        if "présence" in lk or "presence" in lk or "attendance" in lk:
-            sheet = k; break
-    if sheet is None:
-        sheet = list(xls.keys())[0]
-    df = xls[sheet].copy()
+    return _cached_frame(ATT_PATH, "attendance", _build_attendance)
 
+def _build_attendance(path):
+    return _normalize_attendance(_read_attendance_sheet(path))
+
+def _read_attendance_sheet(path):
+    return _read_sheet(path, ATT_SHEET_KEYS, ATT_ALIASES)
+
+@traced
+def _normalize_attendance(df):
     # --- DATE ---
-    # élargit la liste d’alias possibles
-    date_alias = [
-        "Date du service","Date","Service Date","Date de séance","Class Date",
-        "Appointment Date","Schedule Date","Jour"
-    ]
-    _ensure_renamed(df, date_alias, "Date", must_exist=False)
+    _ensure_renamed(df, ATT_ALIASES["Date"], "Date", must_exist=False)
     if "Date" in df.columns:
         # si c'est du texte type "2025-08-03" → to_datetime
         df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
         # si tout est NaT mais une autre colonne contient une date, on ne force pas
     # Jour (FR)
     if "Date" in df.columns:
-        df["Jour"] = df["Date"].dt.day_name()
-        mapping = {"Monday":"Lundi","Tuesday":"Mardi","Wednesday":"Mercredi","Thursday":"Jeudi",
-                   "Friday":"Vendredi","Saturday":"Samedi","Sunday":"Dimanche"}
-        df["JourFR"] = df["Jour"].map(mapping)
-        df["JourFR"] = pd.Categorical(df["JourFR"],
-            categories=["Lundi","Mardi","Mercredi","Jeudi","Vendredi","Samedi","Dimanche"],
-            ordered=True)
+        df["Jour"] = df["Date"].dt.day_name().astype("category")
+        df["JourFR"] = df["Date"].dt.dayofweek.map(dict(enumerate(JOURS_FR)))
 
     # --- HEURE / CRÉNEAU ---
-    _ensure_renamed(df, ["Heure du service","Heure","Time","Créneau","Slot","Start Time"], "Heure du service", must_exist=False)
+    _ensure_renamed(df, ATT_ALIASES["Heure du service"], "Heure du service", must_exist=False)
     if "Heure du service" in df.columns:
-        # Essayez de parser une heure; sinon garder string
-        tmp = pd.to_datetime(df["Heure du service"], errors="coerce")
-        df["HeureHM"] = tmp.dt.strftime("%H:%M")
-        if df["HeureHM"].isna().all():
-            df["HeureHM"] = df["Heure du service"].astype(str)
+        # Essayez de parser une heure (datetime, datetime.time ou texte "8:30") ; sinon garder string
+        raw = df["Heure du service"]
+        tmp = pd.to_datetime(raw, errors="coerce")
+        if tmp.isna().all():
+            tmp = pd.to_datetime(raw.astype(str), format="mixed", errors="coerce")
+        if tmp.notna().any():
+            df["HeureHM"] = tmp.dt.strftime("%H:%M")
+            df["Minute"] = (tmp.dt.hour * 60 + tmp.dt.minute).astype("Int16")  # minutes depuis minuit
+            df.drop(columns=["Heure du service"], inplace=True)  # objets Python, remplacés par HeureHM/Minute
+        else:
+            df["HeureHM"] = raw.astype(str)
     else:
         df["HeureHM"] = ""
 
     # --- MÉTRIQUES ---
-    _ensure_renamed(df, ["Nombre total de sessions","Total Sessions","Sessions","Nombre de sessions","Total des sessions"],
-                    "Nombre total de sessions", must_exist=False)
-    _ensure_renamed(df, ["Clients uniques","Unique Clients","Clients","Unique"], "Clients uniques", must_exist=False)
+    _ensure_renamed(df, ATT_ALIASES["Nombre total de sessions"], "Nombre total de sessions", must_exist=False)
+    _ensure_renamed(df, ATT_ALIASES["Clients uniques"], "Clients uniques", must_exist=False)
+    _ensure_renamed(df, ATT_ALIASES["Client"], "Client", must_exist=False)  # exports par visite uniquement
+    for c in ("Nombre total de sessions", "Clients uniques"):
+        if c in df.columns:
+            df[c] = _downcast(df[c])
 
+    return _attendance_dtypes(df)
+
+JOURS_FR = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+
+def _attendance_dtypes(df):
+    # schéma compact, réappliqué après concaténation de partitions (dictionnaires différents)
+    if "JourFR" in df.columns:
+        df["JourFR"] = pd.Categorical(df["JourFR"].astype(object), categories=JOURS_FR, ordered=True)
+    if "Jour" in df.columns:
+        df["Jour"] = df["Jour"].astype(object).astype("category")
+    if "HeureHM" in df.columns:
+        # créneaux dans l'ordre chronologique (l'ordre lexical suffit pour "HH:MM")
+        hm = df["HeureHM"].astype(object).astype("category")
+        df["HeureHM"] = hm.cat.reorder_categories(sorted(hm.cat.categories, key=str))
+    if "Client" in df.columns and not pd.api.types.is_numeric_dtype(df["Client"]):
+        df["Client"] = df["Client"].astype(object).astype("category")
     return df
 
+# ---------- INCREMENTAL STORE ----------
+# Historique normalisé persisté en Parquet partitionné par mois (data/.store/<kind>/month=YYYY-MM/).
+# Un nouvel export fait foi à partir de max(watermark - STORE_LOOKBACK_DAYS, 1er jour de l'export) et pour
+# les lignes sans date. Dans cette fenêtre, lignes stockées et lignes de l'export sont comparées par empreinte
+# (_row_keys) : seules les lignes nouvelles ou corrigées sont classées (finalize) et écrites, les lignes absentes
+# de l'export sont retirées, et seuls les mois où l'un ou l'autre arrive sont réécrits. L'historique antérieur
+# est conservé tel quel. Un autre fichier source (chemin différent) repart d'un store vide.
+_STORE_LOCK = threading.Lock()
+
+def _row_keys(df, cols):
+    """Empreinte uint64 par ligne, stable entre exports (types harmonisés avant hachage).
+    Les lignes identiques sont numérotées (1re, 2e… occurrence) pour ne pas écraser de vrais doublons."""
+    view = pd.DataFrame(index=df.index)
+    for c in cols:
+        col = df[c]
+        if pd.api.types.is_datetime64_any_dtype(col):
+            view[c] = col
+        elif pd.api.types.is_numeric_dtype(col):
+            view[c] = col.astype("float64")
+        else:  # NaN / None / catégorie manquante : même valeur, que la colonne sorte de l'Excel ou du Parquet
+            view[c] = col.astype(str).where(col.notna(), "")
+    fp = pd.util.hash_pandas_object(view, index=False)
+    occ = fp.groupby(fp.values).cumcount()
+    return pd.util.hash_pandas_object(pd.DataFrame({"fp": fp.values, "occ": occ.values}), index=False).values
+
+def _store_manifest(root):
+    try:
+        with open(os.path.join(root, "_manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _store_read(root, columns=None):
+    if not os.path.isdir(root) or not any(n.startswith("month=") for n in os.listdir(root)):
+        return None
+    df = pd.read_parquet(root, columns=columns)
+    return df.drop(columns=["month"], errors="ignore")
+
+def _store_months(df):
+    # partition de chaque ligne : "YYYY-MM", "unknown" sans date
+    if "Date" not in df.columns:
+        return pd.Series("unknown", index=df.index)
+    return df["Date"].dt.strftime("%Y-%m").fillna("unknown")
+
+def _store_append(root, df):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    part = df.copy()
+    part["month"] = _store_months(part)
+    pq.write_to_dataset(pa.Table.from_pandas(part, preserve_index=False), root, partition_cols=["month"],
+                        basename_template=f"part-{time.time_ns()}-{{i}}.parquet")
+
+def _store_replace(root, months, df):
+    """Remplace tout le contenu des partitions `months` (et de celles où tombent les lignes de `df`) par `df`.
+    Écriture dans _staging puis échange de répertoires : un arrêt en cours de route ne mélange pas deux versions."""
+    stage, trash = os.path.join(root, "_staging"), os.path.join(root, "_trash")
+    for d in (stage, trash):
+        shutil.rmtree(d, ignore_errors=True)
+    if len(df):
+        _store_append(stage, df)
+    written = set(os.listdir(stage)) if os.path.isdir(stage) else set()
+    os.makedirs(trash)
+    for name in written | {f"month={m}" for m in months}:
+        if os.path.isdir(os.path.join(root, name)):
+            os.replace(os.path.join(root, name), os.path.join(trash, name))
+        if name in written:
+            os.replace(os.path.join(stage, name), os.path.join(root, name))
+    for d in (stage, trash):
+        shutil.rmtree(d, ignore_errors=True)
+
+@traced
+def _sync_store(kind, path, read, normalize, finalize=None):
+    """Intègre `path` dans le store `kind` et renvoie l'historique complet.
+    read(path) → feuille brute ; normalize(df) → colonnes renommées/parsées (dont Date) ;
+    finalize(df) → colonnes dérivées (ex. Groupe), appliqué aux seules lignes écrites."""
+    root = os.path.join(STORE_DIR, kind)
+    with _STORE_LOCK:
+        manifest = _store_manifest(root)
+        if manifest and (manifest.get("schema") != _schema_tag()
+                         or manifest.get("source", {}).get("path") != os.path.abspath(path)):
+            shutil.rmtree(root, ignore_errors=True)  # normalisation ou fichier source changé → historique reconstruit
+            manifest = None
+        fp = _file_fingerprint(path, known=manifest and manifest.get("source"))
+        if manifest and manifest.get("source", {}).get("sha1") == fp["sha1"]:
+            return _stamp(_store_read(root), f"{kind}-store", fp)  # export déjà intégré : rien à parser
+
+        df = normalize(read(path))
+        written = removed = 0
+        if "Date" not in df.columns or manifest is None or manifest.get("watermark") is None:
+            # 1re intégration, ou rapport agrégé sans date (ex. présences par créneau) : instantané complet
+            shutil.rmtree(root, ignore_errors=True)
+            new = finalize(df.copy()) if finalize is not None and len(df) else df
+            written = len(new)
+            if len(new):
+                os.makedirs(root, exist_ok=True)
+                _store_append(root, new)
+        else:
+            watermark = pd.Timestamp(manifest["watermark"])
+            lo = watermark - pd.Timedelta(days=STORE_LOOKBACK_DAYS)
+            if df["Date"].notna().any():
+                lo = max(lo, df["Date"].min().normalize())  # export partiel : ne couvre qu'à partir de son 1er jour
+            new = df[(df["Date"] >= lo) | df["Date"].isna()]
+            months = [n[len("month="):] for n in os.listdir(root) if n.startswith("month=")
+                      and (n == "month=unknown" or n[len("month="):] >= lo.strftime("%Y-%m"))]
+            old = [pd.read_parquet(os.path.join(root, f"month={m}")) for m in months]
+            old = pd.concat(old, ignore_index=True) if old else None
+            if old is None:
+                gone, added = new.iloc[0:0], new
+            else:
+                window = old[(old["Date"] >= lo) | old["Date"].isna()]
+                old_keys, new_keys = _row_keys(window, list(df.columns)), _row_keys(new, list(df.columns))
+                gone = window[~np.isin(old_keys, new_keys)]     # supprimées ou corrigées dans l'export
+                added = new[~np.isin(new_keys, old_keys)]       # nouvelles ou corrigées
+            if finalize is not None and len(added):
+                added = finalize(added.copy())
+            touched = set(_store_months(gone)) | set(_store_months(added))
+            if touched:
+                keep = old.drop(index=gone.index) if old is not None else added.iloc[0:0]
+                keep = keep[_store_months(keep).isin(touched)]
+                both = pd.concat([keep, added], ignore_index=True) if len(keep) else added
+                cats = {c for f in (keep, added) for c in f.columns if isinstance(f[c].dtype, pd.CategoricalDtype)}
+                for c in cats:  # même schéma dans toutes les partitions (dictionnaires Arrow)
+                    if not isinstance(both[c].dtype, pd.CategoricalDtype):
+                        both[c] = both[c].astype(object).astype("category")
+                _store_replace(root, touched, both)
+            written, removed = len(added), len(gone)
+        hist = _store_read(root)
+        if hist is None:
+            hist = new.iloc[0:0]
+        watermark = hist["Date"].max() if "Date" in hist.columns else None
+        os.makedirs(root, exist_ok=True)
+        tmp = os.path.join(root, "_manifest.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"schema": _schema_tag(), "source": fp, "rows": int(len(hist)),
+                       "written": int(written), "removed": int(removed),
+                       "watermark": None if watermark is None or pd.isna(watermark) else watermark.isoformat()}, f)
+        os.replace(tmp, os.path.join(root, "_manifest.json"))
+        return _stamp(hist, f"{kind}-store", fp)
+
+def _from_store(kind, path, read, normalize, finalize=None, fallback=None, dtypes=None):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return fallback()
+    df = _sync_store(kind, path, read, normalize, finalize)
+    if "Date" in df.columns:
+        df = df.sort_values("Date", kind="mergesort", na_position="last").reset_index(drop=True)
+    return dtypes(df) if dtypes is not None else df
+
+@traced
+def load_sales_store():
+    """Comme load_sales_fixed, mais via le store incrémental : seul le delta du nouvel export est classé/écrit.
+    Plusieurs classeurs : cache par classeur (seuls les nouveaux/modifiés sont parsés), cf. _load_sources."""
+    if _is_multi(SALES_PATH):
+        return load_sales_fixed()
+    if not os.path.exists(SALES_PATH):
+        raise FileNotFoundError("Missing file: data/sales.xlsx")
+    return _from_store("sales", SALES_PATH, _read_sales_sheet, _normalize_sales, _classify_sales,
+                       fallback=load_sales_fixed, dtypes=_sales_dtypes)
+
+@traced
+def load_attendance_store():
+    if _is_multi(ATT_PATH):
+        return load_attendance_fixed()
+    if not os.path.exists(ATT_PATH):
+        raise FileNotFoundError("Missing file: data/attendance.xlsx")
+    return _from_store("attendance", ATT_PATH, _read_attendance_sheet, _normalize_attendance,
+                       fallback=load_attendance_fixed, dtypes=_attendance_dtypes)
+
+# ---------- WORKER POOL ----------
+# Processus de calcul partagés par toutes les sessions, pour le travail lié au GIL (parsing openpyxl, rendu
+# matplotlib). Chaque processus exécute workers.py, point d'entrée dédié : pas de fork d'un processus Streamlit
+# multi-threadé, et pas de spawn multiprocessing, qui réexécuterait la page installée comme __main__.
+# Sans pool (1 CPU, FLEXLAB_WORKERS=1, pool cassé), les appelants travaillent en série. Le pool démarre au 1er
+# travail parallèle, pas au préchauffage : chaque processus coûte ~140 Mo (pandas + matplotlib + utils).
+WORKERS = int(os.environ.get("FLEXLAB_WORKERS", "0")) or None  # None → CPU alloués, plafonnés à WORKERS_MAX
+WORKERS_MAX = 3
+WORKER_TIMEOUT = float(os.environ.get("FLEXLAB_WORKER_TIMEOUT", "600"))  # s sans aucun résultat → pool arrêté
+WORKER_ENTRY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workers.py")
+_WORKER_POOL = []
+_WORKER_POOL_LOCK = threading.Lock()
+
+class WorkerPool:
+    """Processus workers.py persistants ; submit(fn, *args) renvoie un concurrent.futures.Future.
+    Un processus qui meurt ou qui bloque (as_completed) casse le pool : ses tâches et celles en attente échouent
+    en BrokenProcessPool, et worker_pool() en relance un neuf au prochain appel."""
+    def __init__(self, workers):
+        import queue, subprocess
+        self.tasks = queue.Queue()
+        self.broken = False
+        self.lock = threading.Lock()
+        self.procs = []
+        try:
+            for _ in range(workers):
+                self.procs.append(subprocess.Popen([sys.executable, WORKER_ENTRY], stdin=subprocess.PIPE,
+                                                   stdout=subprocess.PIPE))
+        except OSError:  # pas de processus à moitié lancé
+            for proc in self.procs:
+                proc.kill()
+                proc.wait()
+            raise
+        for proc in self.procs:
+            threading.Thread(target=self._serve, args=(proc,), daemon=True, name=f"flexlab-worker-{proc.pid}").start()
+
+    def submit(self, fn, *args):
+        from concurrent.futures import Future
+        from concurrent.futures.process import BrokenProcessPool
+        if self.broken:
+            raise BrokenProcessPool("pool de calcul arrêté")
+        fut = Future()
+        self.tasks.put((fut, fn, args))
+        return fut
+
+    def as_completed(self, futures):
+        """Futures de ce pool au fil de leur achèvement. Aucun résultat pendant WORKER_TIMEOUT s : processus
+        bloqué → pool arrêté et BrokenProcessPool (l'appelant termine en série)."""
+        from concurrent.futures import FIRST_COMPLETED, wait
+        from concurrent.futures.process import BrokenProcessPool
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=WORKER_TIMEOUT, return_when=FIRST_COMPLETED)
+            if not done:
+                self.shutdown()
+                raise BrokenProcessPool(f"aucun résultat du pool de calcul depuis {WORKER_TIMEOUT:g} s")
+            yield from done
+
+    def shutdown(self):
+        with self.lock:
+            if self.broken:
+                return
+            self.broken = True
+        for proc in self.procs:
+            proc.kill()
+            self.tasks.put((None, None, None))  # un par thread : les tâches déjà en file échouent avant
+
+    def _serve(self, proc):
+        import pickle
+        from concurrent.futures.process import BrokenProcessPool
+        while True:
+            fut, fn, args = self.tasks.get()
+            if fut is None:
+                proc.wait()
+                return
+            if not fut.set_running_or_notify_cancel():
+                continue
+            if self.broken:
+                fut.set_exception(BrokenProcessPool("pool de calcul arrêté"))
+                continue
+            try:
+                payload = pickle.dumps((fn, args), pickle.HIGHEST_PROTOCOL)
+            except Exception as e:  # tâche non sérialisable : elle échoue, le processus reste sain
+                fut.set_exception(e)
+                continue
+            try:
+                proc.stdin.write(payload)
+                proc.stdin.flush()
+                ok, out = pickle.load(proc.stdout)
+            except (OSError, EOFError, pickle.UnpicklingError) as e:
+                self.shutdown()
+                fut.set_exception(BrokenProcessPool(f"processus de calcul {proc.pid} arrêté ({e!r})"))
+                continue
+            (fut.set_result if ok else fut.set_exception)(out)
+
+def _cpus():
+    # CPU réellement alloués au processus (cgroups/affinité) : os.cpu_count() compte ceux de l'hôte
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):  # macOS, Windows
+        return os.cpu_count() or 1
+
+def worker_pool():
+    """Pool partagé (démarré au 1er appel), ou None si le travail doit se faire en série."""
+    workers = WORKERS or min(_cpus(), WORKERS_MAX)
+    if workers <= 1:
+        return None
+    with _WORKER_POOL_LOCK:
+        if _WORKER_POOL and _WORKER_POOL[0].broken:
+            _WORKER_POOL.clear()
+        if not _WORKER_POOL:
+            try:
+                _WORKER_POOL.append(WorkerPool(workers))
+            except OSError:
+                return None
+        return _WORKER_POOL[0]
+
+# ---------- MULTI-SOURCE INGESTION ----------
+# Un dossier ou un glob de classeurs : un sous-dossier par studio (classeurs à la racine → STUDIO_DEFAULT).
+# Chaque classeur a son propre cache Arrow ; seuls les nouveaux/modifiés sont parsés, en parallèle dans
+# worker_pool() (openpyxl est lié au GIL). Les lignes présentes dans plusieurs exports d'un même
+# studio (exports qui se chevauchent) ne sont gardées qu'une fois.
+STUDIO_DEFAULT = "Studio principal"
+
+def _is_multi(spec):
+    return os.path.isdir(spec) or any(ch in spec for ch in "*?[")
+
+def _source_files(spec):
+    import glob
+    if os.path.isdir(spec):
+        files = glob.glob(os.path.join(spec, "**", "*.xls*"), recursive=True)
+    else:
+        files = glob.glob(spec, recursive=True)
+    return sorted(f for f in files if os.path.isfile(f) and not os.path.basename(f).startswith("~$"))  # ~$ : verrous Excel
+
+def _studio_of(path, root):
+    parts = os.path.relpath(os.path.abspath(path), root).split(os.sep)
+    return parts[0] if len(parts) > 1 else STUDIO_DEFAULT
+
+def _parse_source(kind, path):
+    # exécuté dans un processus du pool : parsing seul, le cache est écrit par le processus principal
+    return {"sales": _build_sales, "attendance": _build_attendance}[kind](path)
+
+def _cache_fresh(path, kind):
+    arrow_path, meta_path = _cache_paths(path, kind)
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if meta.get("schema") != _schema_tag() or not os.path.exists(arrow_path):
+        return False
+    return _file_fingerprint(path, known=meta)["sha1"] == meta.get("sha1")
+
+@traced
+def _load_sources(spec, kind, dtypes=None):
+    """Concatène les classeurs désignés par `spec`, avec colonnes Studio et Source."""
+    files = _source_files(spec)
+    if not files:
+        raise FileNotFoundError(f"Aucun classeur Excel pour {spec}")
+    root = os.path.abspath(spec) if os.path.isdir(spec) else \
+        os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in files])
+    stale = [f for f in files if not _cache_fresh(f, kind)]
+    parsed = {}
+    pool = worker_pool() if len(stale) > 1 else None
+    if pool is not None:
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            futures = {pool.submit(_parse_source, kind, f): f for f in stale}
+            for fut in pool.as_completed(futures):
+                parsed[futures[fut]] = fut.result()
+        except BrokenProcessPool:  # un processus est mort ou bloqué : le reste est parsé ici
+            pass
+
+    frames, versions = [], []
+    for f in files:
+        df = _cached_frame(f, kind, lambda p: parsed.pop(p) if p in parsed else _parse_source(kind, p))
+        studio = _studio_of(f, root)
+        versions.append(f"{df.attrs.get('version')}:{studio}")
+        df["_key"] = _row_keys(df, list(df.columns))
+        df["Studio"] = studio
+        df["Source"] = os.path.basename(f)
+        frames.append(df)
+    out = pd.concat(frames, ignore_index=True).drop_duplicates(["Studio", "_key"], keep="last")
+    if "Date" in out.columns:
+        out = out.sort_values("Date", kind="mergesort", na_position="last")
+    out = out.drop(columns=["_key"]).reset_index(drop=True)
+    out["Studio"] = out["Studio"].astype("category")
+    out["Source"] = out["Source"].astype("category")
+    if dtypes is not None:
+        out = dtypes(out)
+    out.attrs["version"] = f"{kind}-multi-{hashlib.sha1('|'.join(versions).encode()).hexdigest()[:12]}-{_schema_tag()}"
+    return out
+
+def studios(df):
+    return sorted(df["Studio"].dropna().unique().astype(str)) if "Studio" in df.columns else []
+
+@traced
+def for_studio(df, studio=None):
+    """Lignes d'un studio (None → tous), mémorisées par version de dataset : les cubes et figures
+    dérivés ont leur propre clé par studio et restent en cache quand on change de sélection."""
+    if not studio or "Studio" not in df.columns:
+        return df
+    key = _frame_key(df)
+    key = None if key is None else ("studio", studio) + key
+    def build():
+        sub = df[df["Studio"] == studio].reset_index(drop=True)
+        sub.attrs["version"] = f"{df.attrs.get('version')}|{studio}"
+        return sub
+    return _memo(key, build)
+
+# ---------- DATA SERVICE ----------
+# Un seul exemplaire de chaque dataset chargé pour tout le process : toutes les pages et sessions partagent
+# le même DataFrame, en LECTURE SEULE (filtrer/dériver avec for_studio, sales_window… jamais modifier en place).
+# Un thread surveille les classeurs sources (taille/mtime, toutes les WATCH_INTERVAL s) et ne recharge que le
+# dataset dont un fichier a changé (en mode dossier, seul le classeur modifié est reparsé, cf. _load_sources).
+# Le nouveau DataFrame remplace l'ancien d'un bloc une fois prêt ; les lecteurs servent l'ancien jusque-là.
+# Seuls les agrégats/figures dérivés de l'ancienne version sont ensuite oubliés.
+WATCH_INTERVAL = float(os.environ.get("FLEXLAB_WATCH_INTERVAL", "5"))  # 0 → pas de surveillance
+_DATASET_LOADERS = {"sales": "load_sales_store", "attendance": "load_attendance_store"}
+_DATASETS = {}  # kind → {"df", "sig", "loaded_at", "error"}
+_DATASET_LOCKS = {k: threading.Lock() for k in _DATASET_LOADERS}
+_WATCHER = []
+_WATCHER_LOCK = threading.Lock()
+
+def _source_sig(kind):
+    spec = SALES_PATH if kind == "sales" else ATT_PATH
+    files = _source_files(spec) if _is_multi(spec) else [spec]
+    sig = []
+    for f in files:
+        try:
+            st_ = os.stat(f)
+            sig.append((f, st_.st_size, st_.st_mtime_ns))
+        except OSError:
+            sig.append((f, None, None))
+    return tuple(sig)
+
+def _reload(kind, force=False):
+    """Recharge `kind` si ses sources ont changé (ou `force`) et publie la nouvelle version.
+    Renvoie True si le dataset publié a changé de version."""
+    with _DATASET_LOCKS[kind]:
+        cur = _DATASETS.get(kind)
+        sig = _source_sig(kind)
+        if cur is not None and cur["sig"] == sig and not force:
+            return False
+        try:
+            df = globals()[_DATASET_LOADERS[kind]]()
+        except Exception as e:
+            if cur is None:
+                raise
+            _DATASETS[kind] = dict(cur, sig=sig, error=f"{type(e).__name__}: {e}")  # on garde l'ancienne version
+            return False
+        old = cur and cur["df"].attrs.get("version")
+        _DATASETS[kind] = {"df": df, "sig": sig, "loaded_at": time.strftime("%H:%M:%S"), "error": None}
+    changed = old != df.attrs.get("version")
+    if old and changed:
+        forget_version(old)
+    return changed
+
+def _watch():
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        for kind in list(_DATASETS):
+            try:
+                _reload(kind)
+            except Exception:
+                pass  # erreur déjà consignée dans _DATASETS[kind]["error"]
+
+def shared_frame(kind):
+    """DataFrame `kind` ("sales" | "attendance") partagé entre sessions ; chargé au 1er appel,
+    puis tenu à jour en tâche de fond par le watcher."""
+    cur = _DATASETS.get(kind)
+    if cur is None:
+        _reload(kind)
+        cur = _DATASETS[kind]
+        if WATCH_INTERVAL > 0 and not _WATCHER:
+            with _WATCHER_LOCK:
+                if not _WATCHER:
+                    _WATCHER.append(threading.Thread(target=_watch, name="flexlab-watcher", daemon=True))
+                    _WATCHER[0].start()
+    return cur["df"]
+
+def refresh_data(kind):
+    """Bouton « Rafraîchir » : revérifie tout de suite les sources de `kind` (et seulement elles).
+    Renvoie True si une nouvelle version a été publiée."""
+    try:
+        if INGEST_MODE == "stream":
+            old = _STREAMED.get(kind)
+            return streamed(kind) is not (old and old[1])
+        return _reload(kind)
+    except Exception:
+        return False  # 1er chargement impossible : shared_frame() remontera l'erreur à la page
+
+def dataset_status(kind):
+    cur = _DATASETS.get(kind)
+    return None if cur is None else {k: v for k, v in cur.items() if k != "df"} | {"version": cur["df"].attrs.get("version")}
+
+def _mentions(key, version):
+    if isinstance(key, str):
+        return key == version or key.startswith(version + "|")  # "|studio" : sous-ensembles de for_studio
+    if isinstance(key, tuple):
+        return any(_mentions(k, version) for k in key)
+    return False
+
+def forget_version(version):
+    """Oublie les agrégats mémorisés, les figures en mémoire et les résultats SQL dérivés de la version `version`."""
+    with _FIGS_LOCK:
+        figs = {k for k, dk in _FIG_DEPS.items() if _mentions(dk, version)}
+        for k in figs:
+            _FIGS.pop(k, None); _FIG_DEPS.pop(k, None)
+    with _MEMO_LOCK:
+        for k in [k for k in _MEMO if _mentions(k, version) or (k[:1] == ("vega",) and k[1] in figs)]:
+            del _MEMO[k]
+    with _SQL_LOCK:
+        for k in [k for k in _SQL_CACHE if _mentions(k, version)]:
+            del _SQL_CACHE[k]
+
+# ---------- VERSIONED MEMO ----------
+# Objets dérivés (cubes, index…) calculés une fois par version de dataset et partagés entre pages/reruns.
+MEMO_SIZE = 32
+_MEMO = OrderedDict()
+_MEMO_LOCK = threading.Lock()
+
+def _frame_key(df):
+    """Clé d'un DataFrame chargé : version source + colonnes + taille + hash de l'index (un filtre
+    ou une sélection de colonnes change la clé ; les valeurs, elles, sont supposées non modifiées)."""
+    v = df.attrs.get("version")
+    if v is None:
+        return None
+    return (v, tuple(df.columns), len(df), int(pd.util.hash_pandas_object(df.index, index=False).sum()))
+
+def _memo(key, build):
+    if key is None:
+        return build()
+    with _MEMO_LOCK:
+        if key in _MEMO:
+            _MEMO.move_to_end(key)
+            _count("memo", "hits")
+            return _MEMO[key]
+    _count("memo", "misses")
+    val = build()
+    with _MEMO_LOCK:
+        _MEMO[key] = val
+        while len(_MEMO) > MEMO_SIZE:
+            _MEMO.popitem(last=False)
+    return val
+
+# ---------- DISTINCT CLIENT INDEX ----------
+# Mode de comptage des clients uniques : "exact", "hll" (HyperLogLog) ou "auto" (HLL au-delà de HLL_AUTO_VISITS)
+CLIENT_COUNT_MODE = os.environ.get("FLEXLAB_CLIENT_COUNT", "exact").strip().lower()
+if CLIENT_COUNT_MODE not in ("exact", "hll", "auto"):
+    raise ValueError(f"FLEXLAB_CLIENT_COUNT={CLIENT_COUNT_MODE!r} : valeurs possibles exact, hll, auto")
+HLL_AUTO_VISITS = 5_000_000
+HLL_P = 12  # 4096 registres → erreur type ≈ 1.04/√4096 ≈ 1.6 %
+
+def _week_end(day):
+    # libellé W-MON (semaine close à droite, étiquetée par son lundi de fin) — identique à pd.Grouper(freq="W-MON")
+    return day + pd.to_timedelta((0 - day.dt.weekday) % 7, unit="D")
+
+def _period_end(day, grain):
+    # libellé de période identique à resample(GRAINS[grain][0]) : jour, lundi de fin de semaine, fin de mois
+    if grain == "W":
+        return _week_end(day)
+    if grain == "M":
+        return day + pd.offsets.MonthEnd(0)
+    return day
+
+def _bit_length(x):
+    # nombre de bits significatifs de chaque uint64 (vectorisé, sans passer par les flottants)
+    x = x.copy(); n = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+def _splitmix64(codes):
+    z = codes.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def _hll_estimate(registers):
+    m = registers.shape[-1]
+    est = (0.7213 / (1 + 1.079 / m)) * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int((registers == 0).sum())
+    if est <= 2.5 * m and zeros:
+        est = m * np.log(m / zeros)  # correction petites cardinalités
+    return int(round(est))
+
+class ClientIndex:
+    """Ensembles de clients par jour, stockés en CSR (jours triés, codes clients entiers triés par jour).
+    Le nombre de clients uniques d'une fenêtre quelconque est une union de tranches contiguës ;
+    les sketches HyperLogLog par jour (construits à la demande) donnent le mode approximatif."""
+    def __init__(self, days, indptr, codes, n_clients, undated):
+        self.days = days          # datetime64[ns], jours distincts triés
+        self.indptr = indptr      # codes[indptr[i]:indptr[i+1]] = clients du jour i
+        self.codes = codes
+        self.n_clients = n_clients
+        self.undated = undated    # clients n'apparaissant que sur des lignes sans date
+
+    @classmethod
+    def from_pairs(cls, day, client):
+        day = np.asarray(day, dtype="datetime64[ns]"); client = np.asarray(client, dtype=np.int64)
+        n_clients = int(client.max()) + 1 if len(client) else 0
+        dated = ~np.isnat(day)
+        d, c = day[dated], client[dated]
+        order = np.lexsort((c, d))
+        d, c = d[order], c[order]
+        keep = np.ones(len(d), dtype=bool)
+        keep[1:] = (d[1:] != d[:-1]) | (c[1:] != c[:-1])
+        d, c = d[keep], c[keep]
+        days, start = np.unique(d, return_index=True)
+        return cls(days, np.append(start, len(d)), c.astype(np.int32), n_clients, np.unique(client[~dated]))
+
+    def _span(self, date_min=None, date_max=None):
+        lo = 0 if date_min is None else np.searchsorted(self.days, np.datetime64(pd.Timestamp(date_min), "ns"), "left")
+        hi = len(self.days) if date_max is None else np.searchsorted(self.days, np.datetime64(pd.Timestamp(date_max), "ns"), "right")
+        return lo, hi
+
+    def count(self, date_min=None, date_max=None, approx=False):
+        """Clients uniques sur [date_min, date_max] ; sans bornes, les lignes non datées sont incluses."""
+        lo, hi = self._span(date_min, date_max)
+        everything = date_min is None and date_max is None
+        if approx:
+            regs = self.hll[lo:hi].max(axis=0) if hi > lo else np.zeros(1 << HLL_P, dtype=np.uint8)
+            if everything and len(self.undated):
+                regs = np.maximum(regs, self._hll_rows(np.zeros(len(self.undated), dtype=np.int64), self.undated, 1)[0])
+            return _hll_estimate(regs)
+        seen = np.zeros(self.n_clients, dtype=bool)
+        seen[self.codes[self.indptr[lo]:self.indptr[hi]]] = True
+        if everything:
+            seen[self.undated] = True
+        return int(seen.sum())
+
+    @cached_property
+    def _entry_periods(self):
+        return {}
+
+    def _entry_period(self, grain):
+        # libellé de période de chaque entrée (jour, client), trié comme les jours
+        if grain not in self._entry_periods:
+            day = pd.Series(np.repeat(self.days, np.diff(self.indptr)))
+            self._entry_periods[grain] = _period_end(day, grain).values.astype("datetime64[ns]")
+        return self._entry_periods[grain]
+
+    def count_by_period(self, date_min=None, date_max=None, grain="W", approx=False):
+        """Clients uniques par période (cf. GRAINS ; périodes observées uniquement, à réindexer par l'appelant)."""
+        lo, hi = self._span(date_min, date_max)
+        a, b = self.indptr[lo], self.indptr[hi]
+        if b <= a:
+            return pd.Series(dtype=np.int64)
+        periods = self._entry_period(grain)[a:b]
+        first = np.ones(len(periods), dtype=bool)
+        first[1:] = periods[1:] != periods[:-1]
+        labels, row = periods[first], np.cumsum(first) - 1  # entrées déjà triées par jour, donc par période
+        if approx:
+            regs = self._hll_rows(row, self.codes[a:b], len(labels))
+            vals = [_hll_estimate(r) for r in regs]
+            return pd.Series(vals, index=pd.DatetimeIndex(labels))
+        n = max(self.n_clients, 1)
+        counts = np.bincount(np.unique(row * n + self.codes[a:b]) // n, minlength=len(labels))
+        return pd.Series(counts, index=pd.DatetimeIndex(labels))
+
+    def _hll_rows(self, row, codes, n_rows):
+        h = _splitmix64(codes)
+        tail_bits = 64 - HLL_P
+        reg = (h >> np.uint64(tail_bits)).astype(np.int64)
+        tail = h & np.uint64((1 << tail_bits) - 1)
+        rho = (tail_bits - _bit_length(tail) + 1).astype(np.uint8)
+        out = np.zeros((n_rows, 1 << HLL_P), dtype=np.uint8)
+        np.maximum.at(out.reshape(-1), row * (1 << HLL_P) + reg, rho)
+        return out
+
+    @cached_property
+    def hll(self):
+        """Registres HyperLogLog par jour (jours × 2^HLL_P, uint8) : union d'une fenêtre = max par colonne."""
+        row = np.repeat(np.arange(len(self.days)), np.diff(self.indptr))
+        return self._hll_rows(row, self.codes, len(self.days))
+
+    def __len__(self):
+        return len(self.codes)
+
+# ---------- ROLLUP CUBE ----------
+class SalesCube:
+    """Agrégats ventes construits en un seul passage sur les lignes brutes, partagés par tous les KPIs/graphes.
+    daily   : Date (jour ; NaT = ventes non datées) × Groupe → qty, rev, clients
+    visits  : triplets distincts (Date, Groupe, client) codés en entiers (None sans colonne Client)
+    clients : ClientIndex des clients par jour, partagé par tous les sous-cubes (fenêtres de dates)
+    """
+    def __init__(self, daily, visits, key=None, clients=None, window=(None, None)):
+        self.daily = daily
+        self._visits = visits
+        self.key = key
+        self.window = window
+        if clients is None and visits is not None:
+            clients = ClientIndex.from_pairs(visits["Date"].values, visits["client"].values)
+        self.clients = clients
+
+    @classmethod
+    @traced
+    def from_frame(cls, df, key=None):
+        return cls._assemble(*cls._parts(df), key)
+
+    @staticmethod
+    def _parts(df, codes=None):
+        # (jour × Groupe → qty, rev) et triplets distincts (jour, Groupe, client) ; `codes` : clients déjà codés
+        day = df["Date"].dt.normalize()
+        groupe = df["Groupe"] if isinstance(df["Groupe"].dtype, pd.CategoricalDtype) else \
+            pd.Categorical(df["Groupe"].astype(str), categories=service_groups())
+        base = pd.DataFrame({"Date": day.values, "Groupe": groupe,
+                             "qty": df["Quantité"].values, "rev": df["Montant total"].values})
+        daily = base.groupby(["Date", "Groupe"], observed=True, dropna=False).agg(
+            qty=("qty", "sum"), rev=("rev", "sum")).reset_index()
+        visits = None
+        if "Client" in df.columns:
+            if codes is None:
+                codes, _ = pd.factorize(df["Client"])
+            v = pd.DataFrame({"Date": day.values, "Groupe": groupe, "client": codes.astype(np.int32)})
+            visits = v[v["client"] >= 0].drop_duplicates(ignore_index=True)
+        return daily, visits
+
+    @classmethod
+    def _assemble(cls, daily, visits, key=None):
+        if visits is not None:
+            n = visits.groupby(["Date", "Groupe"], observed=True, dropna=False).size().rename("clients")
+            daily = daily.join(n, on=["Date", "Groupe"])
+        daily["clients"] = daily.get("clients", pd.Series(0, index=daily.index)).fillna(0).astype(int)
+        return cls(daily, visits, key)
+
+    @classmethod
+    @traced
+    def from_chunks(cls, chunks, key=None):
+        """Même cube que from_frame, replié morceau par morceau (DataFrames normalisés) : seuls les agrégats
+        jour × Groupe de chaque morceau, les triplets distincts et le dictionnaire des clients restent en mémoire.
+        Triplets tenus en int64 triés (jour | Groupe | client) : chaque morceau y est fusionné (np.union1d),
+        sans reconcaténer ni redédoublonner les précédents ; agrégats jour × Groupe regroupés une fois à la fin."""
+        dailies, keys = [], None
+        ids = {}     # client → code entier, commun à tous les morceaux
+        groups = {}  # Groupe → code entier (ordre du 1er morceau)
+        for df in chunks:
+            codes = None
+            if "Client" in df.columns:
+                cl = df["Client"] if isinstance(df["Client"].dtype, pd.CategoricalDtype) else df["Client"].astype("category")
+                glob = np.array([ids.setdefault(c, len(ids)) for c in cl.cat.categories], dtype=np.int64)
+                cc = cl.cat.codes.to_numpy()
+                codes = np.where(cc >= 0, glob[cc] if len(glob) else -1, -1)
+            d, v = cls._parts(df, codes)
+            dailies.append(d)
+            if v is not None:
+                g = np.array([groups.setdefault(c, len(groups)) for c in v["Groupe"].cat.categories], dtype=np.int64)
+                packed = cls._pack(v["Date"].values, g[v["Groupe"].cat.codes.to_numpy()], v["client"].to_numpy())
+                keys = np.unique(packed) if keys is None else np.union1d(keys, packed)
+        if not dailies:
+            raise ValueError("Aucune ligne de ventes lue")
+        daily = pd.concat(dailies, ignore_index=True).groupby(
+            ["Date", "Groupe"], observed=True, dropna=False, as_index=False)[["qty", "rev"]].sum()
+        daily = daily.sort_values(["Date", "Groupe"], na_position="last", ignore_index=True)
+        visits = None
+        if keys is not None:
+            day, g, client = cls._unpack(keys)
+            labels = np.array(list(groups), dtype=object)[g]
+            cats = daily["Groupe"].cat.categories if isinstance(daily["Groupe"].dtype, pd.CategoricalDtype) else None
+            groupe = pd.Categorical(labels, categories=cats if cats is not None and set(groups) <= set(cats) else None)
+            visits = pd.DataFrame({"Date": day, "Groupe": groupe, "client": client})
+        return cls._assemble(daily, visits, key)
+
+    # triplet (jour, Groupe, client) → int64 : jour décalé sur 23 bits (0 = non daté), Groupe 8 bits, client 32 bits
+    _DAY0 = 1 << 22
+
+    @classmethod
+    def _pack(cls, dates, groups, clients):
+        days = dates.astype("datetime64[D]").astype(np.int64)
+        days = np.where(np.isnat(dates), 0, days + cls._DAY0)
+        return (days << 40) | (groups.astype(np.int64) << 32) | clients.astype(np.int64)
+
+    @classmethod
+    def _unpack(cls, keys):
+        days = keys >> 40
+        dates = (days - cls._DAY0).astype("datetime64[D]").astype("datetime64[ns]")
+        dates[days == 0] = np.datetime64("NaT")
+        return dates, ((keys >> 32) & 0xFF).astype(np.int64), (keys & 0xFFFFFFFF).astype(np.int32)
+
+    @property
+    def has_client(self):
+        return self.clients is not None
+
+    @property
+    def approx(self):
+        """True si les clients uniques sont estimés par HyperLogLog (cf. CLIENT_COUNT_MODE)."""
+        if not self.has_client or CLIENT_COUNT_MODE == "exact":
+            return False
+        return CLIENT_COUNT_MODE == "hll" or len(self.clients) > HLL_AUTO_VISITS
+
+    @cached_property
+    def visits(self):
+        # triplets de la fenêtre, filtrés seulement si un graphe par client/groupe les demande
+        v, (lo, hi) = self._visits, self.window
+        if v is None or (lo is None and hi is None):
+            return v
+        lo = pd.Timestamp(lo) if lo is not None else pd.Timestamp.min
+        hi = pd.Timestamp(hi) if hi is not None else pd.Timestamp.max
+        return v[(v["Date"] >= lo) & (v["Date"] <= hi)].reset_index(drop=True)
+
+    def slice(self, date_min=None, date_max=None):
+        """Sous-cube sur [date_min, date_max] (jours inclus) ; les ventes non datées sont exclues."""
+        if date_min is None and date_max is None:
+            return self
+        def build():
+            lo = pd.Timestamp(date_min) if date_min is not None else pd.Timestamp.min
+            hi = pd.Timestamp(date_max) if date_max is not None else pd.Timestamp.max
+            d = self.daily[(self.daily["Date"] >= lo) & (self.daily["Date"] <= hi)].reset_index(drop=True)
+            return SalesCube(d, self._visits, key, clients=self.clients, window=(date_min, date_max))
+        key = None if self.key is None else self.key + ("slice", str(date_min), str(date_max))
+        return _memo(key, build)
+
+    # --- totaux ---
+    def total(self, col):
+        return self.daily[col].sum()
+
+    def groupe_totals(self, col):
+        return self.daily.groupby("Groupe", observed=True)[col].sum()
+
+    def unique_clients(self):
+        return self.clients.count(*self.window, approx=self.approx) if self.has_client else 0
+
+    # --- séries temporelles (mêmes index que pd.Grouper sur les lignes brutes) ---
+    def day_totals(self, col, groupe=None):
+        d = self.daily if groupe is None else self.daily[self.daily["Groupe"] == groupe]
+        return d.groupby(pd.Grouper(key="Date", freq="D"))[col].sum()
+
+    def period_totals(self, col, grain="W", groupe=None):
+        d = self.day_totals(col, groupe)
+        return d if grain == "D" else d.resample(GRAINS[grain][0]).sum()
+
+    @cached_property
+    def _periods(self):
+        return {}
+
+    @traced
+    def periods(self, grain="W"):
+        """Période × Groupe → qty, rev, clients (combinaisons observées uniquement)."""
+        if grain in self._periods:
+            return self._periods[grain]
+        w = self.daily.groupby([pd.Grouper(key="Date", freq=GRAINS[grain][0]), "Groupe"], observed=True).agg(
+            qty=("qty", "sum"), rev=("rev", "sum")).reset_index()
+        if self.has_client:
+            v = self.visits.dropna(subset=["Date"])
+            n = v.assign(Date=_period_end(v["Date"], grain)).drop_duplicates(["Date", "Groupe", "client"]) \
+                 .groupby(["Date", "Groupe"], observed=True).size().rename("clients")
+            w = w.join(n, on=["Date", "Groupe"])
+        w["clients"] = w.get("clients", pd.Series(0, index=w.index)).fillna(0).astype(int)
+        return self._periods.setdefault(grain, w)
+
+    @property
+    def weekly(self):
+        return self.periods("W")
+
+    def period_clients(self, grain="W"):
+        """Clients uniques par période, tous groupes confondus, sur toute la plage (0 si vide)."""
+        idx = self.period_totals("rev", grain).index
+        if not self.has_client:
+            return pd.Series(0, index=idx, name="Client")
+        n = self.clients.count_by_period(*self.window, grain=grain, approx=self.approx)
+        return n.reindex(idx, fill_value=0).rename("Client")
+
+    def grain(self, grain="auto", finest="D"):
+        """Granularité effective : `grain` imposé, ou la plus fine à partir de `finest` ("auto") ;
+        dans les deux cas relevée tant que la série dépasserait MAX_PERIODS éléments."""
+        dates = self.daily["Date"].dropna()
+        span = (dates.max() - dates.min()).days + 1 if len(dates) else 0
+        order = list(GRAINS)
+        start = order.index(finest if grain == "auto" else grain)
+        for g in order[start:]:
+            if span / GRAINS[g][2] <= MAX_PERIODS:
+                return g
+        return order[-1]
+
+    @cached_property
+    def journey(self):
+        """Parcours client (ClientJourney) de la fenêtre ; None sans colonne Client."""
+        return ClientJourney.from_visits(self.visits) if self.has_client else None
+
+@traced
+def sales_cube(data):
+    """Cube des ventes pour `data` (DataFrame normalisé ou SalesCube), mémorisé par version de dataset."""
+    if isinstance(data, SalesCube):
+        return data
+    key = _frame_key(data)
+    key = None if key is None else ("sales_cube",) + key
+    return _memo(key, lambda: SalesCube.from_frame(data, key))
+
+@traced
+def sales_window(df, date_min=None, date_max=None):
+    """Cube des ventes restreint à la fenêtre de dates choisie (filtre appliqué au cube, pas aux lignes)."""
+    return sales_cube(df).slice(date_min, date_max)
+
+# ---------- ATTENDANCE SLOT INDEX ----------
+ATT_METRICS = ("Nombre total de sessions", "Clients uniques")
+
+class SlotIndex:
+    """Présences pré-agrégées en un passage, partagées par heatmap / top créneaux / hebdo / occupation.
+    cells   : métrique → tableau dense (semaines, jour 0=lundi, créneau) des lignes datées
+    undated : métrique → total par créneau des lignes sans date (rapports agrégés par créneau)
+    slots   : minutes depuis minuit (None si les heures n'ont pas pu être lues), labels : "HH:MM" triés
+    Une fenêtre de dates et/ou une sélection de jours se traduit en masque (semaines, 7) : aucun re-groupement.
+    """
+    def __init__(self, cells, undated, labels, slots, start, first, last, columns, key=None,
+                 window=(None, None), weekdays=None):
+        self.cells, self.undated = cells, undated
+        self.labels, self.slots = labels, slots
+        self.start, self.first, self.last = start, first, last
+        self.columns = columns
+        self.key = key
+        self.window, self.weekdays = window, weekdays
+
+    @classmethod
+    @traced
+    def from_frame(cls, df, key=None):
+        metrics = [m for m in ATT_METRICS if m in df.columns]
+        if "Minute" in df.columns:
+            mins = df["Minute"].to_numpy(dtype="float64", na_value=np.nan)
+            slots = np.unique(mins[~np.isnan(mins)]).astype(np.int16)
+            slot = np.where(np.isnan(mins), -1, np.searchsorted(slots, np.nan_to_num(mins)))
+            labels = [f"{m // 60:02d}:{m % 60:02d}" for m in slots.tolist()]
+        elif "HeureHM" in df.columns:
+            hm = df["HeureHM"].astype("category")
+            slots, slot, labels = None, hm.cat.codes.to_numpy(), [str(c) for c in hm.cat.categories]
+        else:
+            slots, slot, labels = None, np.full(len(df), -1), []
+        n = len(labels)
+        vals = {m: df[m].to_numpy(dtype="float64", na_value=0.0) for m in metrics}
+        start = first = last = None
+        cells, undated = {}, {}
+        dated = np.zeros(len(df), dtype=bool)
+        if "Date" in df.columns and pd.api.types.is_datetime64_any_dtype(df["Date"]):
+            day = df["Date"].dt.normalize()
+            dated = day.notna().to_numpy()
+            if dated.any():
+                first, last = day.min(), day.max()
+                start = first - pd.Timedelta(days=first.weekday())
+                offset = ((day[dated] - start).dt.days).to_numpy()
+                weeks = int(offset.max()) // 7 + 1
+                ok = slot[dated] >= 0
+                flat = offset[ok] * n + slot[dated][ok]  # (semaine*7 + jour) * n + créneau
+                for m in metrics:
+                    cells[m] = np.bincount(flat, weights=vals[m][dated][ok], minlength=weeks * 7 * n).reshape(weeks, 7, n)
+                cells["_rows"] = np.bincount(flat, minlength=weeks * 7 * n).reshape(weeks, 7, n)
+        loose = ~dated & (slot >= 0)
+        for m in metrics:
+            undated[m] = np.bincount(slot[loose], weights=vals[m][loose], minlength=n)
+        undated["_rows"] = np.bincount(slot[loose], minlength=n)
+        return cls(cells, undated, labels, slots, start, first, last, frozenset(df.columns), key)
+
+    @classmethod
+    @traced
+    def from_chunks(cls, chunks, key=None):
+        """Même index que from_frame, replié morceau par morceau : il ne retient que des sommes par
+        (jour, créneau), donc chaque morceau est réduit à ces sommes avant d'être cumulé."""
+        acc = None
+        for df in chunks:
+            df = df.assign(**{"Date": df["Date"].dt.normalize()} if "Date" in df.columns else {},
+                           **{"HeureHM": df["HeureHM"].astype(str)} if "HeureHM" in df.columns else {})
+            df = df if acc is None else pd.concat([acc, df], ignore_index=True)
+            by = [c for c in ("Date", "Minute", "HeureHM") if c in df.columns]
+            acc = df.groupby(by, observed=True, dropna=False, as_index=False)[
+                [m for m in ATT_METRICS if m in df.columns]].sum()
+        if acc is None:
+            raise ValueError("Aucune ligne de présence lue")
+        return cls.from_frame(_attendance_dtypes(acc), key)
+
+    @property
+    def dated(self):
+        return self.start is not None
+
+    @cached_property
+    def mask(self):
+        """(semaines, 7) : jours dans les données, la fenêtre et la sélection de jours."""
+        if not self.dated:
+            return None
+        weeks = next(iter(self.cells.values())).shape[0]
+        day = self.start + pd.to_timedelta(np.arange(weeks * 7), unit="D")
+        lo, hi = self.window
+        m = (day >= self.first) & (day <= self.last)
+        if lo is not None:
+            m &= day >= pd.Timestamp(lo)
+        if hi is not None:
+            m &= day <= pd.Timestamp(hi)
+        if self.weekdays is not None:
+            m &= np.isin(day.weekday, list(self.weekdays))
+        return np.asarray(m).reshape(weeks, 7)
+
+    def slice(self, date_min=None, date_max=None, weekdays=None):
+        """Sous-index : jours inclus entre date_min et date_max, jours de semaine (0=lundi) dans `weekdays`.
+        Les lignes sans date d'un fichier daté n'appartiennent à aucune fenêtre : elles ne comptent que sans filtre."""
+        weekdays = None if weekdays is None or len(weekdays) in (0, 7) else tuple(sorted(weekdays))
+        if not self.dated or (date_min is None and date_max is None and weekdays is None):
+            return self  # sans dates, aucun filtre n'a de sens
+        key = None if self.key is None else self.key + ("slice", str(date_min), str(date_max), weekdays)
+        return _memo(key, lambda: SlotIndex(self.cells, self.undated, self.labels, self.slots, self.start,
+                                            self.first, self.last, self.columns, key, (date_min, date_max), weekdays))
+
+    @property
+    def filtered(self):
+        return self.window != (None, None) or self.weekdays is not None
+
+    def _masked(self, metric):
+        return self.cells[metric] * self.mask[:, :, None]
+
+    def day_slot(self, metric):
+        """Jour (Lundi…Dimanche) × créneau ; jours/créneaux sans aucune ligne retirés (comme un pivot)."""
+        seen = self._masked("_rows").sum(axis=0)
+        P = pd.DataFrame(self._masked(metric).sum(axis=0), index=JOURS_FR, columns=self.labels)
+        return P.loc[seen.any(axis=1), seen.any(axis=0)]
+
+    def slot_totals(self, metric):
+        """Total par créneau (lignes sans date comprises hors filtre), créneaux présents uniquement."""
+        tot, seen = np.zeros(len(self.labels)), np.zeros(len(self.labels), dtype=bool)
+        if self.dated:
+            tot += self._masked(metric).sum(axis=(0, 1)); seen |= self._masked("_rows").sum(axis=(0, 1)) > 0
+        if not self.filtered:
+            tot += self.undated[metric]; seen |= self.undated["_rows"] > 0
+        return pd.Series(tot, index=self.labels)[seen]
+
+    def daily(self, metric):
+        """Total par jour calendaire (jours vides = 0), restreint à la fenêtre et aux jours sélectionnés."""
+        v = self.cells[metric].sum(axis=2).ravel()
+        day = self.start + pd.to_timedelta(np.arange(v.size), unit="D")
+        keep = self.mask.ravel()
+        return pd.Series(v[keep], index=day[keep])
+
+    def weekly(self, metric):
+        """Total par semaine (libellé W-MON, comme pd.Grouper(freq="W-MON")), semaines vides = 0."""
+        s = self.daily(metric)
+        return s.groupby(_week_end(s.index.to_series())).sum().asfreq("W-MON", fill_value=0)
+
+def slot_index(data):
+    """SlotIndex de `data` (DataFrame de présences normalisé ou SlotIndex), mémorisé par version de dataset."""
+    if isinstance(data, SlotIndex):
+        return data
+    key = _frame_key(data)
+    key = None if key is None else ("slot_index",) + key
+    return _memo(key, lambda: SlotIndex.from_frame(data, key))
+
+@traced
+def attendance_window(att, date_min=None, date_max=None, weekdays=None):
+    """Index des présences restreint à la fenêtre de dates et aux jours de semaine choisis (0=lundi)."""
+    return slot_index(att).slice(date_min, date_max, weekdays)
+
+# ---------- STREAMING INGESTION ----------
+# Mode FLEXLAB_INGEST=stream, pour les historiques qui ne tiennent pas en mémoire : les lignes sont lues par
+# morceaux (openpyxl en lecture seule, ou pd.read_csv(chunksize) pour les exports CSV), normalisées avec les
+# mêmes alias et règles de Groupe que les loaders, puis repliées aussitôt dans le cube ventes / l'index des
+# créneaux. La mémoire dépend du nombre de jours × créneaux × clients distincts, pas du nombre de lignes.
+# Ni DataFrame de lignes, ni cache Arrow, ni store : cohortes, MRR et fiches clients ne sont pas disponibles,
+# et en mode dossier les lignes répétées d'un export à l'autre ne sont pas dédoublonnées.
+INGEST_MODE = os.environ.get("FLEXLAB_INGEST", "frame")  # "frame" (DataFrame partagé) ou "stream"
+STREAM_CHUNK_ROWS = int(os.environ.get("FLEXLAB_STREAM_CHUNK", "50000"))
+_STREAMED = {}  # kind → (signature des sources, SalesCube | SlotIndex)
+_STREAMED_LOCKS = {"sales": threading.Lock(), "attendance": threading.Lock()}
+
+def _csv_sep(path):
+    with open(path, encoding="utf-8-sig") as f:
+        line = f.readline()
+    return ";" if line.count(";") > line.count(",") else ","  # exports FR : point-virgule
+
+def _stream_sheet(path, sheet_keys, aliases, fuzzy=None, text_cols=(), chunk_rows=None):
+    """Comme _read_sheet, mais générateur de DataFrames d'au plus `chunk_rows` lignes."""
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    if path.lower().endswith(".csv"):
+        sep = _csv_sep(path)
+        header = [str(c) for c in pd.read_csv(path, sep=sep, nrows=0, encoding="utf-8-sig").columns]
+        usecols = _project_columns(header, aliases, fuzzy)
+        yield from pd.read_csv(path, sep=sep, usecols=usecols, encoding="utf-8-sig", chunksize=chunk_rows,
+                               dtype={c: str for c in usecols if c in text_cols})
+        return
+
+    from operator import itemgetter
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[_pick_sheet(wb.sheetnames, sheet_keys)]
+        rows = ws.iter_rows(values_only=True)
+        raw_header = next(rows, ())
+        header = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(raw_header)]
+        usecols = _project_columns(header, aliases, fuzzy)
+        if not usecols:
+            return
+        idx = [header.index(c) for c in usecols]
+        get = itemgetter(*idx) if len(idx) > 1 else (lambda r, i=idx[0]: (r[i],))
+        width = max(idx) + 1
+        batch = []
+        for r in rows:
+            if any(v is not None for v in r):
+                batch.append(get(r if len(r) >= width else r + (None,) * (width - len(r))))
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame.from_records(batch, columns=usecols)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=usecols)
+    finally:
+        wb.close()
+
+def _sales_chunks(files, chunk_rows=None):
+    for f in files:
+        for df in _stream_sheet(f, SALES_SHEET_KEYS, SALES_ALIASES, fuzzy={"Client": ("client", "customer")},
+                                text_cols=SALES_ALIASES["Nom"] + ["Nom"], chunk_rows=chunk_rows):
+            yield _classify_sales(_normalize_sales(df))
+
+def stream_sales_cube(files, key=None, chunk_rows=None):
+    """SalesCube des classeurs/CSV `files`, construit sans jamais tenir toutes les lignes en mémoire."""
+    return SalesCube.from_chunks(_sales_chunks(files, chunk_rows), key)
+
+def _att_chunks(files, chunk_rows=None):
+    for f in files:
+        for df in _stream_sheet(f, ATT_SHEET_KEYS, ATT_ALIASES, chunk_rows=chunk_rows):
+            yield _normalize_attendance(df)
+
+def stream_slot_index(files, key=None, chunk_rows=None):
+    """SlotIndex des présences `files`, construit sans jamais tenir toutes les lignes en mémoire."""
+    return SlotIndex.from_chunks(_att_chunks(files, chunk_rows), key)
+
+def streamed(kind):
+    """Agrégats de `kind` lus en streaming : SalesCube ("sales") ou SlotIndex ("attendance"), partagés par
+    toutes les sessions et reconstruits quand un fichier source change (taille/mtime)."""
+    sig = _source_sig(kind)
+    with _STREAMED_LOCKS[kind]:
+        cur = _STREAMED.get(kind)
+        if cur is not None and cur[0] == sig:
+            return cur[1]
+        files = [f for f, size, _ in sig if size is not None]
+        if not files:
+            raise FileNotFoundError(f"Aucun fichier source pour {kind}")
+        version = f"{kind}-stream-{hashlib.sha1(repr(sig).encode()).hexdigest()[:12]}-{_schema_tag()}"
+        if kind == "sales":
+            obj = stream_sales_cube(files, ("sales_cube", version))
+        else:
+            obj = stream_slot_index(files, ("slot_index", version))
+        _STREAMED[kind] = (sig, obj)
+    if cur is not None:
+        forget_version(cur[1].key[1])
+    return obj
+
+# ---------- CLIENT JOURNEY ----------
+FUNNEL = ("Découverte", "Packs", "Abonnement 4×50’")
+_NAT = np.iinfo(np.int64).min  # NaT vu en int64
+
+class ClientJourney:
+    """Parcours par client, calculé en un passage vectorisé sur les visites (Date, Groupe, client) du cube.
+    mask        : bits des Groupes achetés (bit i = groups[i]), ventes non datées comprises
+    first, last : 1er / dernier jour d'achat client × Groupe (int64 ns, _NAT si jamais ou non daté)
+    """
+    def __init__(self, groups, clients, mask, first, last):
+        self.groups = groups
+        self.clients = clients  # codes clients du cube, une ligne par client
+        self.mask = mask
+        self.first = first
+        self.last = last
+
+    @classmethod
+    @traced
+    def from_visits(cls, visits, groups=None):
+        groups = list(groups or service_groups())
+        clients, row = np.unique(visits["client"].values, return_inverse=True)
+        col = pd.Categorical(visits["Groupe"], categories=groups).codes.astype(np.int64)
+        day = visits["Date"].values.astype("datetime64[ns]").view(np.int64)
+        ok = col >= 0
+        row, col, day = row[ok], col[ok], day[ok]
+        mask = np.zeros(len(clients), dtype=np.uint32)
+        np.bitwise_or.at(mask, row, (np.uint32(1) << col.astype(np.uint32)))
+        dated = day != _NAT
+        cell = row[dated] * len(groups) + col[dated]
+        first = np.full(len(clients) * len(groups), np.iinfo(np.int64).max)
+        last = np.full(len(clients) * len(groups), _NAT)
+        np.minimum.at(first, cell, day[dated])
+        np.maximum.at(last, cell, day[dated])
+        first[first == np.iinfo(np.int64).max] = _NAT
+        shape = (len(clients), len(groups))
+        return cls(groups, clients, mask, first.reshape(shape), last.reshape(shape))
+
+    def __len__(self):
+        return len(self.clients)
+
+    def bits(self, *groupes):
+        return np.uint32(sum(1 << self.groups.index(g) for g in set(groupes) if g in self.groups))
+
+    def has(self, *groupes):
+        """Booléens par client : au moins un achat dans l'un des `groupes` (False si aucun n'existe)."""
+        return (self.mask & self.bits(*groupes)) != 0
+
+    def _dates(self, which, groupes, reduce):
+        idx = [self.groups.index(g) for g in groupes if g in self.groups]
+        if not idx:
+            return np.full(len(self), _NAT)
+        a = which[:, idx]
+        if reduce is np.minimum:  # _NAT (le plus petit int64) ne doit pas gagner un min
+            a = np.where(a == _NAT, np.iinfo(np.int64).max, a)
+            out = a.min(axis=1)
+            return np.where(out == np.iinfo(np.int64).max, _NAT, out)
+        return a.max(axis=1)
+
+    def converted(self, src, dst, ordered=False):
+        """Clients de `src` ayant aussi acheté `dst` (un Groupe ou un tuple de Groupes).
+        ordered=True : achat `dst` le jour même ou après le 1er achat `src` (dates au jour près)."""
+        dst = (dst,) if isinstance(dst, str) else tuple(dst)
+        ok = self.has(src) & self.has(*dst)
+        if ordered:
+            start = self._dates(self.first, (src,), np.minimum)
+            ok &= (start != _NAT) & (self._dates(self.last, dst, np.maximum) >= start)
+        return ok
+
+    def funnel(self, steps=FUNNEL, ordered=False):
+        """Effectifs du funnel : 1re étape, puis clients de la 1re étape convertis vers chaque suivante."""
+        head = self.has(steps[0])
+        if ordered:  # une Découverte non datée ne peut pas précéder un achat
+            head &= self._dates(self.first, steps[:1], np.minimum) != _NAT
+        return [int(head.sum())] + [int(self.converted(steps[0], s, ordered).sum()) for s in steps[1:]]
+
+    def transitions(self):
+        """Passages d'un Groupe au suivant dans l'ordre des 1ers achats datés → Series (de, vers) → clients."""
+        n_g = len(self.groups)
+        key = np.where(self.first == _NAT, np.iinfo(np.int64).max, self.first)
+        order = np.argsort(key, axis=1, kind="stable")
+        present = np.take_along_axis(key, order, axis=1) != np.iinfo(np.int64).max
+        valid = present[:, 1:]
+        pair = order[:, :-1][valid] * n_g + order[:, 1:][valid]
+        counts = np.bincount(pair, minlength=n_g * n_g)
+        nz = np.nonzero(counts)[0]
+        idx = pd.MultiIndex.from_arrays([[self.groups[i] for i in nz // n_g], [self.groups[i] for i in nz % n_g]],
+                                        names=["de", "vers"])
+        return pd.Series(counts[nz], index=idx, name="clients").sort_values(ascending=False, kind="stable")
+
+    def table(self):
+        """Table client × (1er achat par Groupe, masque) — pour inspection/export."""
+        t = pd.DataFrame(self.first.view("datetime64[ns]"), columns=self.groups,
+                         index=pd.Index(self.clients, name="client"))
+        t["mask"] = self.mask
+        return t
+
+# ---------- COHORTS ----------
+COHORT_HORIZONS = (7, 30, 60)
+
+@traced
+def cohort_retention(df, grain="W", horizons=COHORT_HORIZONS, value="Montant total"):
+    """Cohortes d'acquisition (semaine "W" ou mois "M" du 1er achat/visite daté), une ligne par cohorte :
+    clients, ret+h = part revenue entre J+1 et J+h, rev+h = `value` cumulé de J0 à J+h par client.
+    Cellule NaN si la cohorte n'est pas entièrement observable à +h (d'où le triangle).
+    Mémorisé par version de dataset."""
+    key = _frame_key(df)
+    key = None if key is None else ("cohorts", grain, tuple(horizons), value) + key
+    return _memo(key, lambda: _cohorts(df, grain, tuple(horizons), value))
+
+def _cohorts(df, grain, horizons, value):
+    if not {"Client", "Date"} <= set(df.columns):
+        return pd.DataFrame()
+    x = df.dropna(subset=["Client", "Date"])
+    if x.empty:
+        return pd.DataFrame()
+    client, _ = pd.factorize(x["Client"])
+    day = x["Date"].values.astype("datetime64[D]").astype(np.int64)  # jours depuis 1970
+    first = np.full(client.max() + 1, np.iinfo(np.int64).max)
+    np.minimum.at(first, client, day)
+    age = day - first[client]
+    period = pd.PeriodIndex(first.astype("datetime64[D]"), freq="W" if grain == "W" else "M")
+    cohort, labels = pd.factorize(period, sort=True)
+    size = np.bincount(cohort, minlength=len(labels))
+    complete_until = day.max() - labels.end_time.normalize().values.astype("datetime64[D]").astype(np.int64)
+    out = pd.DataFrame({"clients": size}, index=pd.Index(labels.start_time, name="cohorte"))
+    row_cohort = cohort[client]
+    money = x[value].fillna(0).values.astype(float) if value in x.columns else None
+    for h in horizons:
+        back = np.zeros(len(first), dtype=bool)
+        back[client[(age >= 1) & (age <= h)]] = True
+        ok = complete_until >= h
+        out[f"ret+{h}"] = np.where(ok, np.bincount(cohort, weights=back, minlength=len(labels)) / size, np.nan)
+        if money is not None:
+            rev = np.bincount(row_cohort, weights=np.where(age <= h, money, 0.0), minlength=len(labels))
+            out[f"rev+{h}"] = np.where(ok, rev / size, np.nan)
+    return out
+
+# ---------- SUBSCRIPTIONS / MRR ----------
+# Chaque achat "Abonnement 4×50’" = un mois d'abonnement : MRR d'un client sur un mois = montant
+# des abonnements achetés ce mois-là. Bridge et périodes sont mémorisés par version de dataset ; d'une version
+# à l'autre, le ledger garde un point de reprise par mois, indexé par l'empreinte cumulée des mois ≤ m :
+# seuls les mois après le dernier point de reprise encore valide (en pratique le mois en cours) sont recalculés.
+SUBSCRIPTION_GROUP = "Abonnement 4×50’"
+LEDGER_SIZE = 600  # points de reprise mémorisés (toutes versions de données confondues)
+_LEDGER = OrderedDict()  # (mois, 1er mois, empreinte cumulée) → (lignes du bridge jusqu'au mois, MRR du mois, clients vus)
+_LEDGER_LOCK = threading.Lock()
+MRR_COLUMNS = ["MRR début", "Nouveau", "Réactivation", "Expansion", "Contraction", "Churn", "MRR fin",
+               "Abonnés", "Nouveaux abonnés", "Abonnés perdus"]
+
+def _subscription_months(df):
+    """MRR client × mois (Series indexée (mois, Client)), ventes d'abonnement datées avec client.
+    Mémorisé par version de dataset (partagé par mrr_bridge et subscription_periods)."""
+    if not {"Client", "Date"} <= set(df.columns):
+        return None
+    key = _frame_key(df)
+    return _memo(None if key is None else ("subscription_months",) + key, lambda: _subscriptions(df))
+
+def _subscriptions(df):
+    sub = df[df["Groupe"] == SUBSCRIPTION_GROUP].dropna(subset=["Client", "Date"])
+    month = sub["Date"].dt.to_period("M").rename("mois")
+    return sub.groupby([month, sub["Client"].astype(str)])["Montant total"].sum()
+
+def _bridge_row(prev, cur, seen):
+    # prev / cur : MRR par client (mois précédent / courant), seen : clients déjà abonnés avant le mois
+    both = prev.index.intersection(cur.index)
+    p, c = prev.reindex(both), cur.reindex(both)
+    fresh = cur.index.difference(prev.index)
+    back = fresh.isin(seen)
+    lost = prev.index.difference(cur.index)
+    return [prev.sum(), cur.reindex(fresh[~back]).sum(), cur.reindex(fresh[back]).sum(),
+            (c - p).clip(lower=0).sum(), (p - c).clip(lower=0).sum(), prev.reindex(lost).sum(), cur.sum(),
+            len(cur), int((~back).sum()), len(lost)]
+
+@traced
+def mrr_bridge(df):
+    """Bridge MRR mensuel des abonnements (colonnes MRR_COLUMNS, index = 1er jour du mois) :
+    MRR fin = MRR début + Nouveau + Réactivation + Expansion − Contraction − Churn.
+    DataFrame vide sans colonnes Client/Date ou sans abonnement. Mémorisé par version de dataset."""
+    key = _frame_key(df)
+    return _memo(None if key is None else ("mrr_bridge",) + key, lambda: _mrr_bridge(df))
+
+def _mrr_bridge(df):
+    months = _subscription_months(df)
+    if months is None or months.empty:
+        return pd.DataFrame(columns=MRR_COLUMNS)
+    month_of = months.index.get_level_values(0)
+    periods = pd.period_range(month_of.min(), month_of.max(), freq="M")
+    # empreinte des mois ≤ m : somme (mod 2⁶⁴) des hash des lignes (mois, client, MRR), cumulée mois par mois
+    acc = np.zeros(len(periods), dtype=np.uint64)
+    np.add.at(acc, periods.get_indexer(month_of), pd.util.hash_pandas_object(months, index=True).values)
+    marks = [(str(m), str(periods[0]), int(d)) for m, d in zip(periods, np.cumsum(acc, dtype=np.uint64))]
+    empty = pd.Series(dtype=float)
+    start, rows, prev, seen = 0, [], empty, pd.Index([])
+    with _LEDGER_LOCK:  # dernier point de reprise dont tous les mois antérieurs sont inchangés
+        for i in range(len(periods) - 1, -1, -1):
+            if marks[i] in _LEDGER:
+                _LEDGER.move_to_end(marks[i])
+                done, prev, seen = _LEDGER[marks[i]]
+                start, rows = i + 1, list(done)
+                break
+    todo = months[month_of >= periods[start]] if start < len(periods) else months.iloc[:0]
+    by_month = {m: g.droplevel(0) for m, g in todo.groupby(level=0)}
+    for i in range(start, len(periods)):  # une itération par mois recalculé, vectorisée sur ses clients
+        cur = by_month.get(periods[i], empty)
+        rows.append(_bridge_row(prev, cur, seen))
+        prev, seen = cur, seen.union(cur.index)
+        with _LEDGER_LOCK:
+            _LEDGER[marks[i]] = (tuple(rows), prev, seen)
+            while len(_LEDGER) > LEDGER_SIZE:
+                _LEDGER.popitem(last=False)
+    out = pd.DataFrame(rows, index=pd.Index(periods.start_time, name="mois"), columns=MRR_COLUMNS)
+    return out.astype({c: float if i < 7 else int for i, c in enumerate(MRR_COLUMNS)})
+
+def subscription_periods(df):
+    """Périodes d'abonnement continues par client (mois consécutifs avec achat) :
+    Client, début, fin (mois), mois, MRR moyen. Mémorisé par version de dataset."""
+    key = _frame_key(df)
+    return _memo(None if key is None else ("subscription_periods",) + key, lambda: _subscription_periods(df))
+
+def _subscription_periods(df):
+    months = _subscription_months(df)
+    if months is None or months.empty:
+        return pd.DataFrame(columns=["Client", "début", "fin", "mois", "MRR moyen"])
+    t = months.reset_index().sort_values(["Client", "mois"], kind="stable")
+    ordinal = t["mois"].astype("int64")
+    cut = (t["Client"] != t["Client"].shift()) | (ordinal.diff() != 1)
+    t["période"] = cut.cumsum()
+    g = t.groupby("période")
+    out = pd.DataFrame({"Client": g["Client"].first(), "début": g["mois"].first().dt.start_time,
+                        "fin": g["mois"].last().dt.start_time, "mois": g.size(),
+                        "MRR moyen": g["Montant total"].mean()})
+    return out.reset_index(drop=True)
+
+# ---------- CLIENT FACTS ----------
+# Identité client commune ventes ↔ présences (exports par visite) : noms/IDs normalisés (casse, accents,
+# espaces, "123.0" → "123") sur les seules valeurs distinctes, puis clés entières partagées. La table de faits
+# par client est calculée une fois par couple de versions ; les vues (packs, inactifs) n'en sont que des filtres.
+INACTIVE_DAYS = 30
+PACK_GROUP = "Packs"
+
+def _norm_clients(s):
+    """(codes par ligne, clés normalisées des valeurs distinctes, noms affichables) ; code -1 = client manquant.
+    Entités HTML des exports décodées d'abord ("Aubr&#233;e" → "Aubrée"), puis accents, casse et espaces."""
+    import html, unicodedata
+    cat = s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category")
+    raw = pd.Index([html.unescape(x) for x in cat.cat.categories.astype(str)], dtype=object)
+    norm = [" ".join(unicodedata.normalize("NFKD", x).encode("ascii", "ignore").decode().casefold().split())
+            for x in raw]
+    norm = pd.Index(norm).str.replace(r"^(\d+)\.0+$", r"\1", regex=True)
+    return cat.cat.codes.to_numpy(), norm, raw
+
+def _pack_sizes(noms):
+    """Séances par unité de pack, lues dans le nom ("Pack 10 séances" → 10) ; NaN si aucun nombre."""
+    cats = noms.cat.categories if isinstance(noms.dtype, pd.CategoricalDtype) else pd.Index(noms.unique())
+    size = pd.Series(cats.astype(str), index=cats).str.extract(r"(\d+)", expand=False).astype(float)
+    return noms.map(size).astype(float).to_numpy()
+
+class ClientIdentity:
+    """Clés entières communes : sales_ids / att_ids (par ligne, -1 sans client), names (affichage)."""
+    def __init__(self, sales, att=None):
+        parts, sources = [], []
+        for df in (sales, att):
+            if df is not None and "Client" in df.columns:
+                parts.append(_norm_clients(df["Client"])); sources.append(df)
+            else:
+                parts.append(None)
+        keys = pd.Index([]).append([p[1] for p in parts if p is not None])
+        ids, uniques = pd.factorize(keys)
+        self.size = len(uniques)
+        self.names = np.empty(self.size, dtype=object)
+        ids_by, pos = [], 0
+        for p in parts:
+            if p is None:
+                ids_by.append(None)
+                continue
+            codes, norm, raw = p
+            local = ids[pos:pos + len(norm)]; pos += len(norm)
+            empty = pd.isna(self.names[local])
+            self.names[local[empty]] = raw[empty]  # nom affiché : 1re source où le client apparaît
+            ids_by.append(np.where(codes >= 0, local[np.maximum(codes, 0)] if len(local) else -1, -1))
+        self.sales_ids, self.att_ids = ids_by
+
+def client_facts(sales, att=None):
+    """Table de faits par client (index = clé entière), mémorisée par versions des deux datasets :
+    quantités par Groupe, CA, 1er/dernier achat, séances de packs achetées (≈, d'après le nom),
+    séances suivies, dernière visite, créneau préféré (HeureHM le plus fréquent)."""
+    ks = _frame_key(sales)
+    ka = None if att is None else _frame_key(att)
+    key = None if ks is None or (att is not None and ka is None) else ("client_facts", ks, ka)
+    return _memo(key, lambda: _client_facts(sales, att))
+
+@traced
+def _client_facts(sales, att):
+    ident = ClientIdentity(sales, att)
+    n = ident.size
+    out = pd.DataFrame({"Client": ident.names}, index=pd.RangeIndex(n, name="client"))
+    if n == 0:
+        return out
+    sid = ident.sales_ids
+    if sid is not None:
+        ok = sid >= 0
+        groups = service_groups()
+        g = pd.Categorical(sales["Groupe"].astype(str), categories=groups).codes
+        qty = sales["Quantité"].to_numpy(dtype="float64", na_value=0.0)
+        cell = np.bincount(sid[ok] * len(groups) + g[ok], weights=qty[ok], minlength=n * len(groups))
+        for i, grp in enumerate(groups):
+            out[grp] = cell.reshape(n, len(groups))[:, i]
+        out["CA"] = np.bincount(sid[ok], weights=sales["Montant total"].to_numpy(dtype="float64", na_value=0.0)[ok],
+                                minlength=n)
+        packs = ok & (sales["Groupe"].astype(str).to_numpy() == PACK_GROUP)
+        sizes = _pack_sizes(sales["Nom"])[packs] * qty[packs]
+        out["séances pack"] = np.bincount(sid[packs], weights=np.nan_to_num(sizes), minlength=n)
+        if "Date" in sales.columns:
+            d = sales.loc[ok, "Date"].groupby(sid[ok]).agg(["min", "max"])
+            out["1er achat"], out["dernier achat"] = d["min"], d["max"]
+    aid = ident.att_ids
+    if aid is not None:
+        ok = aid >= 0
+        w = att["Nombre total de sessions"].to_numpy(dtype="float64", na_value=1.0) \
+            if "Nombre total de sessions" in att.columns else np.ones(len(att))  # sinon : 1 ligne = 1 visite
+        out["séances suivies"] = np.bincount(aid[ok], weights=w[ok], minlength=n)
+        if "Date" in att.columns:
+            out["dernière visite"] = att.loc[ok, "Date"].groupby(aid[ok]).max()
+        if "HeureHM" in att.columns:
+            hm = att["HeureHM"].astype("category")
+            codes, s = hm.cat.codes.to_numpy(), len(hm.cat.categories)
+            ok2 = ok & (codes >= 0)
+            by_slot = np.bincount(aid[ok2] * s + codes[ok2], minlength=n * s).reshape(n, s)
+            best = by_slot.argmax(axis=1)
+            out["créneau préféré"] = np.where(by_slot.max(axis=1) > 0, np.asarray(hm.cat.categories.astype(str))[best], None)
+    return out
+
+def pack_utilisation(facts):
+    """Acheteurs de packs : séances achetées (≈) vs suivies ; None sans présences par client."""
+    if "séances suivies" not in facts.columns or PACK_GROUP not in facts.columns:
+        return None
+    t = facts[facts[PACK_GROUP] > 0]
+    cols = ["Client", PACK_GROUP, "séances pack", "séances suivies"] + \
+           [c for c in ("dernière visite", "créneau préféré") if c in t.columns]
+    t = t[cols].rename(columns={PACK_GROUP: "packs achetés"})
+    t.insert(4, "utilisation", (t["séances suivies"] / t["séances pack"].where(t["séances pack"] > 0)).round(2))
+    return t.sort_values("utilisation", kind="stable", na_position="last").reset_index(drop=True)
+
+def inactive_clients(facts, days=INACTIVE_DAYS):
+    """Clients sans achat ni visite depuis `days` jours (référence : dernière date des données)."""
+    last = facts[[c for c in ("dernier achat", "dernière visite") if c in facts.columns]].max(axis=1)
+    if last.dropna().empty:
+        return facts.iloc[0:0]
+    idle = (last.max() - last).dt.days
+    t = facts.assign(**{"dernière activité": last, "jours inactif": idle})[idle > days]
+    cols = ["Client", "dernière activité", "jours inactif"] + [c for c in ("CA", "créneau préféré") if c in t.columns]
+    return t[cols].sort_values(["CA" if "CA" in cols else "jours inactif"], ascending=False, kind="stable").reset_index(drop=True)
+
+# ---------- SQL ENGINE ----------
+# Moteur analytique embarqué pour les questions ad hoc (page Explorer) : DuckDB si installé, sinon sqlite3 de
+# la bibliothèque standard. Tables "ventes" et "presences" chargées une fois par version de dataset ; résultats
+# mémorisés par (texte SQL, paramètres, versions des tables). Colonnes Jour / Semaine (lundi de fin, comme
+# W-MON) / Mois ajoutées en texte ISO : les mêmes requêtes tournent sur les deux moteurs.
+SQL_ENGINE = os.environ.get("FLEXLAB_SQL_ENGINE", "auto")  # "auto", "duckdb" ou "sqlite"
+SQL_CACHE_SIZE = 64
+SQL_MAX_ROWS = 10_000  # lignes affichées par l'Explorer (le CSV exporté est complet)
+SQL_TABLES = {"ventes": "sales", "presences": "attendance"}
+_SQL = {}  # "engine", "con", "versions" {table: version}, "schema" {table: [(colonne, type)]}
+_SQL_LOCK = threading.RLock()
+_SQL_CACHE = OrderedDict()
+# La barrière de sécurité est la connexion : DuckDB sans accès externe (ni fichiers, ni réseau, ni extensions :
+# read_csv / read_text / read_parquet / COPY / ATTACH échouent) et chaque requête dans une transaction annulée,
+# sqlite avec un authorizer qui ne permet que la lecture pendant les requêtes de l'Explorer (cf. tests/test_sql.py).
+# Ce filtre, appliqué hors littéraux et commentaires, ne fait que refuser tôt, avec un message clair, ce qui
+# modifierait les tables en mémoire.
+_SQL_WRITES = re.compile(r"\b(insert|update|delete|drop|create|alter|attach|detach|copy|pragma|install|load|export|import|set)\b", re.I)
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?(?:\*/|$)", re.S)
+
+# requêtes prêtes à l'emploi ; $date_min / $date_max : bornes incluses "AAAA-MM-JJ" ou NULL
+_SQL_WINDOW = "($date_min IS NULL OR Jour >= $date_min) AND ($date_max IS NULL OR Jour <= $date_max)"
+SQL_QUERIES = {
+    "KPIs ventes (kpi_row)": f"""SELECT SUM("Montant total") AS ca_total,
+       SUM("Quantité") AS seances,
+       COUNT(DISTINCT Client) AS clients_uniques,
+       SUM("Montant total") / NULLIF(COUNT(DISTINCT Client), 0) AS arpu
+FROM ventes
+WHERE {_SQL_WINDOW}""",
+    "Ventes par semaine et par Groupe (cube.weekly)": f"""SELECT Semaine, Groupe,
+       SUM("Quantité") AS qty,
+       SUM("Montant total") AS rev,
+       COUNT(DISTINCT Client) AS clients
+FROM ventes
+WHERE Semaine IS NOT NULL AND {_SQL_WINDOW}
+GROUP BY Semaine, Groupe
+ORDER BY Semaine, Groupe""",
+    "CA par service et par mois": f"""SELECT Mois, Nom,
+       SUM("Montant total") AS ca,
+       SUM("Quantité") AS quantite
+FROM ventes
+WHERE Mois IS NOT NULL AND {_SQL_WINDOW}
+GROUP BY Mois, Nom
+ORDER BY Mois, ca DESC""",
+    "Créneaux en hausse (4 dernières semaines vs 4 précédentes)": f"""WITH w AS (
+    SELECT Semaine, HeureHM, SUM("Nombre total de sessions") AS sessions
+    FROM presences
+    WHERE Semaine IS NOT NULL AND {_SQL_WINDOW}
+    GROUP BY Semaine, HeureHM
+), r AS (
+    SELECT w.*, DENSE_RANK() OVER (ORDER BY Semaine DESC) AS rang FROM w
+)
+SELECT HeureHM,
+       SUM(CASE WHEN rang <= 4 THEN sessions ELSE 0 END) AS recentes,
+       SUM(CASE WHEN rang BETWEEN 5 AND 8 THEN sessions ELSE 0 END) AS precedentes,
+       SUM(CASE WHEN rang <= 4 THEN sessions WHEN rang <= 8 THEN -sessions ELSE 0 END) AS hausse
+FROM r
+GROUP BY HeureHM
+ORDER BY hausse DESC""",
+}
+# colonnes dont chaque requête a besoin : Jour / Semaine / Mois n'existent que si la table a une colonne Date
+_SQL_NEEDS = {
+    "KPIs ventes (kpi_row)": {"ventes": ("Jour", "Montant total", "Quantité", "Client")},
+    "Ventes par semaine et par Groupe (cube.weekly)": {"ventes": ("Jour", "Semaine", "Groupe", "Montant total",
+                                                                  "Quantité", "Client")},
+    "CA par service et par mois": {"ventes": ("Jour", "Mois", "Nom", "Montant total", "Quantité")},
+    "Créneaux en hausse (4 dernières semaines vs 4 précédentes)": {"presences": ("Jour", "Semaine", "HeureHM",
+                                                                                  "Nombre total de sessions")},
+}
+
+def sql_engine():
+    """Nom du moteur SQL utilisé ("duckdb" ou "sqlite"), connexion ouverte au 1er appel."""
+    with _SQL_LOCK:
+        if not _SQL:
+            _SQL.update(engine=None, con=None, versions={}, schema={})
+            if SQL_ENGINE in ("auto", "duckdb"):
+                try:
+                    import duckdb
+                    _SQL.update(engine="duckdb", con=duckdb.connect(config={"enable_external_access": False}))
+                except ImportError:
+                    if SQL_ENGINE == "duckdb":
+                        _SQL.clear()
+                        raise
+            if _SQL["con"] is None:
+                import sqlite3
+                _SQL.update(engine="sqlite", con=sqlite3.connect(":memory:", check_same_thread=False))
+        return _SQL["engine"]
+
+def _sql_read_only(action, *_):
+    # authorizer sqlite des requêtes de l'Explorer : lecture seule, pas d'ATTACH ni de PRAGMA
+    import sqlite3
+    return sqlite3.SQLITE_OK if action in (sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION,
+                                           sqlite3.SQLITE_RECURSIVE) else sqlite3.SQLITE_DENY
+
+def _sql_code(text):
+    # texte SQL sans littéraux, identifiants entre guillemets ni commentaires : ";" et mots-clés hors chaînes
+    return _SQL_LITERALS.sub(" ", text)
+
+def _sql_frame(df, engine):
+    # colonnes de travail : dates en texte ISO pour des filtres/regroupements identiques sur les deux moteurs
+    out = df.copy(deep=False)
+    if "Date" in out.columns and pd.api.types.is_datetime64_any_dtype(out["Date"]):
+        day = out["Date"].dt.normalize()
+        out["Jour"] = day.dt.strftime("%Y-%m-%d")
+        out["Semaine"] = _week_end(day).dt.strftime("%Y-%m-%d")
+        out["Mois"] = day.dt.strftime("%Y-%m")
+        if engine == "sqlite":
+            out["Date"] = out["Date"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    if engine == "sqlite":
+        for c in out.columns:
+            if isinstance(out[c].dtype, pd.CategoricalDtype):
+                out[c] = out[c].astype(object).where(out[c].notna(), None)
+    return out
+
+@traced
+def _sql_load(table, df):
+    engine, con = _SQL["engine"], _SQL["con"]
+    frame = _sql_frame(df, engine)
+    if engine == "duckdb":
+        con.register("_flexlab_src", frame)
+        con.execute(f'CREATE OR REPLACE TABLE "{table}" AS SELECT * FROM _flexlab_src')  # stockage colonnaire natif
+        con.unregister("_flexlab_src")
+    else:
+        con.execute("PRAGMA query_only = OFF")
+        frame.to_sql(table, con, if_exists="replace", index=False, chunksize=50_000)
+        if "Jour" in frame.columns:
+            con.execute(f'CREATE INDEX "{table}_jour" ON "{table}" (Jour)')
+        con.execute("PRAGMA query_only = ON")  # l'Explorer ne peut rien modifier
+    _SQL["schema"][table] = [(c, str(t)) for c, t in frame.dtypes.items()]
+
+def _sql_sync():
+    """(Re)charge les tables dont le dataset a changé de version ; renvoie {table: version} des tables chargées."""
+    sql_engine()
+    with _SQL_LOCK:
+        for table, kind in SQL_TABLES.items():
+            try:
+                df = shared_frame(kind)
+            except Exception:
+                continue  # fichier absent : table indisponible, les autres restent interrogeables
+            version = df.attrs.get("version")
+            if _SQL["versions"].get(table) != version:
+                _sql_load(table, df)
+                _SQL["versions"][table] = version
+        return dict(_SQL["versions"])
+
+def sql_tables():
+    """Colonnes des tables chargées (table, colonne, type pandas)."""
+    _sql_sync()
+    return pd.DataFrame([(t, c, ty) for t, cols in _SQL["schema"].items() for c, ty in cols],
+                        columns=["table", "colonne", "type"])
+
+def sql_presets():
+    """{requête de SQL_QUERIES: colonnes absentes des tables chargées ("table.colonne")} ; liste vide → utilisable.
+    Présences sans Date → pas de Jour / Semaine : « Créneaux en hausse » est indisponible."""
+    _sql_sync()
+    cols = {t: {c for c, _ in schema} for t, schema in _SQL["schema"].items()}
+    return {name: [f"{t}.{c}" for t, need in _SQL_NEEDS.get(name, {}).items() for c in need if c not in cols.get(t, ())]
+            for name in SQL_QUERIES}
+
+@traced
+def sql_query(sql, params=None):
+    """Résultat d'une requête SELECT / WITH sur ventes / presences, paramètres nommés `$nom`.
+    Paramètres absents de `params` → NULL. Mémorisé par texte SQL, paramètres et versions des tables."""
+    text = sql.strip().rstrip(";").strip()
+    code = _sql_code(text).strip().rstrip(";")  # un ";" dans une chaîne ou un commentaire est permis
+    if not code.lower().startswith(("select", "with")) or ";" in code or _SQL_WRITES.search(code):
+        raise ValueError("Une seule requête SELECT / WITH, en lecture seule, est acceptée.")
+    params = params or {}
+    params = {k: v.isoformat() if hasattr(v, "isoformat") else v  # paramètre non fourni → NULL
+              for k in sorted(set(re.findall(r"\$(\w+)", code))) for v in [params.get(k)]}
+    versions = _sql_sync()
+    key = ("sql", text, tuple(sorted(params.items())), tuple(sorted(versions.items())))
+    with _SQL_LOCK:
+        if key in _SQL_CACHE:
+            _SQL_CACHE.move_to_end(key)
+            _count("sql", "hits")
+            return _SQL_CACHE[key]
+        _count("sql", "misses")
+        if _SQL["engine"] == "duckdb":
+            _SQL["con"].execute("BEGIN TRANSACTION")
+            try:
+                out = _SQL["con"].execute(text, params).df()
+            finally:
+                _SQL["con"].execute("ROLLBACK")  # une écriture passée entre les mailles du filtre est annulée
+        else:
+            _SQL["con"].set_authorizer(_sql_read_only)
+            try:
+                out = pd.read_sql_query(text, _SQL["con"], params=params)
+            finally:
+                _SQL["con"].set_authorizer(None)
+        _SQL_CACHE[key] = out
+        while len(_SQL_CACHE) > SQL_CACHE_SIZE:
+            _SQL_CACHE.popitem(last=False)
+    return out
+
+# ---------- FIGURE CACHE ----------
+# PNG rendus, clés = empreinte des données + fonction (code compris) + arguments + empreinte de utils.py :
+# les helpers de dessin (bar_labels, shade_closed_period…), GROUP_COLORS ou MAX_LABELS changent aussi le rendu,
+# et le niveau disque survit aux redémarrages.
+# Niveau mémoire LRU (FIG_CACHE_SIZE entrées) + niveau disque optionnel (FIG_CACHE_DIR, None pour désactiver).
+FIG_CACHE_SIZE = 64
+FIG_CACHE_DIR = os.path.join(CACHE_DIR, "figures")
+FIG_DISK_MAX = 512
+FIG_DPI = 200  # même rendu que st.pyplot (dpi=200, bbox_inches="tight")
+_FIGS = OrderedDict()
+_FIGS_LOCK = threading.Lock()
+_FIG_DEPS = OrderedDict()
+
+def _data_key(data):
+    """Empreinte des données d'un graphe : clé du cube, version du DataFrame, ou hash du contenu."""
+    if isinstance(data, (SalesCube, SlotIndex)):
+        return data.key
+    if isinstance(data, pd.DataFrame):
+        return _frame_key(data)
+    if isinstance(data, pd.Series):
+        return ("series", tuple(map(str, data.index)), int(pd.util.hash_pandas_object(data, index=True).sum()))
+    return None
+
+_RENDER_CODE = []
+
+def _render_code():
+    # empreinte du code de rendu, lue une fois par process
+    if not _RENDER_CODE:
+        with open(os.path.abspath(__file__), "rb") as f:
+            _RENDER_CODE.append(hashlib.sha1(f.read()).hexdigest()[:10])
+    return _RENDER_CODE[0]
+
+def _fig_key(fn, data, args, kwargs):
+    dk = _data_key(data)
+    if dk is None:
+        return None
+    code = getattr(fn, "__wrapped__", fn).__code__  # code de la fonction, pas celui du wrapper @traced
+    code_sig = hashlib.sha1(code.co_code + repr(code.co_consts).encode()).hexdigest()[:10]
+    raw = repr((fn.__name__, code_sig, _render_code(), dk, args, sorted(kwargs.items()), FIG_DPI))
+    key = hashlib.sha1(raw.encode()).hexdigest()
+    with _FIGS_LOCK:  # figure → données sources, pour forget_version
+        _FIG_DEPS[key] = dk
+        _FIG_DEPS.move_to_end(key)
+        while len(_FIG_DEPS) > 4 * FIG_CACHE_SIZE:
+            _FIG_DEPS.popitem(last=False)
+    return key
+
+@traced
+def _fig_to_png(fig):
+    import io
+    _, plt, _, _ = _mpl()
+    buf = io.BytesIO()
+    try:
+        fig.savefig(buf, format="png", dpi=FIG_DPI, bbox_inches="tight")
+    finally:
+        plt.close(fig)  # sinon pyplot garde chaque figure ouverte pour toute la durée du process
+    return buf.getvalue()
+
+@traced
+def render_png(fn, data, *args, **kwargs):
+    """Appelle `fn(data, *args, **kwargs)` et renvoie le PNG (bytes), depuis le cache si possible.
+    Si `fn` renvoie (fig, extra…), renvoie (png, extra…)."""
+    key = _fig_key(fn, data, args, kwargs)
+    hit = _fig_cached(key)
+    if hit is not None:
+        return hit
+    _count("figures", "misses")
+    out = _render_fig(fn, data, args, kwargs)
+    if key is not None:
+        _fig_disk_put(key, out)
+        _fig_mem_put(key, out)
+    return out
+
+def _render_fig(fn, data, args, kwargs):
+    # rendu effectif (hors cache) ; aussi exécuté tel quel dans les processus du pool de calcul
+    out = fn(data, *args, **kwargs)
+    return (_fig_to_png(out[0]),) + tuple(out[1:]) if isinstance(out, tuple) else _fig_to_png(out)
+
+def _fig_cached(key):
+    # PNG en cache (mémoire puis disque) ou None ; compte les hits
+    if key is None:
+        return None
+    with _FIGS_LOCK:
+        if key in _FIGS:
+            _FIGS.move_to_end(key)
+            _count("figures", "hits")
+            return _FIGS[key]
+    hit = _fig_disk_get(key)
+    if hit is not None:
+        _count("figures", "disk_hits")
+        return _fig_mem_put(key, hit)
+    return None
+
+def _fig_mem_put(key, out):
+    with _FIGS_LOCK:
+        _FIGS[key] = out
+        while len(_FIGS) > FIG_CACHE_SIZE:
+            _FIGS.popitem(last=False)
+    return out
+
+def _fig_disk_get(key):
+    if not FIG_CACHE_DIR:
+        return None
+    path = os.path.join(FIG_CACHE_DIR, key + ".png")
+    try:
+        with open(path, "rb") as f:
+            png = f.read()
+        os.utime(path)  # élagage du niveau disque par ancienneté d'accès
+        extras = None
+        if os.path.exists(path + ".json"):
+            with open(path + ".json", encoding="utf-8") as f:
+                extras = json.load(f)
+        return (png,) + tuple(extras) if extras is not None else png
+    except (OSError, ValueError):
+        return None
+
+def _fig_disk_put(key, out):
+    if not FIG_CACHE_DIR:
+        return
+    png, extras = (out[0], list(out[1:])) if isinstance(out, tuple) else (out, None)
+    try:
+        os.makedirs(FIG_CACHE_DIR, exist_ok=True)
+        path = os.path.join(FIG_CACHE_DIR, key + ".png")
+        if extras is not None:
+            with open(path + ".json", "w", encoding="utf-8") as f:
+                json.dump(extras, f)
+        with open(path + ".tmp", "wb") as f:
+            f.write(png)
+        os.replace(path + ".tmp", path)
+        files = [os.path.join(FIG_CACHE_DIR, n) for n in os.listdir(FIG_CACHE_DIR) if n.endswith(".png")]
+        if len(files) > FIG_DISK_MAX:
+            for old in sorted(files, key=os.path.getmtime)[:len(files) - FIG_DISK_MAX]:
+                for f in (old, old + ".json"):
+                    if os.path.exists(f):
+                        os.remove(f)
+    except (OSError, TypeError, ValueError):
+        pass  # niveau disque facultatif (FS en lecture seule, extras non sérialisables…)
+
+def _vega_spec(fn, data, args, kwargs, backend):
+    # spec Vega-Lite mémorisée si le backend la demande et que le graphe en a une, sinon None
+    if (backend or CHART_BACKEND) != "vega-lite" or fn.__name__ not in _VEGA_CHARTS:
+        return None
+    key = _fig_key(fn, data, args, kwargs)
+    return _memo(None if key is None else ("vega", key), lambda: _VEGA_CHARTS[fn.__name__](data, *args, **kwargs))
+
+def _show_png(target, out, full_width):
+    png, extras = (out[0], out[1:]) if isinstance(out, tuple) else (out, ())
+    target.image(png, use_column_width=full_width)
+    return extras[0] if len(extras) == 1 else extras
+
+@traced
+def show_chart(fn, data, *args, full_width=True, backend=None, **kwargs):
+    """Affiche `fn(data, …)` via le cache PNG (équivalent de st.pyplot) ; renvoie les extras éventuels.
+    Avec backend="vega-lite" (défaut : CHART_BACKEND), les graphes qui ont un équivalent Vega-Lite
+    sont rendus dans le navigateur à partir des seuls agrégats."""
+    import streamlit as st
+    spec = _vega_spec(fn, data, args, kwargs, backend)
+    if spec is not None:
+        st.vega_lite_chart(spec, use_container_width=full_width, theme=None)
+        return ()
+    return _show_png(st, render_png(fn, data, *args, **kwargs), full_width)
+
+# ---------- PARALLEL RENDERING ----------
+# Les graphes d'une page sont réservés dans l'ordre (st.empty), puis ceux absents du cache sont rendus en
+# parallèle dans worker_pool() (matplotlib tient le GIL) ; chaque emplacement est rempli dès que son PNG
+# arrive. Sans pool (1 CPU, FLEXLAB_WORKERS=1, pool cassé), rendu en série dans le même ordre.
+class ChartBatch:
+    """Graphes d'une page rendus en parallèle :
+
+        charts = ChartBatch(backend)
+        st.subheader(…); charts.add(stacked_bar_with_cumulative, cube, title=…, grain=grain)
+        …
+        charts.run()  # en fin de page : remplit les emplacements au fil des rendus
+
+    add() réserve l'emplacement à l'endroit courant de la page (colonnes comprises) et affiche tout de suite
+    les graphes déjà en cache ou rendus en Vega-Lite ; run() rend les autres."""
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.jobs = []  # (emplacement, fn, data, args, kwargs, full_width, clé de cache)
+
+    def add(self, fn, data, *args, full_width=True, **kwargs):
+        import streamlit as st
+        slot = st.empty()
+        spec = _vega_spec(fn, data, args, kwargs, self.backend)
+        if spec is not None:
+            slot.vega_lite_chart(spec, use_container_width=full_width, theme=None)
+            return
+        key = _fig_key(fn, data, args, kwargs)
+        hit = _fig_cached(key)
+        if hit is not None:
+            _show_png(slot, hit, full_width)
+            return
+        slot.caption("⏳ Rendu en cours…")
+        self.jobs.append((slot, fn, data, args, kwargs, full_width, key))
+
+    def _done(self, job, out):
+        slot, _, _, _, _, full_width, key = job
+        if key is not None:
+            _fig_disk_put(key, out)
+            _fig_mem_put(key, out)
+        _show_png(slot, out, full_width)
+
+    @traced
+    def run(self):
+        from concurrent.futures.process import BrokenProcessPool
+        jobs, self.jobs = self.jobs, []
+        _count("figures", "misses", len(jobs))
+        pool = worker_pool() if len(jobs) > 1 else None
+        done = set()
+        try:
+            if pool is not None:
+                futures = {pool.submit(_render_fig, *job[1:5]): job for job in jobs}  # fn, data, args, kwargs
+                for fut in pool.as_completed(futures):
+                    self._done(futures[fut], fut.result())
+                    done.add(id(futures[fut]))
+        except BrokenProcessPool:  # un processus est mort ou bloqué : le reste est rendu ici
+            pass
+        for job in jobs:
+            if id(job) not in done:
+                self._done(job, _render_fig(*job[1:5]))
+
 # ---------- METRICS & CHARTS ----------
-def kpi_row(df):
-    ca_total = float(df["Montant total"].sum())
-    qty_total = int(df["Quantité"].sum())
+@traced
+def kpi_row(data):
+    cube = sales_cube(data)
+    ca_total = float(cube.total("rev"))
+    qty_total = int(cube.total("qty"))
+    qty_by_group = cube.groupe_totals("qty")
     # approx clients uniques (if Client column exists, use it)
-    if "Client" in df.columns:
-        clients_uniques = df["Client"].nunique()
-        clients_help = "Basé sur la colonne Client."
+    if cube.has_client:
+        clients_uniques = cube.unique_clients()
+        clients_help = "Basé sur la colonne Client." + (" Estimation HyperLogLog (≈ ±2 %)." if cube.approx else "")
     else:
         # fallback approx: count unique buyers per day then sum unique names if any, else estimate by Découverte count
-        clients_uniques = int(df[df["Groupe"]=="Découverte"]["Quantité"].sum()) + int(df[df["Groupe"]!="Découverte"]["Quantité"].sum()*0.3)
+        disc_qty = qty_by_group.get("Découverte", 0)
+        clients_uniques = int(disc_qty) + int((qty_by_group.sum() - disc_qty)*0.3)
         clients_help = "Approximation (pas de colonne Client)."
 
     # weekly packs sold (latest full week)
-    weekly = df.groupby([pd.Grouper(key="Date", freq="W-MON"), "Groupe"]).agg(qty=("Quantité","sum"), rev=("Montant total","sum")).reset_index()
+    weekly = cube.weekly
     if weekly.empty:
         packs_week = 0
     else:
@@ -201,16 +2651,16 @@ def kpi_row(df):
         packs_week = int(weekly[(weekly["Date"]==last_week) & (weekly["Groupe"]=="Packs")]["qty"].sum())
 
     # conversion Découverte -> Pack (rough)
-    if "Client" in df.columns:
-        by_client = df.groupby("Client")["Groupe"].apply(set)
-        converted = sum(1 for s in by_client if ("Découverte" in s and ("Packs" in s or "Abonnement 4×50’" in s)))
-        tried = sum(1 for s in by_client if "Découverte" in s)
+    if cube.has_client:
+        j = cube.journey
+        converted = int(j.converted("Découverte", ("Packs", "Abonnement 4×50’")).sum())
+        tried = int(j.has("Découverte").sum())
         conv = converted/ tried if tried else 0.0
         conv_help = "Clients ayant fait Découverte puis Pack/Abonnement (toutes périodes)."
     else:
         # fallback: packs qty / discovery qty (not exact clients)
-        disc = df[df["Groupe"]=="Découverte"]["Quantité"].sum()
-        packs = df[df["Groupe"].isin(["Packs","Abonnement 4×50’"])]["Quantité"].sum()
+        disc = qty_by_group.get("Découverte", 0)
+        packs = qty_by_group.get("Packs", 0) + qty_by_group.get("Abonnement 4×50’", 0)
         conv = float(packs) / disc if disc else 0.0
         conv_help = "Approximation (pas de colonne Client)."
 
@@ -228,76 +2678,83 @@ def kpi_row(df):
         "arpu_fmt": f"{arpu:,.0f}".replace(",", " ")
     }
 
-def stacked_bar_with_cumulative(df, title):
-    _, plt, _, mplcyberpunk = _mpl()
-    plt.style.use("cyberpunk")
+@traced
+def stacked_bar_with_cumulative(data, title, grain="auto"):
+    _, plt, _, _ = _mpl()
+    cube = sales_cube(data)
+    grain = cube.grain(grain, finest="D")
+    _, unit, days = GRAINS[grain]
 
-    daily = df.groupby([pd.Grouper(key="Date", freq="D"), "Groupe"]).agg(
-        quantite=("Quantité","sum"), ventes=("Montant total","sum")).reset_index()
-    pivot = daily.pivot(index="Date", columns="Groupe", values="quantite").fillna(0)
+    pivot = cube.periods(grain).pivot(index="Date", columns="Groupe", values="qty").fillna(0).sort_index(axis=1)
 
     fig, ax1 = plt.subplots(figsize=(12,5))
     bottom = np.zeros(len(pivot.index))
-    palette = {"Découverte":"#6aa6ff","Packs":PRIMARY,"Abonnement 4×50’":"#0b4bcc","Unitaire (autres)":"#99bbff"}
+    palette = GROUP_COLORS
+    containers = []
     for lab in pivot.columns:
         vals = pivot[lab].values
-        bars = ax1.bar(pivot.index, vals, bottom=bottom, label=lab, color=palette.get(lab, "#6aa6ff"))
+        bars = ax1.bar(pivot.index, vals, width=0.8 * days, bottom=bottom, label=lab, color=palette.get(lab, "#6aa6ff"))
         bottom += vals
-        for b, v in zip(bars, vals):
-            if v >= 1:
-                ax1.text(b.get_x()+b.get_width()/2, b.get_y()+b.get_height()/2, f"{int(v)}",
-                         ha="center", va="center", fontsize=7, color="white")
-    ax1.set_ylabel("Quantité / jour")
+        containers.append((bars, np.where(vals >= 1, vals.astype(int).astype(str), "")))
+    for bars, labels in containers:  # après toutes les séries : les limites d'axe sont connues
+        bar_labels(ax1, bars, labels, fontsize=7, color="white")
+    ax1.set_ylabel(f"Quantité / {unit}")
 
     # cumulative revenue
-    rev = df.groupby(pd.Grouper(key="Date", freq="D"))["Montant total"].sum().reset_index()
-    rev["cumul"] = rev["Montant total"].cumsum()
+    rev = cube.period_totals("rev", grain).reset_index()
+    rev["cumul"] = rev["rev"].cumsum()
 
     ax2 = ax1.twinx()
     ax2.plot(rev["Date"], rev["cumul"], linewidth=2.2, marker="o", color="#ffffff")
     ax2.set_ylabel("CA cumulatif (€)")
 
     shade_closed_period(ax1)
-    mplcyberpunk.add_glow_effects(ax1); mplcyberpunk.add_glow_effects(ax2)
+    _glow(ax1, ax2)
     ax1.set_title(title)
     handles, labels = ax1.get_legend_handles_labels()
     dedup = dict(zip(labels, handles))
     ax1.legend(dedup.values(), dedup.keys(), loc="upper left")
-    fig.tight_layout()
+    _layout(fig)
     return fig
 
-def simple_line_growth(df, title):
-    _, plt, _, mplcyberpunk = _mpl()
-    plt.style.use("cyberpunk")
+@traced
+def simple_line_growth(data, title, grain="auto"):
+    _, plt, _, _ = _mpl()
+    cube = sales_cube(data)
+    grain = cube.grain(grain, finest="W")
 
-    weekly = df.groupby(pd.Grouper(key="Date", freq="W-MON"))["Montant total"].sum()
+    weekly = cube.period_totals("rev", grain)
     growth = weekly.pct_change().fillna(0)
 
     fig, ax = plt.subplots(figsize=(12,5))
-    ax.plot(weekly.index, weekly.values, marker="o", linewidth=2, label="CA hebdo (€)")
-    for x, y, g in zip(weekly.index, weekly.values, growth.values):
-        ax.text(x, y, f"{g:+.0%}", ha="center", va="bottom", fontsize=8, color="white")
-    shade_closed_period(ax)
-    mplcyberpunk.add_glow_effects(ax)
+    ax.plot(weekly.index, weekly.values, marker="o", linewidth=2, label=f"CA / {GRAINS[grain][1]} (€)")
+    shade_closed_period(ax)  # avant les étiquettes : la zone grisée peut élargir l'axe des x
+    point_labels(ax, weekly.index, weekly.values, [f"{g:+.0%}" for g in growth.values],
+                 fontsize=8, ha="center", va="bottom", color="white")
+    _glow(ax)
     ax.set_title(title); ax.set_ylabel("€"); ax.legend()
-    fig.tight_layout()
+    _layout(fig)
     return fig
 
-def weekly_packs_vs_clients(df, title):
-    _, plt, _, mplcyberpunk = _mpl(); plt.style.use("cyberpunk")
-    # clients uniques by week (true if Client exists)
-    if "Client" in df.columns:
-        cu = df.groupby([pd.Grouper(key="Date", freq="W-MON")])["Client"].nunique().rename("clients_uniques")
+@traced
+def weekly_packs_vs_clients(data, title, grain="auto"):
+    _, plt, _, _ = _mpl()
+    cube = sales_cube(data)
+    grain = cube.grain(grain, finest="W")
+    # clients uniques by period (true if Client exists)
+    if cube.has_client:
+        cu = cube.period_clients(grain).rename("clients_uniques")
     else:
         # fallback: Découverte count proxy
-        cu = df[df["Groupe"]=="Découverte"].groupby(pd.Grouper(key="Date", freq="W-MON"))["Quantité"].sum().rename("clients_uniques")
-    packs = df[df["Groupe"]=="Packs"].groupby(pd.Grouper(key="Date", freq="W-MON"))["Quantité"].sum().rename("packs").reindex(cu.index).fillna(0)
+        cu = cube.period_totals("qty", grain, groupe="Découverte").rename("clients_uniques")
+    packs = cube.period_totals("qty", grain, groupe="Packs").rename("packs").reindex(cu.index).fillna(0)
     conv = (packs / cu.replace(0, np.nan)).fillna(0)
 
     fig, ax1 = plt.subplots(figsize=(12,5))
-    width = 3
-    ax1.bar(cu.index - pd.Timedelta(days=1), cu.values, width=width, label="Clients uniques", color="#6aa6ff")
-    ax1.bar(packs.index + pd.Timedelta(days=1), packs.values, width=width, label="Packs vendus", color=PRIMARY, alpha=0.9)
+    step = GRAINS[grain][2] / 7  # barres de 3 j décalées de ±1 j à l'échelle hebdo
+    width = 3 * step
+    ax1.bar(cu.index - pd.Timedelta(days=step), cu.values, width=width, label="Clients uniques", color="#6aa6ff")
+    ax1.bar(packs.index + pd.Timedelta(days=step), packs.values, width=width, label="Packs vendus", color=PRIMARY, alpha=0.9)
     ax1.set_ylabel("Volumes")
 
     ax2 = ax1.twinx()
@@ -305,130 +2762,134 @@ def weekly_packs_vs_clients(df, title):
     ax2.set_ylabel("% conv (packs / clients uniques)")
 
     shade_closed_period(ax1)
-    mplcyberpunk.add_glow_effects(ax1); mplcyberpunk.add_glow_effects(ax2)
+    _glow(ax1, ax2)
     ax1.set_title(title)
     handles, labels = ax1.get_legend_handles_labels()
     dedup = dict(zip(labels, handles))
     ax1.legend(handles, labels, loc="upper left")
-    fig.tight_layout()
+    _layout(fig)
     return fig
 
-def arpu_line(df, title):
-    _, plt, _, mplcyberpunk = _mpl(); plt.style.use("cyberpunk")
+@traced
+def arpu_line(data, title, grain="auto"):
+    _, plt, _, _ = _mpl()
+    cube = sales_cube(data)
+    grain = cube.grain(grain, finest="W")
 
-    if "Client" in df.columns:
-        weekly_clients = df.groupby(pd.Grouper(key="Date", freq="W-MON"))["Client"].nunique()
+    if cube.has_client:
+        weekly_clients = cube.period_clients(grain)
     else:
-        weekly_clients = df.groupby(pd.Grouper(key="Date", freq="W-MON"))["Quantité"].sum().apply(lambda x: max(1, int(x*0.4)))
-    weekly_rev = df.groupby(pd.Grouper(key="Date", freq="W-MON"))["Montant total"].sum()
+        weekly_clients = cube.period_totals("qty", grain).apply(lambda x: max(1, int(x*0.4)))
+    weekly_rev = cube.period_totals("rev", grain)
     arpu = (weekly_rev / weekly_clients.replace(0, np.nan)).fillna(0)
 
     fig, ax = plt.subplots(figsize=(12,5))
     ax.plot(arpu.index, arpu.values, marker="o", linewidth=2, label="ARPU (€)")
     shade_closed_period(ax)
-    mplcyberpunk.add_glow_effects(ax)
+    _glow(ax)
     ax.set_title(title); ax.set_ylabel("€ / client"); ax.legend()
-    fig.tight_layout()
+    _layout(fig)
     return fig
 
-def share_area(df, title):
-    _, plt, _, mplcyberpunk = _mpl(); plt.style.use("cyberpunk")
-    weekly = df.groupby([pd.Grouper(key="Date", freq="W-MON"), "Groupe"])["Montant total"].sum().reset_index()
-    pivot = weekly.pivot(index="Date", columns="Groupe", values="Montant total").fillna(0)
+@traced
+def share_area(data, title, grain="auto"):
+    _, plt, _, _ = _mpl()
+    cube = sales_cube(data)
+    weekly = cube.periods(cube.grain(grain, finest="W"))
+    pivot = weekly.pivot(index="Date", columns="Groupe", values="rev").fillna(0).sort_index(axis=1)
     totals = pivot.sum(axis=1).replace(0, np.nan)
     share = (pivot.T / totals).T.fillna(0)
 
     fig, ax = plt.subplots(figsize=(12,5))
-    colors = {"Découverte":"#6aa6ff","Packs":PRIMARY,"Abonnement 4×50’":"#0b4bcc","Unitaire (autres)":"#99bbff"}
+    colors = GROUP_COLORS
     ax.stackplot(share.index, [share[c] for c in share.columns], labels=share.columns, colors=[colors.get(c) for c in share.columns])
     shade_closed_period(ax)
-    mplcyberpunk.add_glow_effects(ax)
+    _glow(ax)
     ax.set_ylim(0,1); ax.set_yticks([0,0.25,0.5,0.75,1.0]); ax.set_yticklabels(["0%","25%","50%","75%","100%"])
     ax.set_title(title); ax.legend(loc="upper left")
-    fig.tight_layout()
+    _layout(fig)
     return fig
 
+@traced
 def pie_split(series, title):
-    _, plt, _, _ = _mpl(); plt.style.use("cyberpunk")
+    _, plt, _, _ = _mpl()
     fig, ax = plt.subplots(figsize=(6,6))
     wedges, texts, autotexts = ax.pie(series.values, labels=series.index, autopct="%1.1f%%")
     for t in autotexts: t.set_color("white")
-    ax.set_title(title); fig.tight_layout()
+    ax.set_title(title); _layout(fig)
     return fig
 
 # ----- Attendance charts -----
+@traced
 def heatmap_attendance(att_df, metric="Nombre total de sessions"):
-    _, plt, LinearSegmentedColormap, _ = _mpl(); plt.style.use("cyberpunk")
+    _, plt, LinearSegmentedColormap, _ = _mpl()
     fig, ax = plt.subplots(figsize=(12,6))
-    if "JourFR" not in att_df.columns:
+    idx = slot_index(att_df)
+    if not idx.dated:
         ax.text(0.5,0.5,"Aucune colonne 'Date du service' → impossible de construire Jour × Heure.",
                 ha="center", va="center"); return fig
-    if "HeureHM" not in att_df.columns:
+    if not idx.labels:
         ax.text(0.5,0.5,"Aucune colonne heure (Heure du service / Time).", ha="center", va="center"); return fig
-    if metric not in att_df.columns:
+    if metric not in idx.cells:
         ax.text(0.5,0.5,f"Colonne '{metric}' manquante.", ha="center", va="center"); return fig
 
-    P = att_df.pivot_table(index="JourFR", columns="HeureHM", values=metric, aggfunc="sum").fillna(0)
-    try:
-        cols_sorted = sorted(P.columns, key=lambda x: (int(x.split(':')[0]), int(x.split(':')[1])) if ':' in x else x)
-        P = P[cols_sorted]
-    except Exception:
-        pass
-
+    P = idx.day_slot(metric)  # créneaux déjà dans l'ordre chronologique
     im = ax.imshow(P.values, aspect="auto", cmap=_brand_cmap())
     ax.set_yticks(range(P.shape[0])); ax.set_yticklabels(P.index)
     ax.set_xticks(range(P.shape[1])); ax.set_xticklabels(P.columns, rotation=45, ha="right", fontsize=8)
-    for i in range(P.shape[0]):
-        for j in range(P.shape[1]):
-            val = int(P.values[i,j])
-            if val>0:
-                ax.text(j, i, str(val), ha="center", va="center", color="black", fontsize=7)
+    vals = P.values.astype(int)
+    cell_labels(ax, np.where(vals > 0, vals.astype(str), ""), fontsize=7, color="black")
     ax.set_title(f"Heatmap présences — {metric}")
     fig.colorbar(im, ax=ax, shrink=0.8, label=metric)
-    fig.tight_layout()
+    _layout(fig)
     return fig
 
+@traced
 def top_slots(att_df, metric="Nombre total de sessions", topn=5):
-    _, plt, _, mplcyberpunk = _mpl(); plt.style.use("cyberpunk")
+    _, plt, _, _ = _mpl()
     fig, ax = plt.subplots(figsize=(10,5))
-    if "HeureHM" not in att_df.columns or metric not in att_df.columns:
+    idx = slot_index(att_df)
+    if not idx.labels or metric not in idx.undated:
         ax.text(0.5,0.5,"Colonnes manquantes (HeureHM/metric).", ha="center", va="center"); return fig
-    s = att_df.groupby("HeureHM")[metric].sum().sort_values(ascending=False).head(topn)[::-1]
+    s = idx.slot_totals(metric).sort_values(ascending=False, kind="stable").head(topn)[::-1]
     bars = ax.barh(s.index, s.values, color=PRIMARY)
-    for b, v in zip(bars, s.values):
-        ax.text(v+0.2, b.get_y()+b.get_height()/2, f"{int(v)}", va="center", color="white")
-    mplcyberpunk.add_glow_effects(ax)
+    bar_labels(ax, bars, [f"{int(v)}" for v in s.values], fontsize=10, label_type="edge", padding=3, color="white")
+    _glow(ax)
     ax.set_title(f"Top {topn} créneaux — {metric}")
-    ax.set_xlabel(metric); fig.tight_layout()
+    ax.set_xlabel(metric); _layout(fig)
     return fig
 
+@traced
 def weekly_unique_clients(att_df, title="Clients uniques par semaine"):
-    _, plt, _, mplcyberpunk = _mpl(); plt.style.use("cyberpunk")
+    _, plt, _, _ = _mpl()
     fig, ax = plt.subplots(figsize=(12,5))
-    if "Date" not in att_df.columns or "Clients uniques" not in att_df.columns:
+    idx = slot_index(att_df)
+    if not idx.dated or "Clients uniques" not in idx.cells:
         ax.text(0.5,0.5,"Colonnes 'Date' ou 'Clients uniques' absentes.", ha="center", va="center"); return fig
-    s = att_df.groupby(pd.Grouper(key="Date", freq="W-MON"))["Clients uniques"].sum()
+    s = idx.weekly("Clients uniques")
     ax.plot(s.index, s.values, marker="o", linewidth=2, label="Clients uniques / semaine")
-    mplcyberpunk.add_glow_effects(ax)
-    ax.set_title(title); ax.legend(); fig.tight_layout()
+    _glow(ax)
+    ax.set_title(title); ax.legend(); _layout(fig)
     return fig
 
+@traced
 def occupancy_gauge(att_df, capacity=0):
-    _, plt, _, mplcyberpunk = _mpl(); plt.style.use("cyberpunk")
+    _, plt, _, _ = _mpl()
     fig, ax = plt.subplots(figsize=(5,5))
 
-    if capacity <= 0 or "Nombre total de sessions" not in att_df.columns:
+    idx = slot_index(att_df)
+    if capacity <= 0 or "Nombre total de sessions" not in idx.undated:
         ax.text(0.5,0.5,"Capacité non fournie ou colonne sessions manquante.", ha="center", va="center")
         return fig
 
-    # Si Date dispo → vraie moyenne journalière
-    if "Date" in att_df.columns and pd.api.types.is_datetime64_any_dtype(att_df["Date"]):
-        daily = att_df.groupby(pd.Grouper(key="Date", freq="D"))["Nombre total de sessions"].sum()
+    # Si Date dispo → vraie moyenne journalière (jours calendaires de la fenêtre, jours vides compris)
+    if idx.dated:
+        daily = idx.daily("Nombre total de sessions")
         days = max(1, daily.shape[0])
-        avg_sessions = float(daily.mean())
+        avg_sessions = float(daily.mean()) if len(daily) else 0.0
     else:
         # fallback : moyenne approximative sur l’ensemble du fichier
-        total = float(att_df["Nombre total de sessions"].sum())
+        total = float(idx.slot_totals("Nombre total de sessions").sum())
         # impossible d'inférer le nombre de jours → on affiche un ratio "par jour (approx.)"
         days = 1
         avg_sessions = total  # on suppose que le fichier correspond à ~1 journée si on n'a pas de dates
@@ -440,59 +2901,51 @@ def occupancy_gauge(att_df, capacity=0):
     for p in ax.patches:
         ax.text(min(99, p.get_width()+1), p.get_y()+p.get_height()/2, f"{occ*100:.0f}%", va="center", color="white")
 
-    mplcyberpunk.add_glow_effects(ax); fig.tight_layout()
+    _glow(ax); _layout(fig)
     return fig
 
+@traced
 def weekly_unique_clients_bar(att_df, title="Clients uniques par semaine (bar)"):
-    _, plt, _, mplcyberpunk = _mpl(); plt.style.use("cyberpunk")
+    _, plt, _, _ = _mpl()
     fig, ax = plt.subplots(figsize=(12,5))
 
-    if "Date" not in att_df.columns or "Clients uniques" not in att_df.columns:
+    idx = slot_index(att_df)  # Date déjà convertie par _normalize_attendance
+    if not idx.dated or "Clients uniques" not in idx.cells:
         ax.text(0.5,0.5,"Colonnes 'Date' ou 'Clients uniques' absentes.", ha="center", va="center")
         return fig
 
-    if not pd.api.types.is_datetime64_any_dtype(att_df["Date"]):
-        # tente un parse si ce n'est pas un datetime
-        try:
-            att_df = att_df.copy()
-            att_df["Date"] = pd.to_datetime(att_df["Date"], errors="coerce")
-        except Exception:
-            ax.text(0.5,0.5,"Colonne 'Date' non convertible.", ha="center", va="center")
-            return fig
-
-    s = att_df.groupby(pd.Grouper(key="Date", freq="W-MON"))["Clients uniques"].sum()
+    s = idx.weekly("Clients uniques")
     bars = ax.bar(s.index, s.values, width=5, color=PRIMARY, label="Clients uniques")
-    for b, v in zip(bars, s.values):
-        ax.text(b.get_x()+b.get_width()/2, v+0.5, f"{int(v)}", ha="center", va="bottom", fontsize=8, color="white")
+    bar_labels(ax, bars, [f"{int(v)}" for v in s.values], fontsize=8, label_type="edge", padding=2, color="white")
 
-    mplcyberpunk.add_glow_effects(ax)
-    ax.set_title(title); ax.legend(); fig.tight_layout()
+    _glow(ax)
+    ax.set_title(title); ax.legend(); _layout(fig)
     return fig
 
 # ----- Growth page helpers -----
-def funnel_conversion(df):
-    _, plt, _, mplcyberpunk = _mpl(); plt.style.use("cyberpunk")
+@traced
+def funnel_conversion(data, ordered=False):
+    _, plt, _, _ = _mpl()
     fig, ax = plt.subplots(figsize=(6,5))
-    if "Client" in df.columns:
-        g = df.groupby("Client")["Groupe"].apply(set)
-        step1 = sum(1 for s in g if "Découverte" in s)
-        step2 = sum(1 for s in g if ("Découverte" in s and "Packs" in s))
-        step3 = sum(1 for s in g if ("Découverte" in s and "Abonnement 4×50’" in s))
-        bars = [step1, step2, step3]
+    cube = sales_cube(data)
+    if cube.has_client:
+        bars = cube.journey.funnel(ordered=ordered)
         labels = ["Découverte", "→ Pack", "→ Abonnement"]
         colors = ["#6aa6ff", PRIMARY, "#0b4bcc"]
         ax.barh(range(3)[::-1], bars[::-1], color=colors[::-1])
         for i, v in enumerate(bars[::-1]):
             ax.text(v+1, i, f"{v}", va="center", color="white")
         ax.set_yticks(range(3)); ax.set_yticklabels(labels[::-1]); ax.set_title("Funnel clients")
-        mplcyberpunk.add_glow_effects(ax); fig.tight_layout()
-        notes = "Funnel réel (basé sur la colonne Client)."
+        _glow(ax); _layout(fig)
+        notes = "Funnel réel (basé sur la colonne Client)." + \
+                (" Achats Pack/Abonnement postérieurs à la 1re Découverte uniquement." if ordered else "")
         return fig, notes
     else:
         # proxy funnel using quantities
-        step1 = int(df[df["Groupe"]=="Découverte"]["Quantité"].sum())
-        step2 = int(df[df["Groupe"]=="Packs"]["Quantité"].sum())
-        step3 = int(df[df["Groupe"]=="Abonnement 4×50’"]["Quantité"].sum())
+        qty = cube.groupe_totals("qty")
+        step1 = int(qty.get("Découverte", 0))
+        step2 = int(qty.get("Packs", 0))
+        step3 = int(qty.get("Abonnement 4×50’", 0))
         bars = [step1, step2, step3]
         labels = ["Découverte (qty)", "→ Pack (qty)", "→ Abonnement (qty)"]
         colors = ["#6aa6ff", PRIMARY, "#0b4bcc"]
@@ -500,23 +2953,73 @@ def funnel_conversion(df):
         for i, v in enumerate(bars[::-1]):
             ax.text(v+1, i, f"{v}", va="center", color="white")
         ax.set_yticks(range(3)); ax.set_yticklabels(labels[::-1]); ax.set_title("Funnel (approx.)")
-        mplcyberpunk.add_glow_effects(ax); fig.tight_layout()
+        _glow(ax); _layout(fig)
         return fig, "Approximation (pas de colonne Client)."
 
-def churn_block(df):
-    # Simple definition: clients qui ont fait Découverte mais jamais Pack/Abonnement
-    if "Client" in df.columns:
-        g = df.groupby("Client")["Groupe"].apply(set)
-        tried = sum(1 for s in g if "Découverte" in s)
-        churned = sum(1 for s in g if ("Découverte" in s and not ("Packs" in s or "Abonnement 4×50’" in s)))
+@traced
+def churn_block(data, ordered=False):
+    # Simple definition: clients qui ont fait Découverte mais jamais Pack/Abonnement (ensuite, si ordered)
+    cube = sales_cube(data)
+    if cube.has_client:
+        j = cube.journey
+        tried = int(j.has("Découverte").sum())
+        churned = tried - int(j.converted("Découverte", ("Packs", "Abonnement 4×50’"), ordered).sum())
         churn = churned / tried if tried else 0.0
         return f"<div style='font-size:16px'>Churn Découverte ≈ <b>{churn:.0%}</b> — clients Découverte n'ayant pas poursuivi.</div>"
     else:
         return "<div style='font-size:16px'>Impossible de calculer un churn client sans colonne <b>Client</b>.</div>"
 
-def cohort_note():
-    return ("Pour une vraie analyse de cohortes (W0/W4/W8), il faut un ID client stable et la date de 1ère visite. "
-            "Ensuite on suit la part revenant à +7/+30/+60 jours. Prêt à l’implémenter si tes exports le permettent.")
+@traced
+def mrr_bridge_chart(df, title="MRR abonnements — bridge mensuel"):
+    _, plt, _, _ = _mpl()
+    b = mrr_bridge(df)
+    fig, ax = plt.subplots(figsize=(12,5))
+    if b.empty:
+        ax.text(0.5, 0.5, "Aucun abonnement daté avec colonne Client → MRR indisponible.", ha="center", va="center")
+        return fig
+    x, width = b.index, 20
+    up = np.zeros(len(b)); down = np.zeros(len(b))
+    for col, color, sign in [("Nouveau", PRIMARY, 1), ("Réactivation", "#6aa6ff", 1), ("Expansion", "#99bbff", 1),
+                             ("Churn", "#ff4d6d", -1), ("Contraction", "#ff9bb0", -1)]:
+        vals = b[col].values
+        base = up if sign > 0 else down
+        ax.bar(x, sign * vals, width=width, bottom=sign * base, label=col, color=color)
+        base += vals
+    ax.plot(x, b["MRR fin"].values, marker="o", linewidth=2.2, color="#ffffff", label="MRR fin de mois")
+    shade_closed_period(ax)
+    handles, labels = ax.get_legend_handles_labels()  # avant le glow, qui duplique les lignes
+    _glow(ax)
+    ax.axhline(0, color="#9bb7ff", linewidth=0.8)
+    ax.set_ylabel("€ / mois"); ax.set_title(title); ax.legend(handles, labels, loc="upper left", fontsize=8)
+    _layout(fig)
+    return fig
+
+@traced
+def cohort_heatmap(df, grain="W", metric="ret", title=None):
+    _, plt, _, _ = _mpl()
+    c = cohort_retention(df, grain)
+    cols = [f"{metric}+{h}" for h in COHORT_HORIZONS if f"{metric}+{h}" in c.columns]
+    rows = len(c)
+    fig, ax = plt.subplots(figsize=(8, min(3 + 0.28 * rows, 14)))
+    if not cols or not rows:
+        ax.text(0.5, 0.5, "Colonnes Client et Date nécessaires pour les cohortes.", ha="center", va="center")
+        return fig
+    M = c[cols].values
+    im = ax.imshow(np.ma.masked_invalid(M), aspect="auto", cmap=_brand_cmap(),
+                   vmin=0, vmax=1 if metric == "ret" else None)
+    ax.grid(False)
+    ax.set_xticks(range(len(cols))); ax.set_xticklabels([f"+{h} j" for h in COHORT_HORIZONS[:len(cols)]])
+    step = max(1, -(-rows // 40))  # au plus ~40 libellés de cohorte
+    fmt = "%Y-%m-%d" if grain == "W" else "%Y-%m"
+    ax.set_yticks(range(0, rows, step))
+    ax.set_yticklabels([f"{d:{fmt}} (n={n})" for d, n in zip(c.index[::step], c["clients"].values[::step])], fontsize=8)
+    texts = [["" if np.isnan(v) else (f"{v:.0%}" if metric == "ret" else f"{v:,.0f}".replace(",", " ")) for v in r] for r in M]
+    cell_labels(ax, texts, fontsize=8, color="black")
+    unit = "Part revenue" if metric == "ret" else "CA cumulé / client (€)"
+    ax.set_title(title or f"Cohortes par {GRAINS[grain][1]} — {unit}")
+    fig.colorbar(im, ax=ax, shrink=0.8, label=unit)
+    _layout(fig)
+    return fig
 
 def warn_if_missing_cols(df):
     import streamlit as st
@@ -525,3 +3028,184 @@ def warn_if_missing_cols(df):
         msgs.append("✅ Ajoute la colonne **Client** dans `sales.xlsx` pour des KPIs de rétention précis (conversion, churn, ARPU réels).")
     if msgs:
         st.warning("<br>".join(msgs), icon="⚠️")
+
+# ---------- VEGA-LITE BACKEND ----------
+# Équivalents navigateur des graphes principaux : seuls les agrégats (cube, pivot) sont envoyés.
+_VL_CONFIG = {
+    "background": "#0b1224",
+    "view": {"stroke": None},
+    "title": {"color": "#e6edff", "fontSize": 15, "anchor": "start"},
+    "axis": {"labelColor": "#e6edff", "titleColor": "#9bb7ff", "gridColor": "#1f2b4d", "domainColor": "#2a3a66"},
+    "legend": {"labelColor": "#e6edff", "titleColor": "#9bb7ff", "orient": "top-left"},
+}
+
+def _vl_dates(s):
+    return s.dt.strftime("%Y-%m-%d")
+
+def _vl_color(groups):
+    groups = [g for g in service_groups() if g in set(groups)]
+    return {"field": "Groupe", "type": "nominal", "title": None,
+            "scale": {"domain": groups, "range": [GROUP_COLORS.get(g, "#6aa6ff") for g in groups]}}
+
+def _vl_closed_period(dates, start="2025-08-02", end="2025-08-24", label="Studio fermé (été)"):
+    # même zone grisée que shade_closed_period, seulement si elle recoupe la période affichée
+    if len(dates) == 0 or pd.Timestamp(end) < dates.min() or pd.Timestamp(start) > dates.max():
+        return []
+    return [{"data": {"values": [{"start": start, "end": end, "label": label}]},
+             "mark": {"type": "rect", "color": "grey", "opacity": 0.25},
+             "encoding": {"x": {"field": "start", "type": "temporal", "scale": {"type": "utc"}},
+                          "x2": {"field": "end"}, "tooltip": [{"field": "label", "title": "Période"}]}}]
+
+def _vl_spec(title, layers, height=360, **extra):
+    return dict({"$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+                 "title": title, "height": height, "layer": layers, "config": _VL_CONFIG}, **extra)
+
+@traced
+def vl_stacked_bar_with_cumulative(data, title, grain="auto"):
+    cube = sales_cube(data)
+    grain = cube.grain(grain, finest="D")
+    daily = cube.periods(grain)
+    if daily.empty:
+        return None
+    x = {"field": "Date", "type": "temporal", "timeUnit": "utcyearmonthdate", "title": None, "scale": {"type": "utc"}}
+    bars = pd.DataFrame({"Date": _vl_dates(daily["Date"]), "Groupe": daily["Groupe"].astype(str),
+                         "qty": daily["qty"], "rev": daily["rev"].round(2)})
+    rev = cube.period_totals("rev", grain).cumsum()
+    cum = pd.DataFrame({"Date": _vl_dates(rev.index.to_series()), "cumul": rev.values.round(2)})
+    return _vl_spec(title, _vl_closed_period(daily["Date"]) + [
+        {"data": {"values": bars.to_dict("records")}, "mark": {"type": "bar"},
+         "encoding": {"x": x, "y": {"field": "qty", "type": "quantitative", "stack": "zero", "title": f"Quantité / {GRAINS[grain][1]}"},
+                      "color": _vl_color(bars["Groupe"]),
+                      "tooltip": [{"field": "Date", "type": "temporal", "timeUnit": "utcyearmonthdate"},
+                                  {"field": "Groupe"}, {"field": "qty", "title": "Quantité"},
+                                  {"field": "rev", "title": "CA (€)", "format": ",.0f"}]}},
+        {"data": {"values": cum.to_dict("records")}, "mark": {"type": "line", "color": "#ffffff", "strokeWidth": 2.2, "point": True},
+         "encoding": {"x": x, "y": {"field": "cumul", "type": "quantitative", "title": "CA cumulatif (€)"},
+                      "tooltip": [{"field": "Date", "type": "temporal", "timeUnit": "utcyearmonthdate"},
+                                  {"field": "cumul", "title": "CA cumulatif (€)", "format": ",.0f"}]}},
+    ], resolve={"scale": {"y": "independent"}})
+
+@traced
+def vl_simple_line_growth(data, title, grain="auto"):
+    cube = sales_cube(data)
+    grain = cube.grain(grain, finest="W")
+    weekly = cube.period_totals("rev", grain)
+    if weekly.empty:
+        return None
+    rows = pd.DataFrame({"Date": _vl_dates(weekly.index.to_series()), "rev": weekly.values.round(2),
+                         "growth": weekly.pct_change().fillna(0).replace([np.inf, -np.inf], 0).values})
+    x = {"field": "Date", "type": "temporal", "title": None, "scale": {"type": "utc"}}
+    y = {"field": "rev", "type": "quantitative", "title": "€"}
+    return _vl_spec(title, _vl_closed_period(weekly.index) + [
+        {"data": {"values": rows.to_dict("records")}, "layer": [
+            {"mark": {"type": "line", "color": PRIMARY, "strokeWidth": 2, "point": True},
+             "encoding": {"x": x, "y": y, "tooltip": [{"field": "Date", "type": "temporal"},
+                                                      {"field": "rev", "title": f"CA / {GRAINS[grain][1]} (€)", "format": ",.0f"},
+                                                      {"field": "growth", "title": "Variation", "format": "+.0%"}]}},
+            {"mark": {"type": "text", "dy": -8, "color": "white", "fontSize": 9},
+             "encoding": {"x": x, "y": y, "text": {"field": "growth", "format": "+.0%"}}},
+        ]},
+    ])
+
+@traced
+def vl_share_area(data, title, grain="auto"):
+    cube = sales_cube(data)
+    weekly = cube.periods(cube.grain(grain, finest="W"))
+    if weekly.empty:
+        return None
+    rows = pd.DataFrame({"Date": _vl_dates(weekly["Date"]), "Groupe": weekly["Groupe"].astype(str),
+                         "rev": weekly["rev"].round(2)})
+    return _vl_spec(title, _vl_closed_period(weekly["Date"]) + [
+        {"data": {"values": rows.to_dict("records")}, "mark": {"type": "area"},
+         "encoding": {"x": {"field": "Date", "type": "temporal", "title": None, "scale": {"type": "utc"}},
+                      "y": {"field": "rev", "type": "quantitative", "stack": "normalize", "title": None,
+                            "axis": {"format": "%"}},
+                      "color": _vl_color(rows["Groupe"]),
+                      "tooltip": [{"field": "Date", "type": "temporal"}, {"field": "Groupe"},
+                                  {"field": "rev", "title": "CA (€)", "format": ",.0f"}]}},
+    ])
+
+@traced
+def vl_heatmap_attendance(att_df, metric="Nombre total de sessions"):
+    idx = slot_index(att_df)
+    if not idx.dated or not idx.labels or metric not in idx.cells:
+        return None  # même cas d'erreur que la version matplotlib → repli sur le PNG explicatif
+    P = idx.day_slot(metric)
+    rows = P.rename_axis(index="JourFR", columns="HeureHM").stack().rename("v").reset_index()
+    enc = {"x": {"field": "HeureHM", "type": "ordinal", "sort": list(P.columns), "title": None},
+           "y": {"field": "JourFR", "type": "ordinal", "sort": JOURS_FR, "title": None}}
+    return _vl_spec(f"Heatmap présences — {metric}", [
+        {"mark": {"type": "rect"},
+         "encoding": dict(enc, color={"field": "v", "type": "quantitative", "title": metric,
+                                      "scale": {"range": ["#d9ebff", PRIMARY]}},
+                          tooltip=[{"field": "JourFR", "title": "Jour"}, {"field": "HeureHM", "title": "Heure"},
+                                   {"field": "v", "title": metric}])},
+        {"mark": {"type": "text", "color": "black", "fontSize": 9},
+         "transform": [{"filter": "datum.v > 0"}],
+         "encoding": dict(enc, text={"field": "v", "type": "quantitative"})},
+    ], height=320, data={"values": rows.to_dict("records")})
+
+_VEGA_CHARTS = {
+    "stacked_bar_with_cumulative": vl_stacked_bar_with_cumulative,
+    "simple_line_growth": vl_simple_line_growth,
+    "share_area": vl_share_area,
+    "heatmap_attendance": vl_heatmap_attendance,
+}
+
+# ---------- STARTUP ----------
+# Préchauffage en tâche de fond, une fois par process : matplotlib + style, stores
+# ventes/présences, cube, parcours client, cohortes, MRR. Lancé en fin de 1re page servie (pas de
+# concurrence avec son rendu) : les pages suivantes trouvent les caches chauds.
+# Chaque étape est indépendante : un fichier absent n'empêche pas de préchauffer le reste.
+PREWARM = os.environ.get("FLEXLAB_PREWARM", "1") != "0"
+PREWARM_DELAY = 1.0  # s : laisse Streamlit finir d'envoyer la page avant de prendre le CPU
+_PREWARM = {}
+_PREWARM_LOCK = threading.Lock()
+
+def _prewarm_steps():
+    if INGEST_MODE == "stream":
+        return [
+            ("matplotlib", _mpl),
+            ("ventes", lambda: kpi_row(streamed("sales"))),
+            ("présences", lambda: streamed("attendance")),
+        ]
+    sales = {}
+    def load_sales():
+        sales["df"] = shared_frame("sales")
+    def aggregates():
+        cube = sales_window(sales["df"])
+        kpi_row(cube); cube.periods(cube.grain("auto", finest="W"))
+    return [
+        ("matplotlib", _mpl),
+        ("ventes", load_sales),
+        ("agrégats ventes", aggregates),
+        ("présences", lambda: shared_frame("attendance")),
+        ("cohortes", lambda: cohort_retention(sales["df"], "W")),
+        ("mrr", lambda: mrr_bridge(sales["df"])),
+    ]
+
+def _prewarm_run(delay=0):
+    time.sleep(delay)
+    t0 = time.perf_counter()
+    for name, step in _prewarm_steps():
+        t = time.perf_counter()
+        try:
+            step()
+            _PREWARM["steps"][name] = round(time.perf_counter() - t, 3)
+        except Exception as e:  # données absentes/illisibles : la page affichera l'erreur elle-même
+            _PREWARM["steps"][name] = f"{type(e).__name__}: {e}"
+    _PREWARM["total_s"] = round(time.perf_counter() - t0, 3)
+
+def prewarm(background=True):
+    """Lance le préchauffage des caches (idempotent) ; renvoie l'état {steps, total_s} en cours ou final."""
+    if not PREWARM:
+        return _PREWARM
+    with _PREWARM_LOCK:
+        if "steps" in _PREWARM:
+            return _PREWARM
+        _PREWARM["steps"] = {}
+    if background:
+        threading.Thread(target=_prewarm_run, args=(PREWARM_DELAY,), name="flexlab-prewarm", daemon=True).start()
+    else:
+        _prewarm_run()
+    return _PREWARM
@@ -0,0 +1,36 @@
+# workers.py
+"""Processus de calcul de FlexLab (parsing des classeurs, rendu des graphes), lancés par utils.WorkerPool.
+
+Point d'entrée dédié : un processus spawn de multiprocessing réimporterait le __main__ du parent, c'est-à-dire
+la page Streamlit en cours. Ici le __main__ est ce fichier, et il ne fait que servir les tâches :
+
+    stdin  ← pickle (fn, args)            fn : fonction de niveau module (utils._parse_source, utils._render_fig…)
+    stdout → pickle (True, résultat) | (False, exception)
+
+La sortie standard d'origine est réservée aux résultats ; un print() égaré part sur stderr.
+"""
+import os, pickle, sys
+
+def serve(inp, out):
+    import utils
+    utils._mpl()  # matplotlib + style chargés une fois, avant la 1re tâche
+    while True:
+        try:
+            fn, args = pickle.load(inp)
+        except EOFError:  # le processus Streamlit s'est arrêté (ou a fermé le pool)
+            return
+        try:
+            res = (True, fn(*args))
+        except Exception as e:
+            res = (False, e)
+        try:
+            payload = pickle.dumps(res, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:  # résultat ou exception non sérialisable
+            payload = pickle.dumps((False, RuntimeError(repr(e))), pickle.HIGHEST_PROTOCOL)
+        out.write(payload)
+        out.flush()
+
+if __name__ == "__main__":
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    serve(sys.stdin.buffer, out)